@@ -12,6 +12,7 @@ def staging():
     env.push_branch = 'staging'
     env.push_remote = 'origin'
     env.reload_cmd = 'supervisorctl restart {0}'.format(projectname)
+    env.workers_cmd = 'supervisorctl restart {0}-workers:*'.format(projectname)
     env.db_name = projectname
     env.db_username = projectname
     env.after_deploy_url = 'http://%s.brueck.io' % projectname
@@ -29,6 +30,7 @@ def production():
     env.db_username = projectname
     env.after_deploy_url = 'http://isimip.org'
     env.reload_cmd = 'sudo supervisorctl restart isimip'
+    env.workers_cmd = 'sudo supervisorctl restart isimip-workers:*'
 
 
 
@@ -36,6 +38,11 @@ def reload_webserver():
     run("%(reload_cmd)s" % env)
 
 
+def restart_workers():
+    # the workers of config/deploy/supervisor.conf run the code of the last deploy
+    run("%(workers_cmd)s" % env)
+
+
 def migrate():
     with prefix("source %(virtualenv_path)s/bin/activate" % env):
         run("%(path)s/manage.py migrate --settings=config.settings.production" % env)
@@ -54,6 +61,7 @@ def deploy():
 
     migrate()
     reload_webserver()
+    restart_workers()
     ping()
 
 
@@ -62,6 +70,7 @@ def soft_deploy():
         run("git pull %(push_remote)s %(push_branch)s" % env)
 
     reload_webserver()
+    restart_workers()
     ping()
 
 
@@ -72,6 +81,7 @@ def pip():
             run("pip install -Ur requirements/production.txt")
 
     reload_webserver()
+    restart_workers()
 
 #
 # def init_fixtures():
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from isi_mip.api.models import prune_changes
+
+
+class Command(BaseCommand):
+    help = 'Deletes the changes of the change feed older than CHANGE_FEED_RETENTION days'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--watch', action='store_true', help='Keep running and delete the old changes regularly')
+        parser.add_argument('--sleep', type=float, default=60 * 60, help='Seconds between the deletions')
+
+    def handle(self, *args, **options):
+        while True:
+            count = prune_changes()
+            self.stdout.write('%d changes deleted' % count)
+            if not options['watch']:
+                break
+            time.sleep(options['sleep'])
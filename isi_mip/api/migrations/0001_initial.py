@@ -0,0 +1,25 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Change',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(choices=[('baseimpactmodel', 'base impact model'), ('impactmodel', 'impact model'), ('impactmodelinformation', 'impact model information'), ('outputdata', 'Output data'), ('inputdata', 'input data')], max_length=50)),
+                ('object_id', models.IntegerField()),
+                ('action', models.CharField(choices=[('save', 'Save'), ('delete', 'Delete')], max_length=10)),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ('id',),
+            },
+        ),
+    ]
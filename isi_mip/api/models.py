@@ -1,3 +1,125 @@
+from datetime import timedelta
+
+from django.conf import settings
 from django.db import models
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.utils import timezone
+
+from isi_mip.climatemodels.models import (BaseImpactModel, ImpactModel,
+                                          ImpactModelInformation, InputData,
+                                          OutputData)
+
+# The models of the change feed, by their model names. The owners of the m2m
+# relations are recorded as changed when the relation changes.
+#
+# The ids of the changes are not in the order of the commits, a transaction
+# running for a long time inserts changes with ids below the ones committed
+# meanwhile. So every change records its transaction and the feed is ordered by
+# the transactions, returning only the changes of finished transactions. The
+# transaction ids and snapshots are read with the functions of PostgreSQL 13.
+#
+# Changes older than CHANGE_FEED_RETENTION days are deleted by the prune_changes
+# worker, clients have to follow the feed more often than that.
+CHANGE_MODELS = {model._meta.model_name: model for model in (BaseImpactModel, ImpactModel, ImpactModelInformation, OutputData, InputData)}
+CHANGE_M2M_MODELS = {
+    BaseImpactModel.region.through: BaseImpactModel,
+    ImpactModel.other_references.through: ImpactModel,
+    OutputData.drivers.through: OutputData,
+    OutputData.scenarios.through: OutputData,
+    InputData.scenario.through: InputData,
+    InputData.variables.through: InputData,
+    InputData.simulation_round.through: InputData,
+}
+
+
+class CurrentTransactionId(models.Func):
+    template = 'pg_current_xact_id()::text::bigint'
+    output_field = models.BigIntegerField()
+
+
+class SnapshotXmin(models.Func):
+    # the transactions below the xmin of the snapshot are finished
+    template = 'pg_snapshot_xmin(pg_current_snapshot())::text::bigint'
+    output_field = models.BigIntegerField()
+
+
+class ChangeQuerySet(models.QuerySet):
+    def finished(self):
+        return self.filter(transaction_id__lt=SnapshotXmin())
+
+
+class Change(models.Model):
+    """
+    A saved or deleted object of the change feed. The transaction ids and the ids
+    are the cursor of the feed.
+    """
+    SAVE = 'save'
+    DELETE = 'delete'
+    ACTION_CHOICES = (
+        (SAVE, 'Save'),
+        (DELETE, 'Delete'),
+    )
+
+    model = models.CharField(max_length=50, choices=[(name, model._meta.verbose_name) for name, model in CHANGE_MODELS.items()])
+    object_id = models.IntegerField()
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    transaction_id = models.BigIntegerField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    objects = ChangeQuerySet.as_manager()
+
+    class Meta:
+        ordering = ('transaction_id', 'id')
+        indexes = [models.Index(fields=['transaction_id', 'id'])]
+
+    def __str__(self):
+        return "%s %s %s" % (self.get_action_display(), self.model, self.object_id)
+
+
+def get_change_retention():
+    return timedelta(days=getattr(settings, 'CHANGE_FEED_RETENTION', 90))
+
+
+def prune_changes():
+    """
+    Deletes the changes of finished transactions older than the retention.
+    Returns the number of deleted changes.
+    """
+    changes = Change.objects.finished().filter(created__lt=timezone.now() - get_change_retention())
+    return changes.delete()[0]
+
+
+def record_changes(model, object_ids, action=Change.SAVE):
+    Change.objects.bulk_create([
+        Change(model=model._meta.model_name, object_id=object_id, action=action, transaction_id=CurrentTransactionId())
+        for object_id in object_ids
+    ])
+
+
+def object_saved(sender, instance, **kwargs):
+    record_changes(sender, [instance.pk])
+
+
+def object_deleted(sender, instance, **kwargs):
+    record_changes(sender, [instance.pk], Change.DELETE)
+
+
+def object_m2m_changed(sender, instance, action, pk_set, **kwargs):
+    model = CHANGE_M2M_MODELS[sender]
+    if isinstance(instance, model):
+        if action.startswith('post_'):
+            record_changes(model, [instance.pk])
+    elif action == 'pre_clear':
+        # the reverse clear has no pk_set, the owners are looked up before they are removed
+        owner_field = next(field for field in sender._meta.fields if field.related_model is model)
+        related_field = next(field for field in sender._meta.fields if field.is_relation and field.related_model is not model)
+        record_changes(model, set(sender.objects.filter(**{related_field.name: instance.pk}).values_list(owner_field.attname, flat=True)))
+    elif action in ('post_add', 'post_remove'):
+        record_changes(model, pk_set)
+
 
-# Create your models here.
+for model in CHANGE_MODELS.values():
+    post_save.connect(object_saved, sender=model)
+    post_delete.connect(object_deleted, sender=model)
+for through in CHANGE_M2M_MODELS:
+    m2m_changed.connect(object_m2m_changed, sender=through)
@@ -0,0 +1,315 @@
+import hashlib
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db.models import Prefetch
+from django.http import Http404, JsonResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+from isi_mip.climatemodels.listings import (filter_impact_models,
+                                            filter_input_data,
+                                            filter_output_data, get_per_page)
+from isi_mip.climatemodels.models import (INFORMATION_TYPE_CHOICES,
+                                          FieldValueResolver, ImpactModel,
+                                          Sector, SimulationRound)
+from isi_mip.climatemodels.search import filter_public_impact_models
+
+# The read-only resources of the REST API. Every resource is a list of fields,
+# the fields parameter selects some of them and the include parameter expands
+# relations, which are otherwise given as ids, into the default fields of the
+# related resource. Only the relations needed by the selected fields are fetched.
+
+
+class Field:
+    def __init__(self, value, select_related=(), prefetch_related=(), prepare=None, default=True):
+        self.value = value
+        self.select_related = select_related
+        self.prefetch_related = prefetch_related
+        # called with all serialized objects, before the values are read
+        self.prepare = prepare
+        self.default = default
+
+
+class Relation:
+    def __init__(self, attribute, resource, many=False, lookup=None, queryset=None, default=True):
+        self.attribute = attribute
+        self.resource = resource
+        self.many = many
+        # relations with a queryset are prefetched from the lookup to the attribute,
+        # objects outside of the queryset are left out
+        self.lookup = lookup
+        self.queryset = queryset
+        self.default = default
+
+    @property
+    def prefetched(self):
+        return self.many or self.queryset is not None
+
+    def get_prefetch(self, prefix):
+        if self.queryset is not None:
+            return Prefetch(prefix + self.lookup, queryset=self.queryset(), to_attr=self.attribute)
+        return prefix + self.attribute
+
+    def get_value(self, obj):
+        if self.many:
+            return list(getattr(obj, self.attribute) if self.queryset is not None else getattr(obj, self.attribute).all())
+        return getattr(obj, self.attribute)
+
+    def get_id(self, obj):
+        if self.queryset is not None and not self.many:
+            value = self.get_value(obj)
+            return value and value.pk
+        return getattr(obj, self.attribute + '_id')
+
+
+class Resource:
+    def __init__(self, name, get_queryset, fields):
+        self.name = name
+        # returns the ordered queryset for the request parameters
+        self.get_queryset = get_queryset
+        self.fields = fields
+
+    @property
+    def default_fields(self):
+        return [name for name, field in self.fields.items() if field.default]
+
+    def get_lookups(self, names, include=(), prefix=''):
+        """
+        Returns the select_related and prefetch_related lookups of the fields
+        and the included relations, relative to the prefix.
+        """
+        select_related, prefetch_related = [], []
+        for name in names:
+            field = self.fields[name]
+            if isinstance(field, Field):
+                select_related += [prefix + lookup for lookup in field.select_related]
+                prefetch_related += [prefix + lookup for lookup in field.prefetch_related]
+                continue
+            related = RESOURCES[field.resource]
+            if field.prefetched:
+                prefetch_related.append(field.get_prefetch(prefix))
+            elif name in include:
+                select_related.append(prefix + field.attribute)
+            if name in include:
+                nested_select, nested_prefetch = related.get_lookups(related.default_fields, prefix=prefix + field.attribute + '__')
+                # everything below a prefetched relation is prefetched with it
+                (prefetch_related if field.prefetched else select_related).extend(nested_select)
+                prefetch_related.extend(nested_prefetch)
+        return select_related, prefetch_related
+
+    def prepare(self, objects, names, include=()):
+        for name in names:
+            field = self.fields[name]
+            if isinstance(field, Field) and field.prepare:
+                field.prepare(objects)
+            elif isinstance(field, Relation) and name in include:
+                related = RESOURCES[field.resource]
+                related_objects = []
+                for obj in objects:
+                    value = field.get_value(obj)
+                    if field.many:
+                        related_objects += value
+                    elif value is not None:
+                        related_objects.append(value)
+                related.prepare(related_objects, related.default_fields)
+
+    def serialize(self, obj, names, include=()):
+        data = {}
+        for name in names:
+            field = self.fields[name]
+            if isinstance(field, Field):
+                data[name] = field.value(obj)
+                continue
+            related = RESOURCES[field.resource]
+            if name in include:
+                value = field.get_value(obj)
+                if field.many:
+                    data[name] = [related.serialize(item, related.default_fields) for item in value]
+                else:
+                    data[name] = value and related.serialize(value, related.default_fields)
+            elif field.many:
+                data[name] = [item.pk for item in field.get_value(obj)]
+            else:
+                data[name] = field.get_id(obj)
+        return data
+
+
+def get_api_cache_max_age():
+    return getattr(settings, 'API_CACHE_MAX_AGE', 5 * 60)
+
+
+def serialize_paper(paper):
+    return paper and {
+        'title': paper.title,
+        'doi': paper.doi,
+        'entry': paper.entry(),
+    }
+
+
+def resolve_documentation(impact_models):
+    """
+    Sets the documentation of the impact models, the answers of their information
+    with the choices resolved to labels, fetching every choice model once.
+    """
+    resolver = FieldValueResolver(make_pretty=False)
+    informations = [impact_model.impact_model_information for impact_model in impact_models
+                    if hasattr(impact_model, 'impact_model_information')]
+    for information in informations:
+        resolver.collect(information)
+    for impact_model in impact_models:
+        impact_model.documentation = {}
+        if not hasattr(impact_model, 'impact_model_information'):
+            continue
+        information = impact_model.impact_model_information
+        for information_type, name in INFORMATION_TYPE_CHOICES:
+            question_set = resolver.get_question(information_type, impact_model.base_model.sector_id)
+            if not question_set:
+                continue
+            data = getattr(information, information_type)
+            impact_model.documentation[information_type] = {
+                question.name: resolver.resolve(question.field_type, data.get(question.name, None))
+                for question in question_set.schema.questions
+            }
+
+
+RESOURCES = {
+    'sectors': Resource('sectors', lambda params: Sector.objects.order_by('name'), {
+        'id': Field(lambda sector: sector.id),
+        'name': Field(lambda sector: sector.name),
+        'slug': Field(lambda sector: sector.slug),
+        'drkz_folder_name': Field(lambda sector: sector.drkz_folder_name),
+    }),
+    'simulation-rounds': Resource('simulation-rounds', lambda params: SimulationRound.objects.order_by('-order', 'id'), {
+        'id': Field(lambda simulation_round: simulation_round.id),
+        'name': Field(lambda simulation_round: simulation_round.name),
+        'slug': Field(lambda simulation_round: simulation_round.slug),
+        'order': Field(lambda simulation_round: simulation_round.order),
+    }),
+    'base-impact-models': Resource('base-impact-models', filter_impact_models, {
+        'id': Field(lambda base_model: base_model.id),
+        'name': Field(lambda base_model: base_model.name),
+        'url': Field(lambda base_model: base_model.relative_url(None, None)),
+        'sector': Relation('sector', 'sectors'),
+        'regions': Field(lambda base_model: [region.name for region in base_model.region.all()], prefetch_related=('region',)),
+        'short_description': Field(lambda base_model: base_model.short_description),
+        'drkz_folder_name': Field(lambda base_model: base_model.drkz_folder_name),
+        'impact_models': Relation('public_impact_models', 'impact-models', many=True, lookup='impact_model',
+                                  queryset=lambda: ImpactModel.objects.filter(public=True).order_by('-simulation_round__order', 'id')),
+        'updated': Field(lambda base_model: base_model.updated),
+    }),
+    'impact-models': Resource('impact-models', lambda params: filter_public_impact_models(params).order_by('id'), {
+        'id': Field(lambda impact_model: impact_model.id),
+        'base_model': Relation('base_model', 'base-impact-models'),
+        'simulation_round': Relation('simulation_round', 'simulation-rounds'),
+        'version': Field(lambda impact_model: impact_model.version),
+        'model_license': Field(lambda impact_model: impact_model.model_license),
+        'model_url': Field(lambda impact_model: impact_model.model_url),
+        'data_download': Field(lambda impact_model: impact_model.data_download),
+        'doi': Field(lambda impact_model: impact_model.doi),
+        'main_reference_paper': Field(lambda impact_model: serialize_paper(impact_model.main_reference_paper),
+                                      select_related=('main_reference_paper',)),
+        'other_references': Field(lambda impact_model: [serialize_paper(paper) for paper in impact_model.other_references.all()],
+                                  prefetch_related=('other_references',)),
+        'additional_persons_involved': Field(lambda impact_model: impact_model.additional_persons_involved),
+        'simulation_round_specific_description': Field(lambda impact_model: impact_model.simulation_round_specific_description),
+        'updated': Field(lambda impact_model: impact_model.updated),
+        # the documentation is large, so it is only returned when selected
+        'documentation': Field(lambda impact_model: impact_model.documentation, select_related=('base_model', 'impact_model_information'),
+                               prepare=resolve_documentation, default=False),
+    }),
+    'input-data': Resource('input-data', lambda params: filter_input_data(params).order_by('id'), {
+        'id': Field(lambda input_data: input_data.id),
+        'name': Field(lambda input_data: input_data.name),
+        'protocol_relation': Field(lambda input_data: input_data.get_protocol_relation_display()),
+        'data_type': Field(lambda input_data: input_data.data_type and input_data.data_type.name, select_related=('data_type',)),
+        'simulation_rounds': Relation('simulation_round', 'simulation-rounds', many=True),
+        'description': Field(lambda input_data: input_data.description),
+        'specification': Field(lambda input_data: input_data.specification),
+        'data_source': Field(lambda input_data: input_data.data_source),
+        'caveats': Field(lambda input_data: input_data.caveats),
+        'download_instructions': Field(lambda input_data: input_data.download_instructions),
+        'data_link': Field(lambda input_data: input_data.data_link),
+        'doi_link': Field(lambda input_data: input_data.doi_link),
+        'created': Field(lambda input_data: input_data.created),
+    }),
+    'output-data': Resource('output-data', lambda params: filter_output_data(params).order_by('-sort_date', 'id'), {
+        'id': Field(lambda output_data: output_data.id),
+        # the output data of private impact models is listed, but not the impact models
+        'impact_model': Relation('public_model', 'impact-models', lookup='model',
+                                 queryset=lambda: ImpactModel.objects.filter(public=True)),
+        'experiments': Field(lambda output_data: output_data.experiments),
+        'drivers': Relation('drivers', 'input-data', many=True),
+        'drivers_list': Field(lambda output_data: output_data.drivers_list),
+        'date': Field(lambda output_data: output_data.date),
+    }),
+}
+
+
+def get_names(params, key):
+    return [name for name in params.get(key, '').split(',') if name]
+
+
+def parse_fields(resource, params):
+    """
+    Returns the selected fields and the included relations, the included
+    relations are added to the fields. Raises ValueError for unknown names.
+    """
+    names = get_names(params, 'fields') or resource.default_fields
+    include = get_names(params, 'include')
+    unknown = [name for name in names if name not in resource.fields]
+    unknown += [name for name in include if not isinstance(resource.fields.get(name), Relation)]
+    if unknown:
+        raise ValueError('Unknown fields or relations: %s' % ', '.join(unknown))
+    names += [name for name in include if name not in names]
+    return names, include
+
+
+def get_objects(resource, queryset, names, include):
+    select_related, prefetch_related = resource.get_lookups(names, include)
+    if select_related:
+        queryset = queryset.select_related(*select_related)
+    return queryset.prefetch_related(*prefetch_related)
+
+
+def cached_response(request, data):
+    """
+    Returns the JSON response with an ETag of its content, or 304 if the client
+    has it, and lets clients and proxies cache it for API_CACHE_MAX_AGE seconds.
+    """
+    response = JsonResponse(data)
+    etag = '"%s"' % hashlib.md5(response.content).hexdigest()
+    response = get_conditional_response(request, etag=etag) or response
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=get_api_cache_max_age())
+    return response
+
+
+def resource_list_api(request, resource):
+    resource = RESOURCES[resource]
+    try:
+        names, include = parse_fields(resource, request.GET)
+    except ValueError as e:
+        return JsonResponse({'detail': str(e)}, status=400)
+    queryset = get_objects(resource, resource.get_queryset(request.GET), names, include)
+    page = Paginator(queryset, get_per_page(request.GET)).get_page(request.GET.get('page'))
+    objects = list(page.object_list)
+    resource.prepare(objects, names, include)
+    return cached_response(request, {
+        'count': page.paginator.count,
+        'page': page.number,
+        'numberofpages': page.paginator.num_pages,
+        'results': [resource.serialize(obj, names, include) for obj in objects],
+    })
+
+
+def resource_detail_api(request, resource, pk):
+    resource = RESOURCES[resource]
+    try:
+        names, include = parse_fields(resource, request.GET)
+    except ValueError as e:
+        return JsonResponse({'detail': str(e)}, status=400)
+    objects = list(get_objects(resource, resource.get_queryset({}).filter(pk=pk), names, include))
+    if not objects:
+        raise Http404
+    resource.prepare(objects, names, include)
+    return cached_response(request, resource.serialize(objects[0], names, include))
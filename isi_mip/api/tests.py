@@ -1,3 +1,112 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
 
-# Create your tests here.
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from isi_mip.api.models import Change, prune_changes
+from isi_mip.climatemodels.listings import encode_cursor
+from isi_mip.climatemodels.models import (BaseImpactModel, ImpactModel,
+                                          InputData, OutputData, Sector,
+                                          SimulationRound)
+
+
+class OutputDataMixin:
+    def create_output_data(self, name, public=True):
+        sector = Sector.objects.get_or_create(name='Water (global)', slug='water-global', drkz_folder_name='water_global')[0]
+        simulation_round = SimulationRound.objects.get_or_create(name='ISIMIP3a', slug='isimip3a', order=1)[0]
+        base_model = BaseImpactModel.objects.create(name=name, sector=sector)
+        impact_model = ImpactModel.objects.create(base_model=base_model, simulation_round=simulation_round, public=public)
+        return OutputData.objects.create(model=impact_model, experiments='historical')
+
+
+class OutputDataApiTestCase(OutputDataMixin, TestCase):
+    def test_invalid_cursors_start_at_the_first_page(self):
+        output_data = self.create_output_data('model')
+        for cursor in (['x', 'y', 'z', 1], ['2020-01-01', 'a', 'b', 'abc'], [None, None, None, None], 'garbage'):
+            response = self.client.get(reverse('api:output_data_api'), {'cursor': encode_cursor(cursor)})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([result['id'] for result in response.json()['results']], [output_data.pk])
+
+
+class ResourceTestCase(OutputDataMixin, TestCase):
+    def get_output_data(self, **params):
+        response = self.client.get(reverse('api:output-data_list_api'), params)
+        self.assertEqual(response.status_code, 200)
+        return {result['id']: result['impact_model'] for result in response.json()['results']}
+
+    def test_private_impact_models_are_not_included(self):
+        public = self.create_output_data('public')
+        private = self.create_output_data('private', public=False)
+        self.assertEqual(self.get_output_data(), {public.pk: public.model_id, private.pk: None})
+        impact_models = self.get_output_data(include='impact_model')
+        self.assertEqual(impact_models[public.pk]['id'], public.model_id)
+        self.assertIsNone(impact_models[private.pk])
+
+
+class ChangeFeedTestCase(OutputDataMixin, TransactionTestCase):
+    # the feed depends on the transactions, so the changes have to be committed
+
+    def get_changes(self, **params):
+        response = self.client.get(reverse('api:changes_api'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_changes_of_running_transactions_are_held_back(self):
+        slow, fast = self.create_output_data('slow'), self.create_output_data('fast')
+        Change.objects.all().delete()
+        started, finish = threading.Event(), threading.Event()
+
+        def long_transaction():
+            with transaction.atomic():
+                slow.save()
+                started.set()
+                finish.wait(10)
+            connection.close()
+
+        thread = threading.Thread(target=long_transaction)
+        thread.start()
+        started.wait(10)
+        fast.save()
+        self.assertEqual(self.get_changes()['results'], [])
+        finish.set()
+        thread.join()
+
+        first = self.get_changes(per_page=1)
+        self.assertTrue(first['more'])
+        self.assertEqual([change['object_id'] for change in first['results']], [slow.pk])
+        second = self.get_changes(since=first['next'])
+        self.assertFalse(second['more'])
+        self.assertEqual([change['object_id'] for change in second['results']], [fast.pk])
+        self.assertEqual(self.get_changes(since=second['next']), {'next': second['next'], 'more': False, 'results': []})
+
+    def test_reverse_clear_records_the_owners(self):
+        input_data = InputData.objects.create(name='forcing')
+        output_data = self.create_output_data('model')
+        output_data.drivers.add(input_data)
+        Change.objects.all().delete()
+        input_data.outputdata_set.clear()
+        self.assertEqual(list(Change.objects.values_list('model', 'object_id')), [('outputdata', output_data.pk)])
+
+    def test_private_output_data_has_no_payload(self):
+        public = self.create_output_data('public')
+        private = self.create_output_data('private', public=False)
+        payloads = {change['object_id']: change['payload'] for change in self.get_changes()['results']
+                    if change['model'] == 'outputdata'}
+        self.assertEqual(payloads[public.pk]['model'], 'public')
+        self.assertIsNone(payloads[private.pk])
+
+    def test_invalid_since_starts_at_the_oldest_change(self):
+        self.create_output_data('model')
+        changes = self.get_changes()['results']
+        for since in (['a', 'b'], [1.5, 2], [True, 1], [None, 1], {'a': 1}):
+            self.assertEqual(self.get_changes(since=encode_cursor(since))['results'], changes)
+
+    @override_settings(CHANGE_FEED_RETENTION=30)
+    def test_old_changes_are_pruned(self):
+        old, new = self.create_output_data('old'), self.create_output_data('new')
+        Change.objects.filter(model='outputdata', object_id=old.pk).update(created=timezone.now() - timedelta(days=31))
+        self.assertEqual(prune_changes(), 1)
+        self.assertEqual([change['object_id'] for change in self.get_changes()['results'] if change['model'] == 'outputdata'], [new.pk])
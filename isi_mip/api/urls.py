@@ -1,10 +1,27 @@
 from django.urls import path
 
-from isi_mip.api.views import impact_model_datacite_api
+from isi_mip.api.resources import (RESOURCES, resource_detail_api,
+                                   resource_list_api)
+from isi_mip.api.views import (changes_api, impact_model_datacite_api,
+                               impact_models_api, impact_models_datacite_api,
+                               input_data_api, output_data_api,
+                               participants_api)
 
 
 app_name = 'api'
 
 urlpatterns = [
+    path('impactmodels/', impact_models_api, name='impact_models_api'),
+    path('impactmodels/datacite/', impact_models_datacite_api, name='impact_models_datacite_api'),
     path('impactmodels/<int:impactmodel_id>/datacite/', impact_model_datacite_api, name='impact_model_datacite_api'),
-]
\ No newline at end of file
+    path('inputdata/', input_data_api, name='input_data_api'),
+    path('outputdata/', output_data_api, name='output_data_api'),
+    path('participants/', participants_api, name='participants_api'),
+    path('changes/', changes_api, name='changes_api'),
+]
+
+for resource in RESOURCES:
+    urlpatterns += [
+        path('v1/%s/' % resource, resource_list_api, {'resource': resource}, name='%s_list_api' % resource),
+        path('v1/%s/<int:pk>/' % resource, resource_detail_api, {'resource': resource}, name='%s_detail_api' % resource),
+    ]
\ No newline at end of file
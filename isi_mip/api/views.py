@@ -1,17 +1,50 @@
-from django.http import JsonResponse
-from django.shortcuts import get_object_or_404
+import hashlib
+import json
+from collections import defaultdict
 
-from isi_mip.climatemodels.models import BaseImpactModel
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Exists, Max, OuterRef, Prefetch, Q
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 
+from isi_mip.api.models import Change
+from isi_mip.climatemodels.listings import (
+    decode_cursor, encode_cursor, filter_impact_models, get_input_data_listing,
+    get_per_page,
+    impact_model_row, output_data_row, paginate_impact_models,
+    paginate_output_data, paginate_participants, participant_row,
+    prefetch_impact_models, serialize_impact_model,
+    serialize_impact_model_information, serialize_impact_model_round,
+    serialize_input_data, serialize_output_data, serialize_participant)
+from isi_mip.climatemodels.models import (BaseImpactModel, DataVersion,
+                                          ImpactModel, ImpactModelInformation,
+                                          InputData, OutputData)
+from isi_mip.climatemodels.tools import generate_json_lines
 
-def impact_model_datacite_api(request, impactmodel_id):
+DATACITE_CHUNK_SIZE = 100
+CHANGES_PER_PAGE = 100
+
+
+def get_datacite_impact_models(simulation_round=None):
+    impact_models = ImpactModel.objects.filter(simulation_round__isnull=False).select_related(
+        'simulation_round', 'main_reference_paper').prefetch_related('impact_model_responsible__user', 'other_references')
+    if simulation_round:
+        impact_models = impact_models.filter(simulation_round__name=simulation_round)
+    return Prefetch('impact_model', queryset=impact_models, to_attr='datacite_impact_models')
+
+
+def serialize_datacite(base_impact_model):
+    """
+    Returns the DataCite metadata of every round of the base impact model, which
+    needs the impact models prefetched with get_datacite_impact_models.
+    """
     response = {}
-    base_impact_model = get_object_or_404(BaseImpactModel, pk=impactmodel_id)
-    # response['titles'] = [
     titles = [{
         'title': base_impact_model.name
     }]
-    for impact_model in base_impact_model.impact_model.all():
+    for impact_model in base_impact_model.datacite_impact_models:
         creators = []
         for creator in impact_model.impact_model_responsible.all():
             creator_json = {
@@ -32,7 +65,7 @@ def impact_model_datacite_api(request, impactmodel_id):
         related_identifiers = []
         if impact_model.model_url:
             related_identifiers.append({
-                "title": "Model Homepage {}".format(impact_model.base_model.name),
+                "title": "Model Homepage {}".format(base_impact_model.name),
                 "relationType": "IsDocumentedBy",
                 "relatedIdentifier": impact_model.model_url,
                 "relatedIdentifierType": "URL"
@@ -58,4 +91,190 @@ def impact_model_datacite_api(request, impactmodel_id):
             "creators": creators,
             "related_identifiers": related_identifiers,
         }
-    return JsonResponse(response, json_dumps_params={'indent': 2})
\ No newline at end of file
+    return response
+
+
+def get_datacite_stamps(base_models):
+    """
+    Returns the ids of the base impact models with their change stamps, the latest
+    change of the base model, its impact models and the data shared by all of them.
+    """
+    shared_updated = DataVersion.get_instance(DataVersion.DOCUMENTATION).updated
+    stamps = base_models.annotate(impact_models_updated=Max('impact_model__updated')) \
+        .order_by('id').values_list('id', 'updated', 'impact_models_updated')
+    return [(pk, max(filter(None, (updated, impact_models_updated, shared_updated))))
+            for pk, updated, impact_models_updated in stamps]
+
+
+def get_datacite_etag(stamps, params):
+    data = json.dumps([sorted(params.items()), stamps], cls=DjangoJSONEncoder)
+    return '"%s"' % hashlib.md5(data.encode()).hexdigest()
+
+
+def conditional_response(request, stamps, params, build):
+    """
+    Returns 304 if the client has the current records, otherwise the response of
+    build, both with the ETag and the Last-Modified of the stamps.
+    """
+    etag = get_datacite_etag(stamps, params)
+    last_modified = max((stamp for pk, stamp in stamps), default=None)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified and int(last_modified.timestamp()))
+    if response is None:
+        response = build()
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
+
+
+def impact_model_datacite_api(request, impactmodel_id):
+    base_models = BaseImpactModel.objects.filter(pk=impactmodel_id)
+    stamps = get_datacite_stamps(base_models)
+    if not stamps:
+        raise Http404
+
+    def build():
+        base_impact_model = base_models.prefetch_related(get_datacite_impact_models()).get()
+        return JsonResponse(serialize_datacite(base_impact_model), json_dumps_params={'indent': 2})
+    return conditional_response(request, stamps, {}, build)
+
+
+def generate_datacite_records(stamps, simulation_round=None):
+    for start in range(0, len(stamps), DATACITE_CHUNK_SIZE):
+        chunk = dict(stamps[start:start + DATACITE_CHUNK_SIZE])
+        base_models = BaseImpactModel.objects.filter(pk__in=chunk).prefetch_related(get_datacite_impact_models(simulation_round)).in_bulk()
+        for pk, updated in chunk.items():
+            yield {
+                'id': pk,
+                'name': base_models[pk].name,
+                'updated': updated,
+                'datacite': serialize_datacite(base_models[pk]),
+            }
+
+
+def impact_models_datacite_api(request):
+    """
+    Streams the DataCite metadata of the base impact models in the sector and with
+    an impact model in the simulation round as JSON Lines, one base model per line.
+    """
+    params = {key: request.GET[key] for key in ('simulation_round', 'sector') if request.GET.get(key)}
+    base_models = BaseImpactModel.objects.all()
+    if 'simulation_round' in params:
+        base_models = base_models.filter(Exists(ImpactModel.objects.filter(
+            base_model=OuterRef('pk'), simulation_round__name=params['simulation_round'])))
+    if 'sector' in params:
+        base_models = base_models.filter(sector__name=params['sector'])
+    stamps = get_datacite_stamps(base_models)
+
+    def build():
+        records = generate_datacite_records(stamps, params.get('simulation_round'))
+        return StreamingHttpResponse(generate_json_lines(records), content_type='application/x-ndjson')
+    return conditional_response(request, stamps, params, build)
+
+
+def participants_api(request):
+    if not request.user.groups.filter(name='ISIMIP-Team').exists():
+        return JsonResponse({'detail': 'You do not have the permission to view the participants.'}, status=403)
+    page = paginate_participants(request.GET)
+    results = [serialize_participant(participant) for participant in page.object_list]
+    response = {
+        'count': page.paginator.count,
+        'page': page.number,
+        'numberofpages': page.paginator.num_pages,
+        'results': results,
+    }
+    if request.GET.get('html'):
+        rows = [participant_row(participant) for participant in results]
+        response['html'] = render_to_string('widgets/table-rows.html', {'body': {'rows': rows}})
+    return JsonResponse(response)
+
+
+def impact_models_api(request):
+    page = paginate_impact_models(request.GET)
+    results = [serialize_impact_model(base_model) for base_model in page.object_list]
+    response = {
+        'count': page.paginator.count,
+        'page': page.number,
+        'numberofpages': page.paginator.num_pages,
+        'results': results,
+    }
+    if request.GET.get('html'):
+        rows = [impact_model_row(impact_model) for impact_model in results]
+        response['html'] = render_to_string('widgets/table-rows.html', {'body': {'rows': rows}})
+    return JsonResponse(response)
+
+
+def output_data_api(request):
+    rows, next_cursor = paginate_output_data(request.GET)
+    results = [serialize_output_data(output_data) for output_data in rows]
+    response = {
+        'next': next_cursor,
+        'results': results,
+    }
+    if request.GET.get('html'):
+        response['html'] = render_to_string('widgets/table-rows.html', {'body': {'rows': [output_data_row(output_data) for output_data in results]}})
+    return JsonResponse(response)
+
+
+def input_data_api(request):
+    return JsonResponse(get_input_data_listing(request.GET))
+
+
+# the querysets and serializers of the change payloads, private impact models have none
+CHANGE_PAYLOADS = {
+    'baseimpactmodel': (lambda: prefetch_impact_models(filter_impact_models({})), serialize_impact_model),
+    'impactmodel': (lambda: ImpactModel.objects.filter(public=True).select_related('base_model__sector', 'simulation_round'),
+                    serialize_impact_model_round),
+    'impactmodelinformation': (lambda: ImpactModelInformation.objects.filter(impact_model__public=True),
+                               serialize_impact_model_information),
+    'outputdata': (lambda: OutputData.objects.filter(model__public=True).select_related('model__base_model__sector', 'model__simulation_round').prefetch_related('drivers'),
+                   serialize_output_data),
+    'inputdata': (lambda: InputData.objects.select_related('data_type').prefetch_related('simulation_round'),
+                  serialize_input_data),
+}
+
+
+def get_change_payloads(changes):
+    object_ids = defaultdict(set)
+    for change in changes:
+        if change.action == Change.SAVE:
+            object_ids[change.model].add(change.object_id)
+    payloads = {}
+    for model, pks in object_ids.items():
+        get_queryset, serialize = CHANGE_PAYLOADS[model]
+        for pk, instance in get_queryset().in_bulk(pks).items():
+            payloads[(model, pk)] = serialize(instance)
+    return payloads
+
+
+def changes_api(request):
+    """
+    Returns the changes after the since parameter in order, with the current
+    data of the saved objects. The next parameter is the since of the next call.
+    The changes of running transactions, and of the transactions started after
+    them, are held back until the transactions are finished. Invalid since
+    parameters start at the oldest change.
+    """
+    per_page = get_per_page(request.GET, CHANGES_PER_PAGE)
+    changes = Change.objects.finished()
+    since = request.GET.get('since', '')
+    values = decode_cursor(since)
+    if isinstance(values, list) and len(values) == 2 and all(type(value) is int for value in values):
+        transaction_id, change_id = values
+        changes = changes.filter(Q(transaction_id__gt=transaction_id) | Q(transaction_id=transaction_id, id__gt=change_id))
+    changes = list(changes.order_by('transaction_id', 'id')[:per_page + 1])
+    more = len(changes) > per_page
+    changes = changes[:per_page]
+    payloads = get_change_payloads(changes)
+    return JsonResponse({
+        'next': encode_cursor([changes[-1].transaction_id, changes[-1].id]) if changes else since,
+        'more': more,
+        'results': [{
+            'id': change.id,
+            'model': change.model,
+            'object_id': change.object_id,
+            'action': change.action,
+            'created': change.created,
+            'payload': payloads.get((change.model, change.object_id)),
+        } for change in changes],
+    })
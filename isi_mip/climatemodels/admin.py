@@ -8,16 +8,15 @@ from django.forms import CheckboxSelectMultiple
 from django.http import HttpResponse, HttpResponseRedirect
 from django.shortcuts import render
 from django.urls import reverse
-from django.template import Context, Template
-from django.conf import settings
 
 from wagtail.models import Site
 
+from isi_mip.climatemodels.confirmations import (
+    get_confirmation_request_emails, request_data_confirmations)
+from isi_mip.climatemodels.outbox import queue_emails
 from isi_mip.sciencepaper.models import Author
 from .models import *
 from isi_mip.contrib.models import UserProfile
-from isi_mip.core.models import DataPublicationRequest
-from isi_mip.pages.models import ImpactModelsPage
 
 
 class HideAdmin(admin.ModelAdmin):
@@ -77,7 +76,7 @@ class ImpactModelAdmin(admin.ModelAdmin):
     inlines = [TechnicalInformationAdmin, InputDataInformationAdmin, OtherInformationAdmin]
     model = ImpactModel
     search_fields = ('base_model__name', 'base_model__sector__name', 'simulation_round__name')
-    actions = ["duplicate_impact_model"]
+    actions = ["duplicate_impact_model", "request_data_confirmation"]
     save_on_top = True
 
     def duplicate_impact_model(self, request, queryset):
@@ -107,6 +106,23 @@ class ImpactModelAdmin(admin.ModelAdmin):
                 return render(request, 'admin/duplicate_intermediate.html', context=context)
     duplicate_impact_model.short_description = "Duplicate Impact Model"
 
+    def request_data_confirmation(self, request, queryset):
+        if 'apply' in request.POST:
+            email_text = request.POST.get('email_text', '').strip()
+            if email_text:
+                confirmations = request_data_confirmations(queryset, email_text, Site.find_for_request(request))
+                self.message_user(request, "Data confirmations have been requested for %d Impact Models" % len(confirmations))
+                return None
+            self.message_user(request, "Please insert information on the experiments that are to be published.", messages.ERROR)
+        context = {
+            "impact_models": queryset,
+            "confirmed_count": queryset.filter(confirmation__isnull=False).count(),
+            "opts": self.model._meta,
+            "app_label": self.model._meta.app_label,
+        }
+        return render(request, 'admin/request_data_confirmation_intermediate.html', context=context)
+    request_data_confirmation.short_description = "Request data confirmation"
+
     def get_name(self, obj):
         return obj.base_model and obj.base_model.name or obj.id
     get_name.admin_order_field = 'base_model__name'
@@ -323,27 +339,8 @@ class DataPublicationConfirmationModelAdmin(admin.ModelAdmin):
             self.send_request_to_confirm(obj, request)
 
     def send_request_to_confirm(self, confirmation, request):
-
-        impage = ImpactModelsPage.objects.get()
-        for owner in confirmation.impact_model.impact_model_responsible.all():
-            link = impage.full_url + impage.reverse_subpage('confirm_data', kwargs={'id': confirmation.impact_model.pk})
-            context = {
-                'model_contact_person': owner.name,
-                'simulation_round': confirmation.impact_model.simulation_round,
-                'sector': confirmation.impact_model.base_model.sector,
-                'sector_drkz_folder_name': confirmation.impact_model.base_model.sector.drkz_folder_name,
-                'impact_model_drkz_folder_name': confirmation.impact_model.base_model.drkz_folder_name,
-                'impact_model_name': confirmation.impact_model.base_model.name,
-                'data_confirmation_link': link,
-                'custom_text': confirmation.email_text,
-            }
-            site = Site.find_for_request(request)
-            confirm_email = DataPublicationRequest.for_site(site)
-            confirm_body = Template(confirm_email.body)
-            confirm_body = confirm_body.render(Context(context))
-            confirm_subject = confirm_email.subject
-            owner.user.email_user(confirm_subject, confirm_body, 'ISIMIP Data Confirmation <%s>' % settings.DATA_CONFIRMATION_EMAIL)
-        messages.add_message(request, messages.INFO, 'Data confirmation request email have been sent to the owners.')
+        queue_emails(list(get_confirmation_request_emails([confirmation], Site.find_for_request(request))))
+        messages.add_message(request, messages.INFO, 'Data confirmation request emails have been queued for the owners.')
 
 
 
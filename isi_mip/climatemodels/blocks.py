@@ -1,8 +1,14 @@
-import math
 
-from django.utils.html import urlize
+from django.urls import reverse
 from wagtail.blocks import StructBlock
 
+from isi_mip.climatemodels.listings import (get_input_data_listing,
+                                            impact_model_row, input_data_row,
+                                            output_data_row,
+                                            paginate_impact_models,
+                                            paginate_output_data,
+                                            serialize_impact_model,
+                                            serialize_output_data)
 from isi_mip.climatemodels.models import InputData, OutputData, BaseImpactModel, SimulationRound
 from isi_mip.contrib.blocks import IntegerBlock, RichTextBlock
 
@@ -14,8 +20,7 @@ class ImpactModelsBlock(StructBlock):
     def get_context(self, value, parent_context=None):
         context = super(ImpactModelsBlock, self).get_context(value, parent_context=parent_context)
 
-        bims = BaseImpactModel.objects.select_related('sector').prefetch_related('impact_model')
-        bims = bims.filter(impact_model__public=True).distinct().order_by('name')
+        bims = BaseImpactModel.objects.filter(impact_model__public=True)
 
         # Filter und Suchfelder
         context['tableid'] = 'selectortable'
@@ -26,30 +31,24 @@ class ImpactModelsBlock(StructBlock):
             {'colnumber': '2', 'all_value': 'All simulation rounds', 'options': simulation_round_options, 'name': 'simulation_round'},
             {'colnumber': '3', 'all_value': 'All sectors', 'options': sector_options, 'name': 'sector'},
         ]
-        # Tabelle
+        # Tabelle, only the first page is rendered, the others are fetched from the api
         context['id'] = 'selectortable'
+        context['apiurl'] = reverse('api:impact_models_api')
         context['head'] = {
             'cols': [{'text': 'Model'}, {'text': 'Simulation round'}, {'text': 'Sector'}, {'text': 'Region'}]
         }
         rows_per_page = value.get('rows_per_page')
-        numpages = math.ceil(bims.count() / rows_per_page)
+        page = paginate_impact_models({'per_page': rows_per_page})
+        numpages = page.paginator.num_pages
         context['pagination'] = {
             'rowsperpage': (rows_per_page),
             'numberofpages': numpages,  # number of pages with current filters
             'pagenumbers': [{'number': i + 1, 'invisible': False} for i in range(numpages)],
             'activepage': 1,  # set to something between 1 and numberofpages
         }
-        context['norowvisible'] = False  # true when no row is visible
-
-        context['body'] = {'rows': []}
-        for i, bmodel in enumerate(bims):
-            simulation_rounds = bmodel.impact_model.filter(public=True).values_list('simulation_round__name', flat=True)
-            values = [["<a href='details/{0.id}/'>{0.name}</a>".format(bmodel, bmodel)], simulation_rounds, [bmodel.sector], bmodel.region.all()]
-            row = {
-                'invisible': i >= rows_per_page,
-                'cols': [{'texts': x} for x in values],
-            }
-            context['body']['rows'] += [row]
+        context['norowvisible'] = not page.object_list  # true when no row is visible
+
+        context['body'] = {'rows': [impact_model_row(serialize_impact_model(bmodel)) for bmodel in page.object_list]}
 
         return context
 
@@ -65,22 +64,14 @@ class InputDataBlock(StructBlock):
         context = super(InputDataBlock, self).get_context(value, parent_context=parent_context)
 
         context['head'] = {'cols': [{'text': 'Data set'}, {'text': 'Protocol relation'}, {'text': 'Data type'}, {'text': 'Simulation round'}, {'text': 'Description'}]}
-        context['body'] = {'rows': []}
-
         inputdata = InputData.objects.all()
         row_limit = value.get('row_limit')
-        numpages = math.ceil(inputdata.count() / row_limit)
-
-        for i, idata in enumerate(inputdata):
-            link = "<a href='details/{0.id}'>{0.name}</a>".format(idata)
-            context['body']['rows'] += [{
-                'cols': [
-                    {'texts': [link]},
-                    {'texts': [idata.get_protocol_relation_display()]},
-                    {'texts': [idata.data_type]},
-                    {'texts': [sr.name for sr in idata.simulation_round.all()]},
-                    {'texts': [urlize(idata.description)]}], 'invisible': i >= row_limit
-            }]
+        # only the first page is rendered, the others are fetched from the api
+        listing = get_input_data_listing({'per_page': row_limit})
+        numpages = listing['numberofpages']
+        context['body'] = {'rows': [input_data_row(idata) for idata in listing['results']]}
+        context['norowvisible'] = not listing['results']
+        context['apiurl'] = reverse('api:input_data_api')
         context['pagination'] = {
             'rowsperpage': row_limit,
             'numberofpages': numpages,  # number of pages with current filters
@@ -115,35 +106,21 @@ class OutputDataBlock(StructBlock):
 
         context['head'] = {'cols': [{'text': 'Sector'}, {'text': 'Model'}, {'text': 'Simulation rounds'}, {'text': 'Experiments'},
                                     {'text': 'Climate drivers'}, {'text': 'Date'}]}
+        # only the first rows are rendered, the table fetches the following ones from the api
+        rows, next_cursor = paginate_output_data({'per_page': value.get('rows_per_page')})
         context['body'] = {
-            'rows': [],
+            'rows': [output_data_row(serialize_output_data(odat)) for odat in rows],
         }
-        # The linking of the impact model should be refactored using the reverse_subpage of the page model.
-        # This is not possible at the moment because of circular import issues.
-        outputdata = OutputData.objects.order_by('-date', 'model__base_model__sector', 'model')
-        for i, odat in enumerate(outputdata):
-            if odat.drivers_list:
-                drivers = [odat.drivers_list]
-            else:
-                drivers = [x.name for x in odat.drivers.all()]
-            context['body']['rows'] += [{
-                'invisible': i >= value.get('rows_per_page'),
-                'cols': [
-                    {'texts': [odat.model.base_model.sector]},
-                    {'texts': ["<a href='/impactmodels/details/%s/#tab_%s'>%s</a>" % (odat.model.base_model.id, odat.model.simulation_round.slug, odat.model.base_model.name) if odat.model else '']},
-                    {'texts': [odat.model.simulation_round]},
-                    {'texts': [odat.experiments]},
-                    {'texts': drivers},
-                    {'texts': [odat.date]}
-                ]
-            }]
-        numpages = math.ceil(outputdata.count() / value.get('rows_per_page'))
-        context['pagination'] = {
-            'rowsperpage': (value.get('rows_per_page')),
-            'numberofpages': numpages,  # number of pages with current filters
-            'pagenumbers': [{'number': i + 1, 'invisible': False} for i in range(numpages)],
-            'activepage': 1,  # set to something between 1 and numberofpages
+        context['norowvisible'] = not rows
+        context['apiurl'] = reverse('api:output_data_api')
+        context['keyset'] = {
+            'rowsperpage': value.get('rows_per_page'),
+            'next': next_cursor,
+        }
+        context['showalllink'] = {
+            'buttontext': 'Show more <i class="fa fa-chevron-down"></i>',
         }
+        outputdata = OutputData.objects.all()
         context['id'] = 'selectorable'
         context['tableid'] = 'selectorable'
         context['searchfield'] = {'value': ''}
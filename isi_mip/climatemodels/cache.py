@@ -0,0 +1,145 @@
+import hashlib
+import json
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+
+# Cached data is namespaced by a version, which is replaced to drop all entries
+# of a namespace at once.
+#
+# The rendered tabs of the impact model detail page are cached per impact model.
+# Changes to a single impact model delete its entry, changes to data shared by
+# many impact models (input data, questions, ...) bump the version.
+# The stored documentation pdfs show the same data, so the same changes set
+# ImpactModel.updated or replace the documentation DataVersion.
+DETAILS_NAMESPACE = 'impact_model_details'
+INPUT_DATA_LISTING_NAMESPACE = 'input_data_listing'
+
+
+def get_version(namespace):
+    key = '%s:version' % namespace
+    cache.add(key, uuid4().hex, None)
+    return cache.get(key)
+
+
+def bump_version(namespace):
+    cache.set('%s:version' % namespace, uuid4().hex, None)
+
+
+def get_details_timeout():
+    return getattr(settings, 'IMPACT_MODEL_DETAILS_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+def get_listing_timeout():
+    return getattr(settings, 'LISTING_CACHE_TIMEOUT', 60 * 60)
+
+
+def get_cached_listing(namespace, params, build):
+    """
+    Returns the listing for params from the cache, build is called on a miss.
+    """
+    params_hash = hashlib.md5(json.dumps(sorted(params.items())).encode()).hexdigest()
+    key = '%s:%s:%s' % (namespace, get_version(namespace), params_hash)
+    listing = cache.get(key)
+    if listing is None:
+        listing = build(params)
+        cache.set(key, listing, get_listing_timeout())
+    return listing
+
+
+def get_details_cache_keys(impact_model_ids):
+    version = get_version(DETAILS_NAMESPACE)
+    return {impact_model_id: '%s:%s:%s' % (DETAILS_NAMESPACE, version, impact_model_id) for impact_model_id in impact_model_ids}
+
+
+def get_cached_details(impact_model_ids):
+    keys = get_details_cache_keys(impact_model_ids)
+    cached = cache.get_many(keys.values())
+    return {impact_model_id: cached[key] for impact_model_id, key in keys.items() if key in cached}
+
+
+def set_cached_details(details):
+    keys = get_details_cache_keys(details.keys())
+    cache.set_many({keys[impact_model_id]: value for impact_model_id, value in details.items()}, get_details_timeout())
+
+
+def invalidate_details(impact_model_ids):
+    impact_model_ids = [impact_model_id for impact_model_id in impact_model_ids if impact_model_id is not None]
+    if impact_model_ids:
+        cache.delete_many(get_details_cache_keys(impact_model_ids).values())
+        from isi_mip.climatemodels.models import ImpactModel
+        ImpactModel.objects.filter(pk__in=impact_model_ids).update(updated=timezone.now())
+
+
+def invalidate_all_details():
+    bump_version(DETAILS_NAMESPACE)
+    from isi_mip.climatemodels.models import DataVersion
+    DataVersion.bump_version_on_commit(DataVersion.DOCUMENTATION)
+
+
+def impact_model_changed(sender, instance, **kwargs):
+    invalidate_details([instance.pk])
+
+
+def base_model_changed(sender, instance, **kwargs):
+    # the sector of the base model selects the questions of its impact models
+    invalidate_details(instance.impact_model.values_list('id', flat=True))
+
+
+def impact_model_related_changed(sender, instance, **kwargs):
+    # ImpactModelInformation, Attachment and OutputData
+    invalidate_details([getattr(instance, 'impact_model_id', None) or getattr(instance, 'model_id', None)])
+
+
+def user_profile_changed(sender, instance, **kwargs):
+    invalidate_details(instance.responsible.values_list('id', flat=True))
+
+
+def user_changed(sender, instance, **kwargs):
+    # logins only save last_login, which is not shown
+    if kwargs.get('update_fields') and set(kwargs['update_fields']) <= {'last_login'}:
+        return
+    if hasattr(instance, 'userprofile'):
+        invalidate_details(instance.userprofile.responsible.values_list('id', flat=True))
+
+
+def shared_data_changed(sender, instance, **kwargs):
+    # also used for deleted user profiles, whose responsible relation is already gone
+    invalidate_all_details()
+
+
+def reference_paper_changed(sender, instance, **kwargs):
+    # connected to pre_delete, the references are gone after the delete
+    from isi_mip.climatemodels.models import ImpactModel
+    impact_models = ImpactModel.objects.filter(Q(main_reference_paper=instance) | Q(other_references=instance))
+    invalidate_details(set(impact_models.values_list('id', flat=True)))
+
+
+def impact_model_m2m_changed(sender, instance, action, pk_set, **kwargs):
+    # ImpactModel.other_references and UserProfile.responsible
+    if not action.startswith('post_'):
+        return
+    from isi_mip.climatemodels.models import ImpactModel
+    if isinstance(instance, ImpactModel):
+        invalidate_details([instance.pk])
+    elif pk_set:
+        invalidate_details(pk_set)
+    else:
+        invalidate_all_details()
+
+
+def output_data_drivers_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if reverse:
+        invalidate_all_details()
+    else:
+        invalidate_details([instance.model_id])
+
+
+def input_data_listing_changed(sender, **kwargs):
+    # InputData and everything shown in its listing, including m2m changes
+    bump_version(INPUT_DATA_LISTING_NAMESPACE)
@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.db.models import prefetch_related_objects
+from django.template import Context
+
+from isi_mip.climatemodels.cache import invalidate_details
+from isi_mip.climatemodels.models import DataPublicationConfirmation
+from isi_mip.climatemodels.outbox import build_email, queue_emails
+from isi_mip.core.models import DataPublicationRequest
+from isi_mip.core.setting_templates import get_setting_template
+from isi_mip.pages.models import ImpactModelsPage
+
+
+def get_confirmation_request_emails(confirmations, site):
+    """
+    Yields the data confirmation request emails to the owners of the impact models.
+    The page and the site setting are resolved once for all confirmations.
+    """
+    prefetch_related_objects(confirmations, 'impact_model__impact_model_responsible__user')
+    impage = ImpactModelsPage.objects.get()
+    page_url = impage.full_url
+    confirm_email = DataPublicationRequest.for_site(site)
+    confirm_body = get_setting_template(confirm_email)
+    from_email = 'ISIMIP Data Confirmation <%s>' % settings.DATA_CONFIRMATION_EMAIL
+    for confirmation in confirmations:
+        impact_model = confirmation.impact_model
+        link = page_url + impage.reverse_subpage('confirm_data', kwargs={'id': impact_model.pk})
+        for owner in impact_model.impact_model_responsible.all():
+            context = {
+                'model_contact_person': owner.name,
+                'simulation_round': impact_model.simulation_round,
+                'sector': impact_model.base_model.sector,
+                'sector_drkz_folder_name': impact_model.base_model.sector.drkz_folder_name,
+                'impact_model_drkz_folder_name': impact_model.base_model.drkz_folder_name,
+                'impact_model_name': impact_model.base_model.name,
+                'data_confirmation_link': link,
+                'custom_text': confirmation.email_text,
+            }
+            yield build_email(confirm_email.subject, confirm_body.render(Context(context)), from_email, [owner.user.email])
+
+
+def request_data_confirmations(impact_models, email_text, site):
+    """
+    Creates the confirmations for the impact models, which have none yet, and
+    queues the request emails. Returns the created confirmations.
+    """
+    impact_models = impact_models.filter(confirmation__isnull=True).select_related('base_model__sector', 'simulation_round')
+    confirmations = DataPublicationConfirmation.objects.bulk_create(
+        [DataPublicationConfirmation(impact_model=impact_model, email_text=email_text) for impact_model in impact_models])
+    # bulk_create sends no post_save signals
+    invalidate_details([confirmation.impact_model_id for confirmation in confirmations])
+    queue_emails(list(get_confirmation_request_emails(confirmations, site)))
+    return confirmations
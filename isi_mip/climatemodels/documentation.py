@@ -0,0 +1,202 @@
+import hashlib
+import multiprocessing
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils.text import slugify
+from easy_pdf.rendering import render_to_pdf
+
+from isi_mip.climatemodels.models import DataVersion, ImpactModel
+
+# The documentation pdfs are stored under MEDIA_ROOT, in a directory per impact
+# model and named by a content version. The version changes with ImpactModel.updated,
+# which is set whenever the impact model or its documentation changes, with the
+# updated of its base model, whose name and sector are shown, and with the
+# documentation DataVersion, which is replaced when shared data changes.
+DOCUMENTATION_DIR = 'documentation'
+MISSING_PDFS_NAME = 'missing.txt'
+MISSING_PDFS_TEXT = 'The documentation of these impact models has not been rendered yet and will be included in a later download:\n\n'
+
+
+def render_impact_model_to_pdf(impact_model):
+    im_values = impact_model.values_to_tuples() + impact_model.impact_model_information.values_to_tuples()
+    model_details = []
+    for k, v in im_values:
+        if any((y for x, y in v)):
+            res = {'term': k,
+                   'definitions': ({'text': "%s: <i>%s</i>" % (x, y), 'key': x, 'value': y} for x, y in v if y)
+                   }
+            model_details.append(res)
+    context = {
+        "impact_model_name": impact_model.base_model.name,
+        "simulation_round": impact_model.simulation_round,
+        "model_details": model_details,
+    }
+    return render_to_pdf("climatemodels/pdf.html", context)
+
+
+def get_pdf_version(impact_model, data_version=None):
+    """
+    Returns the content version and the last modification of the documentation.
+    """
+    if data_version is None:
+        data_version = DataVersion.get_instance(DataVersion.DOCUMENTATION)
+    base_model = impact_model.base_model
+    version = hashlib.md5(('%s:%s:%s' % (impact_model.updated.isoformat(), base_model.updated.isoformat(),
+                                         data_version.version)).encode()).hexdigest()
+    return version, max(impact_model.updated, base_model.updated, data_version.updated)
+
+
+def get_pdf_dir(impact_model):
+    return '%s/%s' % (DOCUMENTATION_DIR, impact_model.pk)
+
+
+def get_pdf_name(impact_model, version):
+    return '%s/%s.pdf' % (get_pdf_dir(impact_model), version)
+
+
+def delete_outdated_pdfs(impact_model, name):
+    # only the directory of the impact model is listed
+    directory = get_pdf_dir(impact_model)
+    if not default_storage.exists(directory):
+        return
+    for filename in default_storage.listdir(directory)[1]:
+        path = '%s/%s' % (directory, filename)
+        if path != name:
+            default_storage.delete(path)
+
+
+def get_impact_model_pdf(impact_model, data_version=None):
+    """
+    Returns the storage name, the version and the last modification of the
+    documentation pdf. The pdf is rendered if there is none for the current version.
+    """
+    version, last_modified = get_pdf_version(impact_model, data_version)
+    name = get_pdf_name(impact_model, version)
+    if not default_storage.exists(name):
+        name = store_pdf(impact_model, name, render_impact_model_to_pdf(impact_model))
+    return name, version, last_modified
+
+
+def store_pdf(impact_model, name, pdf):
+    delete_outdated_pdfs(impact_model, name)
+    return default_storage.save(name, ContentFile(pdf))
+
+
+def read_impact_model_pdf(impact_model):
+    name = get_impact_model_pdf(impact_model)[0]
+    with default_storage.open(name, 'rb') as pdf:
+        return pdf.read()
+
+
+def get_pdf_processes():
+    return getattr(settings, 'DOCUMENTATION_PDF_PROCESSES', None) or os.cpu_count() or 1
+
+
+def render_pdf_by_id(impact_model_id):
+    # runs in the worker processes, only the id and the pdf are passed between the processes
+    impact_model = ImpactModel.objects.select_related('base_model', 'simulation_round').get(pk=impact_model_id)
+    return impact_model_id, render_impact_model_to_pdf(impact_model)
+
+
+def get_stored_pdfs(impact_models):
+    """
+    Returns the impact models with the storage names of their current documentation
+    pdfs and the missing pdfs by impact model id.
+    """
+    data_version = DataVersion.get_instance(DataVersion.DOCUMENTATION)
+    stored, missing = [], {}
+    for impact_model in impact_models:
+        name = get_pdf_name(impact_model, get_pdf_version(impact_model, data_version)[0])
+        if default_storage.exists(name):
+            stored.append((impact_model, name))
+        else:
+            missing[impact_model.pk] = (impact_model, name)
+    return stored, missing
+
+
+def render_pdfs(impact_models, processes=None):
+    """
+    Yields the impact models with the storage names of their documentation pdfs.
+    The pdfs which are not current are rendered in parallel on a process pool.
+    """
+    stored, missing = get_stored_pdfs(impact_models)
+    yield from stored
+    if not missing:
+        return
+    processes = min(processes or get_pdf_processes(), len(missing))
+    if processes == 1:
+        for impact_model, name in missing.values():
+            yield impact_model, store_pdf(impact_model, name, render_impact_model_to_pdf(impact_model))
+        return
+    # spawned workers set up django and open their own database connections,
+    # forked ones would share the connections of this process
+    executor = ProcessPoolExecutor(max_workers=processes, mp_context=multiprocessing.get_context('spawn'), initializer=django.setup)
+    try:
+        futures = [executor.submit(render_pdf_by_id, pk) for pk in missing]
+        for future in as_completed(futures):
+            impact_model_id, pdf = future.result()
+            impact_model, name = missing[impact_model_id]
+            yield impact_model, store_pdf(impact_model, name, pdf)
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+
+def get_archive_name(impact_model):
+    return '%s-%s.pdf' % (slugify(impact_model.base_model.name), slugify(impact_model.simulation_round.name))
+
+
+class ZipBuffer:
+    # an unseekable file for zipfile, the written chunks are yielded as soon as a pdf is added
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def generate_pdf_zip(impact_models, processes=None, render=True):
+    """
+    Yields the chunks of a zip file with the documentation pdfs. Without render,
+    only the stored pdfs are added and the missing ones are listed in a text file.
+    """
+    buffer = ZipBuffer()
+    missing = {}
+    if render:
+        pdfs = render_pdfs(impact_models, processes)
+    else:
+        pdfs, missing = get_stored_pdfs(impact_models)
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for impact_model, name in pdfs:
+            with default_storage.open(name, 'rb') as pdf:
+                archive.writestr(get_archive_name(impact_model), pdf.read())
+            yield buffer.pop()
+        if missing:
+            archive.writestr(MISSING_PDFS_NAME, MISSING_PDFS_TEXT + ''.join(
+                '%s\n' % get_archive_name(impact_model) for impact_model, name in missing.values()))
+    yield buffer.pop()
+
+
+def get_documentation_impact_models(simulation_round=None, sector=None, public=True):
+    impact_models = ImpactModel.objects.filter(base_model__isnull=False, simulation_round__isnull=False)
+    if public:
+        impact_models = impact_models.filter(public=True)
+    if simulation_round:
+        impact_models = impact_models.filter(simulation_round__name=simulation_round)
+    if sector:
+        impact_models = impact_models.filter(base_model__sector__name=sector)
+    return impact_models.select_related('base_model', 'simulation_round')
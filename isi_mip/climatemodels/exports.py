@@ -0,0 +1,154 @@
+import hashlib
+import json
+import logging
+import tempfile
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from isi_mip.climatemodels.models import DataVersion, ExportJob
+from isi_mip.climatemodels.search import filter_public_impact_models
+from isi_mip.climatemodels.tools import (ImpactModelToXLSX,
+                                         ParticpantModelToXLSX)
+
+logger = logging.getLogger(__name__)
+
+# Exports are generated by the run_export_jobs worker and stored under MEDIA_ROOT,
+# or by the request if no worker picks them up.
+# A job is identified by the kind, the hash of the filter parameters and the data
+# version, which is replaced on every change to the exported data, so a finished
+# job can be served as long as nothing has changed since it was built.
+EXPORT_FILENAMES = {
+    ExportJob.IMPACT_MODELS: 'ImpactModels {:%Y-%m-%d}.xlsx',
+    ExportJob.PARTICIPANTS: 'Participants {:%Y-%m-%d}.xlsx',
+}
+
+IMPACT_MODEL_EXPORT_PARAMS = ('sector', 'simulation_round', 'searchvalue')
+
+
+def get_export_job_timeout():
+    # running jobs older than this are considered crashed and run again
+    return getattr(settings, 'EXPORT_JOB_TIMEOUT', 60 * 60)
+
+
+def get_worker_timeout():
+    # pending jobs no worker has claimed after this are run by the request
+    return getattr(settings, 'EXPORT_JOB_WORKER_TIMEOUT', 2 * 60)
+
+
+def get_max_attempts():
+    return getattr(settings, 'EXPORT_JOB_MAX_ATTEMPTS', 3)
+
+
+def get_retry_delay(attempts):
+    return timedelta(seconds=getattr(settings, 'EXPORT_JOB_RETRY_DELAY', 60) * 2 ** (attempts - 1))
+
+
+def get_params_hash(params):
+    return hashlib.md5(json.dumps(sorted(params.items())).encode()).hexdigest()
+
+
+def get_export_filename(job):
+    return EXPORT_FILENAMES[job.kind].format(job.finished or datetime.now())
+
+
+def get_impact_models(params):
+    return filter_public_impact_models(params)
+
+
+def get_participants(params):
+    participants = User.objects.filter(userprofile__show_in_participant_list=True).order_by('last_name')
+    return participants.select_related('userprofile').prefetch_related('userprofile__responsible__simulation_round', 'userprofile__responsible__base_model__sector', 'userprofile__sector', 'userprofile__country')
+
+
+def write_export(job, res):
+    if job.kind == ExportJob.IMPACT_MODELS:
+        ImpactModelToXLSX(res, get_impact_models(job.params))
+    elif job.kind == ExportJob.PARTICIPANTS:
+        ParticpantModelToXLSX(res, get_participants(job.params))
+
+
+def get_export_job(kind, params):
+    """
+    Returns the job for the current data, a new one is queued if there is none.
+    Failed jobs are queued again after a delay, until they run out of attempts.
+    """
+    lookup = {'kind': kind, 'params_hash': get_params_hash(params), 'data_version': DataVersion.get_version(DataVersion.EXPORTS)}
+    job, created = ExportJob.objects.get_or_create(defaults={'params': params}, **lookup)
+    if job.status == ExportJob.FAILED:
+        if job.attempts < get_max_attempts() and (job.finished or job.created) < timezone.now() - get_retry_delay(job.attempts):
+            ExportJob.objects.filter(pk=job.pk).update(status=ExportJob.PENDING, file='')
+            job.status = ExportJob.PENDING
+    elif job.status == ExportJob.DONE and not job.file.storage.exists(job.file.name):
+        ExportJob.objects.filter(pk=job.pk).update(status=ExportJob.PENDING, file='', attempts=0)
+        job.status = ExportJob.PENDING
+        job.attempts = 0
+    return job
+
+
+def claim_export_job(pk=None):
+    stale = timezone.now() - timedelta(seconds=get_export_job_timeout())
+    with transaction.atomic():
+        jobs = ExportJob.objects.select_for_update(skip_locked=True).filter(
+            Q(status=ExportJob.PENDING) | Q(status=ExportJob.RUNNING, started__lt=stale))
+        if pk is not None:
+            jobs = jobs.filter(pk=pk)
+        job = jobs.first()
+        if job is not None:
+            job.status = ExportJob.RUNNING
+            job.started = timezone.now()
+            # counted here, so that crashed jobs use up their attempts as well
+            job.attempts += 1
+            job.save(update_fields=['status', 'started', 'attempts'])
+    return job
+
+
+def run_export_job(job):
+    try:
+        with tempfile.TemporaryFile() as res:
+            write_export(job, res)
+            res.seek(0)
+            job.file.save('%s-%s-%s.xlsx' % (job.kind, job.params_hash, job.data_version), File(res), save=False)
+    except Exception as e:
+        logger.exception('Export job %s failed', job.pk)
+        job.status = ExportJob.FAILED
+        job.error = str(e)
+    else:
+        job.status = ExportJob.DONE
+        job.error = ''
+    job.finished = timezone.now()
+    job.save(update_fields=['status', 'file', 'error', 'finished'])
+    if job.status == ExportJob.DONE:
+        delete_outdated_exports(job)
+    return job
+
+
+def run_next_export_job():
+    job = claim_export_job()
+    if job is not None:
+        run_export_job(job)
+    return job
+
+
+def run_unclaimed_export_job(job):
+    """
+    Runs the job in the request if no worker has tried to run it within
+    EXPORT_JOB_WORKER_TIMEOUT seconds, e.g. because none is running.
+    """
+    if job.status != ExportJob.PENDING or job.attempts or job.created >= timezone.now() - timedelta(seconds=get_worker_timeout()):
+        return job
+    claimed = claim_export_job(job.pk)
+    return run_export_job(claimed) if claimed is not None else job
+
+
+def delete_outdated_exports(job):
+    outdated = ExportJob.objects.filter(kind=job.kind, params_hash=job.params_hash, created__lt=job.created).exclude(data_version=job.data_version)
+    for outdated_job in outdated:
+        if outdated_job.file:
+            outdated_job.file.delete(save=False)
+        outdated_job.delete()
@@ -14,6 +14,7 @@ from isi_mip.climatemodels.models import PUBLICATION_DATE_CHOICES
 from isi_mip.climatemodels.widgets import (MyBooleanSelect, MyMultiSelect,
                                            MyTextInput, RefPaperWidget)
 from isi_mip.contrib.models import Country
+from isi_mip.sciencepaper.models import DOIMetadata
 
 ContactPersonFormset = inlineformset_factory(BaseImpactModel, ContactPerson,
                                              extra=1, max_num=2, min_num=1, fields='__all__',
@@ -79,6 +80,12 @@ class ImpactModelForm(forms.ModelForm):
         if not args['doi'] and not args['title']:
             return None
         if args['doi']:
+            # the fields left empty in the widget are completed from the stored metadata, without a lookup
+            metadata = DOIMetadata.get_metadata(args['doi'], fetch=False)
+            if metadata:
+                for key, value in metadata.get_paper_fields().items():
+                    if not args.get(key):
+                        args[key] = value
             try:
                 rp = ReferencePaper.objects.get_or_create(doi=args['doi'])[0]
                 rp.title = args['title']
@@ -0,0 +1,359 @@
+import base64
+import binascii
+import json
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.contrib.postgres.aggregates import ArrayAgg
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import DateField, Exists, OuterRef, Prefetch, Q, Value
+from django.db.models.functions import Coalesce
+from django.template.loader import render_to_string
+from django.utils.html import escape
+
+from isi_mip.climatemodels.cache import (INPUT_DATA_LISTING_NAMESPACE,
+                                         get_cached_listing)
+from isi_mip.climatemodels.models import (BaseImpactModel, ImpactModel,
+                                          InputData, OutputData)
+from isi_mip.climatemodels.search import filter_public_impact_models
+from isi_mip.contrib.models import UserProfile
+
+# The filters, serializers and table rows of the listings, which are shared by
+# the blocks rendering the first page and the api loading the following ones.
+
+DEFAULT_PER_PAGE = 20
+PARTICIPANTS_PER_PAGE = 50
+MAX_PER_PAGE = 500
+
+IMPACT_MODEL_SORT_FIELDS = {
+    'name': ('name', 'sector__name'),
+    'sector': ('sector__name', 'name'),
+}
+
+INPUT_DATA_PARAMS = ('protocol_relation', 'data_type', 'simulation_round', 'searchvalue', 'page', 'per_page', 'html')
+
+# (field, descending), the last field makes the ordering unique
+OUTPUT_DATA_ORDERING = (
+    ('sort_date', True),
+    ('sort_sector', False),
+    ('sort_model', False),
+    ('id', False),
+)
+
+
+def get_per_page(params, default=DEFAULT_PER_PAGE):
+    try:
+        per_page = int(params.get('per_page', default))
+    except ValueError:
+        per_page = default
+    return max(1, min(per_page, MAX_PER_PAGE))
+
+
+def get_sort_order(params, sort_fields, default):
+    sort = params.get('sort', default)
+    descending = sort.startswith('-')
+    fields = sort_fields.get(sort.lstrip('-'), sort_fields[default])
+    return ['-' + field if descending else field for field in fields]
+
+
+def filter_impact_models(params):
+    """
+    Returns the base impact models with at least one public impact model
+    matching the sector, simulation_round and searchvalue parameters.
+    """
+    public_impact_models = filter_public_impact_models(params).filter(base_model=OuterRef('pk'))
+    base_models = BaseImpactModel.objects.filter(Exists(public_impact_models))
+    return base_models.order_by(*get_sort_order(params, IMPACT_MODEL_SORT_FIELDS, 'name'))
+
+
+def prefetch_impact_models(base_models):
+    # the relations used by serialize_impact_model
+    return base_models.select_related('sector').prefetch_related(
+        'region',
+        Prefetch('impact_model', to_attr='public_impact_models', queryset=(
+            ImpactModel.objects.filter(public=True).select_related('simulation_round'))),
+    )
+
+
+def paginate_impact_models(params):
+    base_models = prefetch_impact_models(filter_impact_models(params))
+    paginator = Paginator(base_models, get_per_page(params))
+    return paginator.get_page(params.get('page'))
+
+
+def serialize_impact_model(base_model):
+    return {
+        'id': base_model.id,
+        'name': base_model.name,
+        'url': base_model.relative_url(None, None),
+        'sector': base_model.sector.name,
+        'simulation_rounds': [
+            impact_model.simulation_round.name
+            for impact_model in base_model.public_impact_models if impact_model.simulation_round
+        ],
+        'regions': [region.name for region in base_model.region.all()],
+    }
+
+
+def impact_model_row(impact_model):
+    # the row format of widgets/table.html, the links are relative to the ImpactModelsPage
+    return {
+        'cols': [
+            {'texts': ["<a href='details/{}/'>{}</a>".format(impact_model['id'], escape(impact_model['name']))]},
+            {'texts': [escape(name) for name in impact_model['simulation_rounds']]},
+            {'texts': [escape(impact_model['sector'])]},
+            {'texts': [escape(name) for name in impact_model['regions']]},
+        ],
+    }
+
+
+def filter_participants(params):
+    """
+    Returns the users shown in the participant list, filtered by the searchvalue
+    parameter, with the sectors of their impact models and their own sectors.
+    """
+    participants = User.objects.filter(userprofile__show_in_participant_list=True)
+    for term in params.get('searchvalue', '').split():
+        matching_models = UserProfile.responsible.through.objects.filter(userprofile__user=OuterRef('pk')).filter(
+            Q(impactmodel__base_model__name__icontains=term) | Q(impactmodel__base_model__sector__name__icontains=term) |
+            Q(impactmodel__simulation_round__name__icontains=term))
+        matching_sectors = UserProfile.sector.through.objects.filter(userprofile__user=OuterRef('pk'), sector__name__icontains=term)
+        participants = participants.filter(
+            Q(first_name__icontains=term) | Q(last_name__icontains=term) | Q(email__icontains=term) |
+            Q(userprofile__institute__icontains=term) | Q(userprofile__country__name__icontains=term) |
+            Exists(matching_models) | Exists(matching_sectors))
+    # the searches use subqueries, so the joins of the aggregates stay unfiltered
+    return participants.annotate(
+        model_sectors=ArrayAgg('userprofile__responsible__base_model__sector__name', distinct=True,
+                               filter=Q(userprofile__responsible__base_model__sector__isnull=False)),
+        profile_sectors=ArrayAgg('userprofile__sector__name', distinct=True, filter=Q(userprofile__sector__isnull=False)),
+    ).order_by('last_name', 'id')
+
+
+def paginate_participants(params):
+    participants = filter_participants(params).select_related('userprofile__country').prefetch_related(
+        Prefetch('userprofile__responsible', queryset=ImpactModel.objects.select_related('base_model', 'simulation_round')))
+    paginator = Paginator(participants, get_per_page(params, PARTICIPANTS_PER_PAGE))
+    return paginator.get_page(params.get('page'))
+
+
+def serialize_participant(participant):
+    userprofile = participant.userprofile
+    return {
+        'id': participant.id,
+        'name': userprofile.name,
+        'email': participant.email,
+        'institute': userprofile.institute or '',
+        'country': userprofile.country and userprofile.country.name or '',
+        'impact_models': [{
+            'id': impact_model.base_model.id,
+            'name': impact_model.base_model.name,
+            'simulation_round': impact_model.simulation_round.name,
+        } for impact_model in userprofile.responsible.all()],
+        # the sectors of the impact models, or the ones of the profile for users without models
+        'sectors': sorted(participant.model_sectors or participant.profile_sectors),
+    }
+
+
+def participant_row(participant):
+    country = participant['country'] and " (%s)" % participant['country'] or ''
+    return {
+        'cols': [
+            {'texts': [escape(participant['name'])]},
+            {'texts': ["<a href='mailto:{0}'>{0}</a>".format(escape(participant['email']))]},
+            {'texts': [escape("{0}{1}".format(participant['institute'], country))]},
+            {'texts': ["<a href='/impactmodels/details/{}/'>{} ({})</a><br>".format(model['id'], escape(model['name']), escape(model['simulation_round']))
+                       for model in participant['impact_models']]},
+            {'texts': ["{0}<br>".format(escape(sector)) for sector in participant['sectors']]},
+        ],
+    }
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values, cls=DjangoJSONEncoder).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, ValueError):
+        return None
+
+
+def keyset_paginate(queryset, ordering, params):
+    """
+    Returns the rows after the cursor parameter and the cursor of the next page.
+
+    Unlike offset pagination, the database does not need to skip the preceding
+    rows, so every page costs the same no matter how far the client has scrolled.
+    """
+    per_page = get_per_page(params)
+    queryset = queryset.order_by(*['-' + field if descending else field for field, descending in ordering])
+    values = decode_cursor(params.get('cursor', ''))
+    if isinstance(values, list) and len(values) == len(ordering):
+        after = Q()
+        equal = {}
+        for (field, descending), value in zip(ordering, values):
+            after |= Q(**equal, **{'%s__%s' % (field, 'lt' if descending else 'gt'): value})
+            equal[field] = value
+        try:
+            queryset = queryset.filter(after)
+        except (ValueError, TypeError, ValidationError):
+            # a cursor with values of the wrong types starts at the first page
+            pass
+    rows = list(queryset[:per_page + 1])
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor([getattr(rows[-1], field) for field, descending in ordering])
+    return rows, next_cursor
+
+
+def filter_output_data(params):
+    output_data = OutputData.objects.all()
+    if params.get('sector'):
+        output_data = output_data.filter(model__base_model__sector__name=params['sector'])
+    if params.get('simulation_round'):
+        output_data = output_data.filter(model__simulation_round__name=params['simulation_round'])
+    for term in params.get('searchvalue', '').split():
+        matching_drivers = OutputData.drivers.through.objects.filter(
+            outputdata=OuterRef('pk'), inputdata__name__icontains=term)
+        output_data = output_data.filter(
+            Q(model__base_model__name__icontains=term) | Q(model__base_model__sector__name__icontains=term) |
+            Q(model__simulation_round__name__icontains=term) | Q(experiments__icontains=term) |
+            Q(drivers_list__icontains=term) | Exists(matching_drivers))
+    # the keyset needs values to compare with, so missing ones are replaced
+    return output_data.annotate(
+        sort_date=Coalesce('date', Value(date.min, output_field=DateField())),
+        sort_sector=Coalesce('model__base_model__sector__name', Value('')),
+        sort_model=Coalesce('model__base_model__name', Value('')),
+    )
+
+
+def paginate_output_data(params):
+    output_data = filter_output_data(params).select_related(
+        'model__base_model__sector', 'model__simulation_round').prefetch_related('drivers')
+    return keyset_paginate(output_data, OUTPUT_DATA_ORDERING, params)
+
+
+def serialize_output_data(output_data):
+    impact_model = output_data.model
+    return {
+        'id': output_data.id,
+        'sector': impact_model and impact_model.base_model.sector.name,
+        'model': impact_model and impact_model.base_model.name,
+        'model_url': impact_model and '/impactmodels/details/%s/#tab_%s' % (
+            impact_model.base_model.id, impact_model.simulation_round and impact_model.simulation_round.slug),
+        'simulation_round': impact_model and impact_model.simulation_round and impact_model.simulation_round.name,
+        'experiments': output_data.experiments,
+        'drivers': [output_data.drivers_list] if output_data.drivers_list else [driver.name for driver in output_data.drivers.all()],
+        'date': output_data.date,
+    }
+
+
+def output_data_row(output_data):
+    model = ''
+    if output_data['model']:
+        model = "<a href='{}'>{}</a>".format(output_data['model_url'], escape(output_data['model']))
+    return {
+        'cols': [
+            {'texts': [escape(output_data['sector'] or '')]},
+            {'texts': [model]},
+            {'texts': [escape(output_data['simulation_round'] or '')]},
+            {'texts': [escape(output_data['experiments'] or '')]},
+            {'texts': [escape(driver) for driver in output_data['drivers']]},
+            {'texts': [output_data['date'] or '']},
+        ],
+    }
+
+
+def filter_input_data(params):
+    input_data = InputData.objects.all()
+    if params.get('protocol_relation'):
+        # the table selector sends the label, the api accepts both
+        protocol_relations = {label: value for value, label in InputData.PROTOCOL_RELATION_CHOICES}
+        input_data = input_data.filter(protocol_relation=protocol_relations.get(params['protocol_relation'], params['protocol_relation']))
+    if params.get('data_type'):
+        input_data = input_data.filter(data_type__name=params['data_type'])
+    if params.get('simulation_round'):
+        input_data = input_data.filter(simulation_round__name=params['simulation_round'])
+    for term in params.get('searchvalue', '').split():
+        matching_rounds = InputData.simulation_round.through.objects.filter(
+            inputdata=OuterRef('pk'), simulationround__name__icontains=term)
+        input_data = input_data.filter(
+            Q(name__icontains=term) | Q(description__icontains=term) |
+            Q(data_type__name__icontains=term) | Exists(matching_rounds))
+    return input_data
+
+
+def serialize_input_data(input_data):
+    return {
+        'id': input_data.id,
+        'name': input_data.name,
+        'protocol_relation': input_data.get_protocol_relation_display(),
+        'data_type': input_data.data_type and input_data.data_type.name,
+        'simulation_rounds': [simulation_round.name for simulation_round in input_data.simulation_round.all()],
+        'description': input_data.description,
+        'description_html': input_data.description_html,
+    }
+
+
+def input_data_row(input_data):
+    # the links are relative to the GettingStartedPage with the input data
+    return {
+        'cols': [
+            {'texts': ["<a href='details/{}'>{}</a>".format(input_data['id'], escape(input_data['name']))]},
+            {'texts': [input_data['protocol_relation']]},
+            {'texts': [escape(input_data['data_type'] or '')]},
+            {'texts': [escape(name) for name in input_data['simulation_rounds']]},
+            {'texts': [input_data['description_html']]},
+        ],
+    }
+
+
+def build_input_data_listing(params):
+    input_data = filter_input_data(params).select_related('data_type').prefetch_related('simulation_round')
+    page = Paginator(input_data, get_per_page(params)).get_page(params.get('page'))
+    results = [serialize_input_data(idata) for idata in page.object_list]
+    listing = {
+        'count': page.paginator.count,
+        'page': page.number,
+        'numberofpages': page.paginator.num_pages,
+        'results': results,
+    }
+    if params.get('html'):
+        listing['html'] = render_to_string('widgets/table-rows.html', {'body': {'rows': [input_data_row(idata) for idata in results]}})
+    return listing
+
+
+def get_input_data_listing(params):
+    params = {key: str(params[key]) for key in INPUT_DATA_PARAMS if params.get(key)}
+    return get_cached_listing(INPUT_DATA_LISTING_NAMESPACE, params, build_input_data_listing)
+
+
+def serialize_impact_model_round(impact_model):
+    return {
+        'id': impact_model.id,
+        'base_model': impact_model.base_model_id,
+        'name': impact_model.base_model and impact_model.base_model.name,
+        'sector': impact_model.base_model and impact_model.base_model.sector.name,
+        'simulation_round': impact_model.simulation_round and impact_model.simulation_round.name,
+        'version': impact_model.version,
+        'model_license': impact_model.model_license,
+        'model_url': impact_model.model_url,
+        'data_download': impact_model.data_download,
+        'doi': impact_model.doi,
+        'updated': impact_model.updated,
+    }
+
+
+def serialize_impact_model_information(information):
+    return {
+        'impact_model': information.impact_model_id,
+        'technical_information': information.technical_information,
+        'input_data_information': information.input_data_information,
+        'other_information': information.other_information,
+        'sector_specific_information': information.sector_specific_information,
+    }
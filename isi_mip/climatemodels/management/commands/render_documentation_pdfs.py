@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+
+from isi_mip.climatemodels.documentation import (generate_pdf_zip,
+                                                 get_documentation_impact_models,
+                                                 render_pdfs)
+from isi_mip.climatemodels.models import (BaseImpactModel, DataVersion,
+                                          ImpactModel)
+
+
+def get_documentation_stamp():
+    # changes with every change that makes pdfs outdated
+    return (
+        DataVersion.get_version(DataVersion.DOCUMENTATION),
+        ImpactModel.objects.aggregate(updated=Max('updated'))['updated'],
+        BaseImpactModel.objects.aggregate(updated=Max('updated'))['updated'],
+    )
+
+
+class Command(BaseCommand):
+    help = 'Renders the documentation pdfs of a simulation round or sector, which are not current'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--simulation-round', help='Name of the simulation round')
+        parser.add_argument('--sector', help='Name of the sector')
+        parser.add_argument('--processes', type=int, help='Number of worker processes, defaults to the number of cores')
+        parser.add_argument('--all', action='store_true', help='Include impact models which are not public')
+        parser.add_argument('--output', help='Write the pdfs to this zip file')
+        parser.add_argument('--watch', action='store_true', help='Keep running and render the pdfs again when the documentation changes')
+        parser.add_argument('--sleep', type=float, default=60, help='Seconds between the checks for changes')
+
+    def handle(self, *args, **options):
+        if options['output']:
+            impact_models = self.get_impact_models(options)
+            with open(options['output'], 'wb') as output:
+                for chunk in generate_pdf_zip(impact_models, options['processes']):
+                    output.write(chunk)
+            self.stdout.write('Wrote %s' % options['output'])
+            return
+        if not options['watch']:
+            self.render(options)
+            return
+        last_stamp = None
+        while True:
+            # read before rendering, so that changes meanwhile are rendered with the next pass
+            stamp = get_documentation_stamp()
+            if stamp != last_stamp:
+                self.render(options)
+                last_stamp = stamp
+            time.sleep(options['sleep'])
+
+    def get_impact_models(self, options):
+        return get_documentation_impact_models(options['simulation_round'], options['sector'], public=not options['all'])
+
+    def render(self, options):
+        for impact_model, name in render_pdfs(self.get_impact_models(options), options['processes']):
+            self.stdout.write('%s: %s' % (impact_model, name))
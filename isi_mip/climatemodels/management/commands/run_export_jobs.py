@@ -0,0 +1,23 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from isi_mip.climatemodels.exports import run_next_export_job
+
+
+class Command(BaseCommand):
+    help = 'Generates the queued impact model and participant exports'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty')
+        parser.add_argument('--sleep', type=float, default=5, help='Seconds to wait for new jobs')
+
+    def handle(self, *args, **options):
+        while True:
+            job = run_next_export_job()
+            if job is not None:
+                self.stdout.write('%s: %s' % (job, job.file.name or job.error))
+            elif options['once']:
+                break
+            else:
+                time.sleep(options['sleep'])
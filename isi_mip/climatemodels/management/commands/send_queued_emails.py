@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from isi_mip.climatemodels.outbox import send_queued_emails
+
+
+class Command(BaseCommand):
+    help = 'Sends the queued confirmation and invitation emails'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty')
+        parser.add_argument('--sleep', type=float, default=5, help='Seconds to wait for new emails')
+        parser.add_argument('--batch-size', type=int, help='Emails sent over one connection')
+
+    def handle(self, *args, **options):
+        while True:
+            emails = send_queued_emails(options['batch_size'])
+            for email in emails:
+                self.stdout.write(email.error and '%s: %s' % (email, email.error) or str(email))
+            if not emails:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
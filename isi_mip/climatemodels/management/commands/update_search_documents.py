@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from isi_mip.climatemodels.models import BaseImpactModel
+from isi_mip.climatemodels.search import update_search_documents
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the stale and missing impact model search documents'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Rebuild all search documents')
+        parser.add_argument('--watch', action='store_true', help='Keep running and rebuild the documents which become stale')
+        parser.add_argument('--sleep', type=float, default=60, help='Seconds between the checks for stale documents')
+
+    def handle(self, *args, **options):
+        base_model_ids = BaseImpactModel.objects.values_list('pk', flat=True) if options['all'] else None
+        count = update_search_documents(base_model_ids)
+        self.stdout.write('%d search documents updated' % count)
+        while options['watch']:
+            time.sleep(options['sleep'])
+            count = update_search_documents()
+            if count:
+                self.stdout.write('%d search documents updated' % count)
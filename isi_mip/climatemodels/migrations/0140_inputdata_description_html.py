@@ -0,0 +1,25 @@
+from django.db import migrations, models
+from django.utils.html import urlize
+
+
+def set_description_html(apps, schema_editor):
+    InputData = apps.get_model('climatemodels', 'InputData')
+    for input_data in InputData.objects.all():
+        input_data.description_html = urlize(input_data.description or '')
+        input_data.save(update_fields=['description_html'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('climatemodels', '0139_set_information_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inputdata',
+            name='description_html',
+            field=models.TextField(blank=True, default='', editable=False, help_text='The urlized description, updated on save.'),
+        ),
+        migrations.RunPython(set_description_html, migrations.RunPython.noop),
+    ]
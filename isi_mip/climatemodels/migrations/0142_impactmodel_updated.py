@@ -0,0 +1,18 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('climatemodels', '0141_dataversion_exportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='impactmodel',
+            name='updated',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, help_text='Also set when the documentation of the impact model changes.'),
+            preserve_default=False,
+        ),
+    ]
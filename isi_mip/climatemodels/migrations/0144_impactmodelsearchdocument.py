@@ -0,0 +1,30 @@
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('climatemodels', '0143_outgoingemail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImpactModelSearchDocument',
+            fields=[
+                ('base_model', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='climatemodels.baseimpactmodel')),
+                ('title', models.TextField(blank=True)),
+                ('keywords', models.TextField(blank=True, help_text='Sector, simulation rounds, regions and people.')),
+                ('text', models.TextField(blank=True, help_text='Descriptions, documentation and output data.')),
+                ('search_vector', django.contrib.postgres.search.SearchVectorField(null=True)),
+                ('public', models.BooleanField(default=False)),
+                ('stale', models.BooleanField(default=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='climatemode_search__08cc1e_gin')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+
+def mark_search_documents_stale(apps, schema_editor):
+    # the search vectors of the impact models are set when the documents are rebuilt
+    ImpactModelSearchDocument = apps.get_model('climatemodels', 'ImpactModelSearchDocument')
+    ImpactModelSearchDocument.objects.update(stale=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('climatemodels', '0144_impactmodelsearchdocument'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='impactmodel',
+            name='search_text',
+            field=models.TextField(blank=True, editable=False, help_text='Set with the search document of the base model.'),
+        ),
+        migrations.AddField(
+            model_name='impactmodel',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='impactmodel',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='climatemode_search__e5fab4_gin'),
+        ),
+        migrations.RunPython(mark_search_documents_stale, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('climatemodels', '0145_impactmodel_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='baseimpactmodel',
+            name='updated',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('climatemodels', '0147_exportjob_attempts'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='outgoingemail',
+            name='attachments',
+            field=models.JSONField(blank=True, default=list, help_text='The filename, the base64 encoded content and the mimetype of every attachment.'),
+        ),
+    ]
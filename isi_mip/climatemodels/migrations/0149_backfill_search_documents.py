@@ -0,0 +1,62 @@
+import re
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+
+def normalize_search_text(text):
+    return re.sub(r'[\W_]+', ' ', text).strip()
+
+
+def backfill_search_documents(apps, schema_editor):
+    # The searchvalue filter is complete after this, the documents only get the
+    # names and descriptions. They stay stale, so that the update_search_documents
+    # worker adds the documentation and the output data.
+    BaseImpactModel = apps.get_model('climatemodels', 'BaseImpactModel')
+    ImpactModel = apps.get_model('climatemodels', 'ImpactModel')
+    ImpactModelSearchDocument = apps.get_model('climatemodels', 'ImpactModelSearchDocument')
+    config = getattr(settings, 'IMPACT_MODEL_SEARCH_CONFIG', 'english')
+    base_models = BaseImpactModel.objects.select_related('sector').prefetch_related(
+        'region', 'contactperson_set', 'impact_model__simulation_round')
+    documents, impact_models = [], []
+    for base_model in base_models:
+        regions = [region.name for region in base_model.region.all()]
+        contact_persons = list(base_model.contactperson_set.all())
+        keywords = [base_model.sector.name] + regions
+        keywords += ['%s %s %s' % (person.name or '', person.institute or '', person.email or '') for person in contact_persons]
+        for impact_model in base_model.impact_model.all():
+            values = [base_model.name, base_model.sector.name]
+            if impact_model.simulation_round:
+                values.append(impact_model.simulation_round.name)
+                keywords.append(impact_model.simulation_round.name)
+            values += regions
+            for person in contact_persons:
+                values += [person.name or '', person.email or '']
+            impact_model.search_text = normalize_search_text(' '.join(values))
+            impact_models.append(impact_model)
+        documents.append(ImpactModelSearchDocument(
+            base_model_id=base_model.pk,
+            title=base_model.name,
+            keywords='\n'.join(value for value in keywords if value),
+            text=base_model.short_description or '',
+            public=any(impact_model.public for impact_model in base_model.impact_model.all()),
+            stale=True,
+        ))
+    ImpactModelSearchDocument.objects.bulk_create(documents, batch_size=100, ignore_conflicts=True)
+    ImpactModelSearchDocument.objects.filter(search_vector__isnull=True).update(
+        search_vector=SearchVector('title', weight='A', config=config) + SearchVector('keywords', weight='B', config=config)
+        + SearchVector('text', weight='C', config=config))
+    ImpactModel.objects.bulk_update(impact_models, ['search_text'], batch_size=100)
+    ImpactModel.objects.update(search_vector=SearchVector('search_text', config='simple'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('climatemodels', '0148_outgoingemail_attachments'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_search_documents, migrations.RunPython.noop),
+    ]
@@ -1,14 +1,21 @@
 import os
-from collections import OrderedDict
+from collections import OrderedDict, defaultdict
+from uuid import uuid4
 
 import django
 from django.apps import apps
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import FileExtensionValidator
 from django.db import models
 from django.db.models import JSONField
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
 from django.template.defaultfilters import filesizeformat
+from django.utils import timezone
+from django.utils.html import urlize
 from django.utils.safestring import mark_safe
 from django.utils.text import slugify
 from django_filters.fields import ChoiceField, MultipleChoiceField
@@ -19,10 +26,21 @@ from wagtail.snippets.models import register_snippet
 
 from isi_mip.choiceorotherfield.fields import MyTypedChoiceField
 from isi_mip.choiceorotherfield.models import ChoiceOrOtherField
+from isi_mip.climatemodels.cache import (base_model_changed,
+                                         impact_model_changed,
+                                         impact_model_m2m_changed,
+                                         impact_model_related_changed,
+                                         input_data_listing_changed,
+                                         output_data_drivers_changed,
+                                         reference_paper_changed,
+                                         shared_data_changed)
 from isi_mip.climatemodels.fields import MyModelSingleChoiceField
 from isi_mip.climatemodels.impact_model_blocks import (
     IMPACT_MODEL_QUESTION_BLOCKS, BiodiversityModelOutputChoiceBlock,
     FieldsetBlock)
+from isi_mip.climatemodels.schema import (clear_question_schema,
+                                          get_question_schema)
+from isi_mip.climatemodels.transactions import CommitQueue
 from isi_mip.climatemodels.widgets import MyBooleanSelect, MyMultiSelect
 from isi_mip.sciencepaper.models import Paper
 
@@ -172,6 +190,7 @@ class InputData(models.Model):
     variables = models.ManyToManyField(ClimateVariable, blank=True, help_text="The variables are filtered based on the data type. To see variables of a different data type, please change and save data type first.")
     simulation_round = models.ManyToManyField(SimulationRound, blank=True, related_name='simulationrounds')
     description = models.TextField(null=True, blank=True, default='')
+    description_html = models.TextField(blank=True, default='', editable=False, help_text="The urlized description, updated on save.")
     specification = models.TextField(null=True, blank=True, default='')
     data_source = models.TextField(null=True, blank=True, default='')
     caveats = models.TextField(null=True, blank=True)
@@ -181,15 +200,24 @@ class InputData(models.Model):
     created = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return '%s (%s)' % (self.name, ", ".join(self.simulation_round.values_list('name', flat=True)))
+        # iterate over all() so that a prefetched simulation_round is used
+        return '%s (%s)' % (self.name, ", ".join(simulation_round.name for simulation_round in self.simulation_round.all()))
 
     class Meta:
         verbose_name_plural = 'Input data'
         ordering = ('-created', 'name',)
 
-    def pretty(self):
+    def save(self, *args, **kwargs):
+        self.description_html = urlize(self.description or '')
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def get_parent_page():
         from isi_mip.pages.models import GettingStartedPage
-        page = GettingStartedPage.objects.get(is_input_data_parent_page=True)
+        return GettingStartedPage.objects.get(is_input_data_parent_page=True)
+
+    def pretty(self, page=None):
+        page = page or self.get_parent_page()
         url = page.url + page.reverse_subpage('details', kwargs={'id': self.pk})
         pretty = "<a href='{url}'>{name}</a>".format(name=self.name, url=url)
         return pretty
@@ -292,6 +320,7 @@ class BaseImpactModel(index.Indexed, models.Model):
     short_description = models.TextField(
         null=True, blank=True, default='', verbose_name="Short model description (all rounds)",
         help_text="This short description should assist other researchers in getting an understanding of your model, including the main differences between model versions used for different ISIMIP simulation rounds.")
+    updated = models.DateTimeField(auto_now=True)
 
     search_fields = [
         index.SearchField('name', partial_match=True, boost=10),
@@ -381,12 +410,14 @@ class ImpactModel(models.Model):
         help_text="")
 
     public = models.BooleanField(default=False)
-
-
+    updated = models.DateTimeField(auto_now=True, help_text="Also set when the documentation of the impact model changes.")
+    search_text = models.TextField(blank=True, editable=False, help_text="Set with the search document of the base model.")
+    search_vector = SearchVectorField(null=True, editable=False)
 
     class Meta:
         unique_together = ('base_model', 'simulation_round')
         ordering = ('base_model', 'simulation_round')
+        indexes = [GinIndex(fields=['search_vector'])]
 
     def __str__(self):
         return "%s (%s, %s)" % (self.base_model and self.base_model.name or self.id, self.base_model and self.base_model.sector or '', self.simulation_round)
@@ -459,8 +490,10 @@ class ImpactModel(models.Model):
         cpers = [(x.name, x.pretty()) for x in self.impact_model_responsible.all()]
         if self.additional_persons_involved:
             cpers.append(['Additional persons involved', self.additional_persons_involved])
-        if self.other_references.exists():
-            other_references = "<ul>%s</ul>" % "".join(["<li>%s</li>" % x.entry_with_link() for x in self.other_references.all()])
+        # evaluate all() once, so that prefetched references are used
+        other_references = list(self.other_references.all())
+        if other_references:
+            other_references = "<ul>%s</ul>" % "".join(["<li>%s</li>" % x.entry_with_link() for x in other_references])
         else:
             other_references = None
         return [
@@ -499,25 +532,24 @@ class ImpactModelInformation(models.Model):
         return "{}".format(self.impact_model)
 
 
-    def values_to_tuples(self):
+    def values_to_tuples(self, resolver=None):
+        if resolver is None:
+            resolver = FieldValueResolver([self])
         tuples = []
         for information_type, name in INFORMATION_TYPE_CHOICES:
-            if information_type == 'sector_specific_information':
-                information = ImpactModelQuestion.objects.filter(sector=self.impact_model.base_model.sector).first()
-            else:
-                information = ImpactModelQuestion.objects.filter(information_type=information_type).first()
+            information = resolver.get_question(information_type, self.impact_model.base_model.sector_id)
             if information:
-                for fieldset in information.question_group_list:
+                for fieldset in information.schema.fieldsets:
                     values = []
-                    for field in fieldset[1]['fields']:
-                        verbose_name = field['verbose_name']
-                        value = getattr(self, information_type).get(field['name'], None)
-                        value = information.get_field_value(field['field_type'], value)
+                    for question in fieldset.questions:
+                        verbose_name = question.verbose_name
+                        value = getattr(self, information_type).get(question.name, None)
+                        value = resolver.resolve(question.field_type, value)
                         if value:
-                            if field['help_text']:
-                                verbose_name = generate_helptext(field['help_text'], verbose_name)
+                            if question.help_text:
+                                verbose_name = generate_helptext(question.help_text, verbose_name)
                             values.append((verbose_name, value))
-                    tuples.append((fieldset[0], values))
+                    tuples.append((fieldset.heading, values))
         # raise Exception(tuples)
         return tuples
 
@@ -567,11 +599,14 @@ class ImpactModelQuestion(models.Model):
         kwargs['impact_model_question'] = self
         return ImpactModelQuestionForm(*args, **kwargs)
 
+    @property
+    def schema(self):
+        return get_question_schema(self)
+
     def get_field_options(self, question):
-        field = question.value
-        options = {"label": field['question']}
-        options["help_text"] = field['help_text']
-        options["required"] = field['required']
+        options = {"label": question.verbose_name}
+        options["help_text"] = question.help_text
+        options["required"] = question.required
         # options["initial"] = field.default_value
         return options
 
@@ -579,116 +614,187 @@ class ImpactModelQuestion(models.Model):
     def create_field(self, question, simulation_round, fieldset):
         options = self.get_field_options(question)
         # options['fieldset'] = fieldset
-        if question.block_type == 'textarea':
+        if question.field_type == 'textarea':
             return django.forms.CharField(widget=django.forms.Textarea, **options)
-        elif question.block_type == 'single_line':
+        elif question.field_type == 'single_line':
             return django.forms.CharField(**options)
-        elif question.block_type == 'choice':
-            choices = question.value['choices']
-            options["choices"] = [(choice['label'], choice['name']) for choice in choices]
-            return MyTypedChoiceField(widget=MyMultiSelect(allowcustom=question.value['allow_custom'], multiselect=False), **options)
-        elif question.block_type == 'multiple_choice':
-            choices = question.value['choices']
-            options["choices"] = [(choice['label'], choice['name']) for choice in choices]
+        elif question.field_type == 'choice':
+            options["choices"] = list(question.choices)
+            return MyTypedChoiceField(widget=MyMultiSelect(allowcustom=question.allow_custom, multiselect=False), **options)
+        elif question.field_type == 'multiple_choice':
+            options["choices"] = list(question.choices)
             return django.forms.MultipleChoiceField(widget=MyMultiSelect(multiselect=True), **options)
-        elif question.block_type == 'model_single_choice':
+        elif question.field_type == 'model_single_choice':
             return MyModelSingleChoiceField(allowcustom=True, queryset=SpatialAggregation.objects.all())
-        elif question.block_type == 'biodiversity_model_output_choice':
+        elif question.field_type == 'biodiversity_model_output_choice':
             choices = [(biodiversity.pk, biodiversity.name) for biodiversity in BiodiversityModelOutput.objects.all().distinct()]
             return django.forms.MultipleChoiceField(
                 widget=MyMultiSelect(allowcustom=True, multiselect=True),
                 choices=choices,
                 **options)
-        elif question.block_type == 'climate_variable_choice':
+        elif question.field_type == 'climate_variable_choice':
             choices = [(climate_variable.pk, climate_variable.name) for climate_variable in ClimateVariable.objects.filter(inputdata__data_type__is_climate_data_type=True, inputdata__simulation_round=simulation_round).distinct()]
             return django.forms.MultipleChoiceField(
                 widget=MyMultiSelect(allowcustom=False, multiselect=True),
                 choices=choices,
                 **options)
-        elif question.block_type == 'input_data_choice':
-            data_type = question.value['data_type']
+        elif question.field_type == 'input_data_choice':
+            data_type = question.data_type
             choices = [(input_data.pk, input_data.name) for input_data in InputData.objects.filter(data_type__pk=data_type, simulation_round=simulation_round, protocol_relation=InputData.PROTOCOL_DATA)]
             return django.forms.MultipleChoiceField(
                 widget=MyMultiSelect(allowcustom=False, multiselect=True),
                 choices=choices,
                 **options)
-        elif question.block_type == 'true_false':
-            return django.forms.BooleanField(widget=MyBooleanSelect(nullable=question.value['nullable']), **options)
-        raise Exception(question.block_type)
+        elif question.field_type == 'true_false':
+            return django.forms.BooleanField(widget=MyBooleanSelect(nullable=question.nullable), **options)
+        raise Exception(question.field_type)
 
     def get_field_value(self, field_type, values, make_pretty=True):
-        if values is None:
-            return ''
-        if field_type == 'input_data_choice':
-            return ", ".join([make_pretty and input_data.pretty() or str(input_data) for input_data in InputData.objects.filter(pk__in=values)])
-        elif field_type == 'model_single_choice':
-            return SpatialAggregation.objects.get(pk=values).name
-        elif field_type == 'climate_variable_choice':
-            return ", ".join([make_pretty and climate_variable.pretty() or str(climate_variable) for climate_variable in ClimateVariable.objects.filter(pk__in=values)])
-        elif field_type == 'biodiversity_model_output_choice':
-            return ", ".join([biodiversity.name for biodiversity in BiodiversityModelOutput.objects.filter(pk__in=values)])
-        if type(values) is bool:
-            return 'Yes' if values is True else 'No' if values is False else ''
-        return values
+        # use a FieldValueResolver directly when rendering more than one value
+        return FieldValueResolver(make_pretty=make_pretty).resolve(field_type, values)
 
 
     def formfields(self, simulation_round):
         formfields = OrderedDict()
-
-        for fieldset in self.questions:
-            for question in fieldset.value['questions']:
-                fieldset_name = fieldset.value['heading']
-                fieldset_description = fieldset.value['description']
-                clean_name = question.value['name']
-                formfields[clean_name] =  self.create_field(question, simulation_round, fieldset_name)
+        for fieldset in self.schema.fieldsets:
+            for question in fieldset.questions:
+                formfields[question.name] = self.create_field(question, simulation_round, fieldset.heading)
         return formfields
 
     @property
     def fields(self):
-        fields = []
-        for fieldset in self.questions:
-            for question in fieldset.value['questions']:
-                fields.append({
-                    'name': question.value['name'],
-                    'verbose_name': question.value['question'],
-                    'help_text': question.value['help_text'],
-                    'field_type': question.block_type,
-                })
-        return fields
+        return [question_to_dict(question) for question in self.schema.questions]
 
     @property
     def fieldset(self):
-        fieldset_list = []
-        for fieldset in self.questions:
-            fields = []
-            for question in fieldset.value['questions']:
-                fields.append(question.value['name'])
-            # raise Exception(formfields)
-            fieldset_list.append((fieldset.value['heading'], {
-                'fields': fields,
-                'description': fieldset.value['description'],
-            }))
-        return fieldset_list
+        return [(fieldset.heading, {
+            'fields': [question.name for question in fieldset.questions],
+            'description': fieldset.description,
+        }) for fieldset in self.schema.fieldsets]
 
     @property
     def question_group_list(self):
-        fieldset_list = []
-        for fieldset in self.questions:
-            fields = []
-            for question in fieldset.value['questions']:
-                fields.append({
-                    'name': question.value['name'],
-                    'verbose_name': question.value['question'],
-                    'help_text': question.value['help_text'],
-                    'field_type': question.block_type,
-                })
-            # raise Exception(formfields)
-            fieldset_list.append((fieldset.value['heading'], {
-                'fields': fields,
-                'description': fieldset.value['description'],
-            }))
-        return fieldset_list
+        return [(fieldset.heading, {
+            'fields': [question_to_dict(question) for question in fieldset.questions],
+            'description': fieldset.description,
+        }) for fieldset in self.schema.fieldsets]
+
+
+def question_to_dict(question):
+    return {
+        'name': question.name,
+        'verbose_name': question.verbose_name,
+        'help_text': question.help_text,
+        'field_type': question.field_type,
+    }
+
+
+class FieldValueResolver:
+    """
+    Renders the values stored in the ImpactModelInformation JSON fields.
+
+    The primary keys referenced by the choice questions of all collected
+    informations are gathered first, so that every choice model is fetched
+    with a single query, no matter how many impact models or fields are rendered.
+    """
+    CHOICE_FIELD_TYPES = (
+        'input_data_choice',
+        'climate_variable_choice',
+        'biodiversity_model_output_choice',
+        'model_single_choice',
+    )
 
+    def __init__(self, informations=(), make_pretty=True):
+        self.make_pretty = make_pretty
+        self._questions = None
+        self._input_data_page = None
+        self._pks = defaultdict(set)
+        self._fetched = defaultdict(set)
+        self._labels = defaultdict(dict)
+        self._positions = defaultdict(dict)
+        for information in informations:
+            self.collect(information)
+
+    def get_question(self, information_type, sector_id=None):
+        if self._questions is None:
+            self._questions = {'sectors': {}, 'types': {}}
+            # mimics the .first() lookups, the queryset uses the default ordering
+            for question in ImpactModelQuestion.objects.all():
+                if question.sector_id is not None:
+                    self._questions['sectors'][question.sector_id] = question
+                self._questions['types'].setdefault(question.information_type, question)
+        if information_type == 'sector_specific_information':
+            return self._questions['sectors'].get(sector_id)
+        return self._questions['types'].get(information_type)
+
+    def collect(self, information):
+        sector_id = information.impact_model.base_model.sector_id
+        for information_type, name in INFORMATION_TYPE_CHOICES:
+            question_set = self.get_question(information_type, sector_id)
+            if not question_set:
+                continue
+            data = getattr(information, information_type)
+            for question in question_set.schema.questions:
+                if question.field_type in self.CHOICE_FIELD_TYPES:
+                    self._pks[question.field_type].update(self.to_pks(data.get(question.name, None)))
+
+    @staticmethod
+    def to_pks(values):
+        if values is None:
+            return set()
+        if not isinstance(values, (list, tuple)):
+            values = [values]
+        pks = set()
+        for value in values:
+            try:
+                pks.add(int(value))
+            except (TypeError, ValueError):
+                continue
+        return pks
+
+    @property
+    def input_data_page(self):
+        if self._input_data_page is None:
+            self._input_data_page = InputData.get_parent_page()
+        return self._input_data_page
+
+    def get_queryset(self, field_type, pks):
+        if field_type == 'input_data_choice':
+            return InputData.objects.filter(pk__in=pks).prefetch_related('simulation_round')
+        elif field_type == 'climate_variable_choice':
+            return ClimateVariable.objects.filter(pk__in=pks)
+        elif field_type == 'biodiversity_model_output_choice':
+            return BiodiversityModelOutput.objects.filter(pk__in=pks)
+        elif field_type == 'model_single_choice':
+            return SpatialAggregation.objects.filter(pk__in=pks)
+
+    def get_label(self, field_type, instance):
+        if field_type == 'input_data_choice':
+            return self.make_pretty and instance.pretty(page=self.input_data_page) or str(instance)
+        elif field_type == 'climate_variable_choice':
+            return self.make_pretty and instance.pretty() or str(instance)
+        return instance.name
+
+    def get_labels(self, field_type, pks):
+        wanted = self._pks[field_type] | pks
+        if not wanted <= self._fetched[field_type]:
+            # everything is refetched, which keeps the labels in the model ordering
+            instances = list(self.get_queryset(field_type, wanted))
+            self._labels[field_type] = {instance.pk: self.get_label(field_type, instance) for instance in instances}
+            self._positions[field_type] = {instance.pk: i for i, instance in enumerate(instances)}
+            self._fetched[field_type] = wanted
+        labels = self._labels[field_type]
+        positions = self._positions[field_type]
+        return [labels[pk] for pk in sorted((pk for pk in pks if pk in labels), key=positions.get)]
+
+    def resolve(self, field_type, values):
+        if values is None:
+            return ''
+        if field_type in self.CHOICE_FIELD_TYPES:
+            return ", ".join(self.get_labels(field_type, self.to_pks(values)))
+        if type(values) is bool:
+            return 'Yes' if values is True else 'No' if values is False else ''
+        return values
 
 
 class TechnicalInformation(models.Model):
@@ -1825,3 +1931,252 @@ class DataPublicationConfirmation(models.Model):
         from isi_mip.pages.models import ImpactModelsPage
         impage = ImpactModelsPage.objects.get()
         return impage.full_url + impage.reverse_subpage('confirm_data', kwargs={'id': self.impact_model.pk})
+
+
+
+class DataVersion(models.Model):
+    """
+    A stamp, which is replaced whenever the data it stands for changes.
+    Unlike the cache versions it is shared with the export worker process.
+    """
+    EXPORTS = 'exports'
+    DOCUMENTATION = 'documentation'
+
+    name = models.CharField(max_length=100, unique=True)
+    version = models.CharField(max_length=32)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return "%s (%s)" % (self.name, self.version)
+
+    @classmethod
+    def get_instance(cls, name):
+        return cls.objects.get_or_create(name=name, defaults={'version': uuid4().hex})[0]
+
+    @classmethod
+    def get_version(cls, name):
+        return cls.get_instance(name).version
+
+    @classmethod
+    def bump_version(cls, name):
+        cls.objects.update_or_create(name=name, defaults={'version': uuid4().hex})
+
+    @classmethod
+    def bump_versions(cls, names):
+        for name in names:
+            cls.bump_version(name)
+
+    @classmethod
+    def bump_version_on_commit(cls, name):
+        # the row would otherwise stay locked until the commit, serializing all writes
+        data_version_queue.add([name])
+
+
+data_version_queue = CommitQueue('data_version', DataVersion.bump_versions)
+
+
+def export_data_changed(sender, **kwargs):
+    # the signal sends action only for m2m changes and update_fields only for saves
+    if not kwargs.get('action', 'post_').startswith('post_'):
+        return
+    if kwargs.get('update_fields') and set(kwargs['update_fields']) <= {'last_login'}:
+        return
+    DataVersion.bump_version_on_commit(DataVersion.EXPORTS)
+
+
+class ExportJob(models.Model):
+    IMPACT_MODELS = 'impact_models'
+    PARTICIPANTS = 'participants'
+    KIND_CHOICES = (
+        (IMPACT_MODELS, 'Impact models'),
+        (PARTICIPANTS, 'Participants'),
+    )
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    )
+
+    kind = models.CharField(max_length=50, choices=KIND_CHOICES)
+    params = JSONField(default=dict, blank=True)
+    params_hash = models.CharField(max_length=32)
+    data_version = models.CharField(max_length=32)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    file = models.FileField(upload_to='exports', blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True, blank=True)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('kind', 'params_hash', 'data_version')
+        ordering = ('created',)
+
+    def __str__(self):
+        return "%s %s (%s)" % (self.get_kind_display(), self.params, self.get_status_display())
+
+
+class OutgoingEmail(models.Model):
+    """
+    An email, which is queued with the request that triggers it and
+    sent later by the send_queued_emails worker.
+    """
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (SENDING, 'Sending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    )
+
+    subject = models.TextField()
+    body = models.TextField()
+    from_email = models.CharField(max_length=500)
+    to = JSONField(default=list)
+    cc = JSONField(default=list, blank=True)
+    reply_to = JSONField(default=list, blank=True)
+    attachments = JSONField(default=list, blank=True, help_text='The filename, the base64 encoded content and the mimetype of every attachment.')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    next_attempt = models.DateTimeField(default=timezone.now)
+    started = models.DateTimeField(null=True, blank=True)
+    sent = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ('created',)
+        index_together = ('status', 'next_attempt')
+
+    def __str__(self):
+        return "%s to %s (%s)" % (self.subject, ', '.join(self.to), self.get_status_display())
+
+class ImpactModelSearchDocument(models.Model):
+    """
+    The searchable text of a base impact model and all its rounds, which is
+    rebuilt by isi_mip.climatemodels.search after the changes are committed.
+    """
+    base_model = models.OneToOneField(BaseImpactModel, on_delete=models.CASCADE, primary_key=True, related_name='search_document')
+    title = models.TextField(blank=True)
+    keywords = models.TextField(blank=True, help_text='Sector, simulation rounds, regions and people.')
+    text = models.TextField(blank=True, help_text='Descriptions, documentation and output data.')
+    search_vector = SearchVectorField(null=True)
+    public = models.BooleanField(default=False)
+    stale = models.BooleanField(default=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [GinIndex(fields=['search_vector'])]
+
+    def __str__(self):
+        return self.title
+
+
+def rebuild_search_documents(base_model_ids):
+    from isi_mip.climatemodels.search import update_search_documents
+    update_search_documents(base_model_ids)
+
+
+search_document_queue = CommitQueue('search_documents', rebuild_search_documents)
+
+
+def mark_search_documents_stale(**lookup):
+    """
+    Marks the search documents of the base models matching the lookup, or of all
+    base models, for a rebuild. The matching documents are rebuilt after the
+    transaction, documents of new base models are created by the rebuild. All
+    documents are left to the update_search_documents --watch worker.
+    """
+    if not lookup:
+        ImpactModelSearchDocument.objects.update(stale=True)
+        return
+    base_model_ids = set(BaseImpactModel.objects.filter(**lookup).values_list('pk', flat=True))
+    if base_model_ids:
+        ImpactModelSearchDocument.objects.filter(base_model_id__in=base_model_ids).update(stale=True)
+        search_document_queue.add(base_model_ids)
+
+
+def search_document_changed(sender, instance, **kwargs):
+    # BaseImpactModel, ImpactModel, ContactPerson, ImpactModelInformation and OutputData
+    if isinstance(instance, BaseImpactModel):
+        lookup = {'pk': instance.pk}
+    elif isinstance(instance, ImpactModel):
+        lookup = {'pk': instance.base_model_id}
+    elif isinstance(instance, ContactPerson):
+        lookup = {'pk': instance.base_impact_model_id}
+    else:
+        lookup = {'impact_model': getattr(instance, 'impact_model_id', None) or getattr(instance, 'model_id', None)}
+    if None not in lookup.values():
+        mark_search_documents_stale(**lookup)
+
+
+def search_document_m2m_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # BaseImpactModel.region and UserProfile.responsible
+    if not action.startswith('post_'):
+        return
+    if isinstance(instance, BaseImpactModel):
+        mark_search_documents_stale(pk=instance.pk)
+    elif isinstance(instance, ImpactModel):
+        mark_search_documents_stale(pk=instance.base_model_id)
+    elif pk_set and not reverse:
+        mark_search_documents_stale(impact_model__in=pk_set)
+    else:
+        mark_search_documents_stale()
+
+
+def search_document_people_changed(sender, instance, **kwargs):
+    # User and UserProfile
+    if kwargs.get('update_fields') and set(kwargs['update_fields']) <= {'last_login'}:
+        return
+    user_id = instance.pk if isinstance(instance, User) else instance.user_id
+    mark_search_documents_stale(impact_model__impact_model_responsible__user_id=user_id)
+
+
+def search_documents_changed(sender, **kwargs):
+    # data shown in the documentation of many base models
+    if kwargs.get('action', 'post_').startswith('post_'):
+        mark_search_documents_stale()
+
+
+post_save.connect(clear_question_schema, sender=ImpactModelQuestion)
+post_delete.connect(clear_question_schema, sender=ImpactModelQuestion)
+
+post_save.connect(base_model_changed, sender=BaseImpactModel)
+for signal in (post_save, post_delete):
+    signal.connect(impact_model_changed, sender=ImpactModel)
+    for sender in (ImpactModelInformation, OutputData, Attachment, DataPublicationConfirmation):
+        signal.connect(impact_model_related_changed, sender=sender)
+    for sender in (InputData, ImpactModelQuestion, Sector, SimulationRound, ClimateVariable, SpatialAggregation, BiodiversityModelOutput):
+        signal.connect(shared_data_changed, sender=sender)
+for signal in (post_save, pre_delete):
+    signal.connect(reference_paper_changed, sender=ReferencePaper)
+m2m_changed.connect(impact_model_m2m_changed, sender=ImpactModel.other_references.through)
+m2m_changed.connect(output_data_drivers_changed, sender=OutputData.drivers.through)
+m2m_changed.connect(shared_data_changed, sender=InputData.simulation_round.through)
+for signal in (post_save, post_delete):
+    for sender in (InputData, DataType, SimulationRound):
+        signal.connect(input_data_listing_changed, sender=sender)
+m2m_changed.connect(input_data_listing_changed, sender=InputData.simulation_round.through)
+for signal in (post_save, post_delete):
+    for sender in (BaseImpactModel, ImpactModel, ImpactModelInformation, ImpactModelQuestion, Sector, SimulationRound,
+                   Region, ReferencePaper, InputData, ClimateVariable, SpatialAggregation, BiodiversityModelOutput):
+        signal.connect(export_data_changed, sender=sender)
+for sender in (BaseImpactModel.region.through, ImpactModel.other_references.through, InputData.simulation_round.through):
+    m2m_changed.connect(export_data_changed, sender=sender)
+post_save.connect(search_document_changed, sender=BaseImpactModel)
+for signal in (post_save, post_delete):
+    for sender in (ImpactModel, ContactPerson, ImpactModelInformation, OutputData):
+        signal.connect(search_document_changed, sender=sender)
+    for sender in (Sector, SimulationRound, Region, InputData, ClimateVariable, SpatialAggregation, BiodiversityModelOutput, ImpactModelQuestion):
+        signal.connect(search_documents_changed, sender=sender)
+m2m_changed.connect(search_document_m2m_changed, sender=BaseImpactModel.region.through)
+m2m_changed.connect(search_documents_changed, sender=OutputData.drivers.through)
@@ -0,0 +1,161 @@
+import base64
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from isi_mip.climatemodels.models import OutgoingEmail
+
+logger = logging.getLogger(__name__)
+
+# Emails are written to the outbox in the transaction of the request, which
+# triggers them, and sent by the send_queued_emails worker in batches over one
+# connection. Failed emails are retried with an increasing delay. The attachments
+# are stored in the row, so they are rolled back with the request, and dropped
+# once the email is sent or has failed for good.
+
+
+def get_batch_size():
+    return getattr(settings, 'OUTBOX_BATCH_SIZE', 50)
+
+
+def get_max_attempts():
+    return getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 5)
+
+
+def get_retry_delay(attempts):
+    return timedelta(seconds=getattr(settings, 'OUTBOX_RETRY_DELAY', 60) * 2 ** (attempts - 1))
+
+
+def get_sending_timeout():
+    # emails sending for longer than this are considered crashed and sent again
+    return getattr(settings, 'OUTBOX_SENDING_TIMEOUT', 15 * 60)
+
+
+def encode_attachment(filename, content, mimetype):
+    if isinstance(content, str):
+        content = content.encode()
+    return {'filename': filename, 'content': base64.b64encode(content).decode(), 'mimetype': mimetype}
+
+
+def decode_attachment(attachment):
+    if 'name' in attachment:
+        # queued with the storage name, before the attachments were stored in the row
+        with default_storage.open(attachment['name'], 'rb') as f:
+            return f.read()
+    return base64.b64decode(attachment['content'])
+
+
+def drop_attachments(email):
+    for attachment in email.attachments:
+        if 'name' in attachment:
+            default_storage.delete(attachment['name'])
+    email.attachments = [{'filename': attachment['filename'], 'mimetype': attachment['mimetype']} for attachment in email.attachments]
+
+
+def build_email(subject, body, from_email=None, to=None, cc=None, reply_to=None, attachments=None):
+    """
+    Returns an unsaved outbox email, the arguments are those of EmailMessage.
+    Attachments are (filename, content, mimetype) tuples.
+    """
+    return OutgoingEmail(
+        subject=subject,
+        body=body,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=list(to or []),
+        cc=list(cc or []),
+        reply_to=list(reply_to or []),
+        attachments=[encode_attachment(*attachment) for attachment in attachments or []],
+    )
+
+
+def queue_email(*args, **kwargs):
+    """
+    Adds an email to the outbox, see build_email.
+    """
+    email = build_email(*args, **kwargs)
+    email.save()
+    return email
+
+
+def queue_emails(emails, batch_size=500):
+    """
+    Adds many emails from build_email to the outbox at once.
+    """
+    return OutgoingEmail.objects.bulk_create(emails, batch_size=batch_size)
+
+
+def get_email_message(email, connection=None):
+    message = EmailMessage(
+        subject=email.subject, body=email.body, from_email=email.from_email,
+        to=email.to, cc=email.cc, reply_to=email.reply_to, connection=connection)
+    for attachment in email.attachments:
+        message.attach(attachment['filename'], decode_attachment(attachment), attachment['mimetype'])
+    return message
+
+
+def claim_emails(batch_size=None):
+    stale = timezone.now() - timedelta(seconds=get_sending_timeout())
+    with transaction.atomic():
+        emails = list(OutgoingEmail.objects.select_for_update(skip_locked=True).filter(
+            Q(status=OutgoingEmail.PENDING, next_attempt__lte=timezone.now()) | Q(status=OutgoingEmail.SENDING, started__lt=stale)
+        ).order_by('next_attempt')[:batch_size or get_batch_size()])
+        OutgoingEmail.objects.filter(pk__in=[email.pk for email in emails]).update(status=OutgoingEmail.SENDING, started=timezone.now())
+    return emails
+
+
+def email_sent(email):
+    email.status = OutgoingEmail.SENT
+    email.sent = timezone.now()
+    email.attempts += 1
+    email.error = ''
+    drop_attachments(email)
+    email.save(update_fields=['status', 'sent', 'attempts', 'error', 'attachments'])
+
+
+def email_failed(email, error):
+    logger.warning('Sending email %s failed: %s', email.pk, error)
+    email.attempts += 1
+    email.error = str(error)
+    if email.attempts >= get_max_attempts():
+        email.status = OutgoingEmail.FAILED
+        drop_attachments(email)
+    else:
+        email.status = OutgoingEmail.PENDING
+        email.next_attempt = timezone.now() + get_retry_delay(email.attempts)
+    email.save(update_fields=['status', 'attempts', 'error', 'next_attempt', 'attachments'])
+
+
+def send_emails(emails):
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as e:
+        for email in emails:
+            email_failed(email, e)
+        return
+    try:
+        for email in emails:
+            try:
+                get_email_message(email, connection).send()
+            except Exception as e:
+                email_failed(email, e)
+            else:
+                email_sent(email)
+    finally:
+        connection.close()
+
+
+def send_queued_emails(batch_size=None):
+    """
+    Sends the next batch of the outbox and returns it.
+    """
+    emails = claim_emails(batch_size)
+    if emails:
+        send_emails(emails)
+    return emails
@@ -0,0 +1,88 @@
+import hashlib
+import json
+import threading
+from collections import namedtuple
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+# Flat, immutable representation of an ImpactModelQuestion snippet. Walking the
+# `questions` StreamField deserializes every block, so the schema is compiled
+# once per snippet revision and shared by the detail, export and edit paths.
+CompiledQuestion = namedtuple('CompiledQuestion', [
+    'name', 'verbose_name', 'help_text', 'field_type', 'required',
+    'choices', 'allow_custom', 'nullable', 'data_type',
+], defaults=((), False, False, None))
+
+CompiledFieldset = namedtuple('CompiledFieldset', ['heading', 'description', 'questions'])
+
+
+QuestionSchema = namedtuple('QuestionSchema', ['pk', 'content_hash', 'fieldsets', 'questions'])
+
+
+_schema_cache = {}
+_schema_cache_lock = threading.Lock()
+
+
+def get_content_hash(impact_model_question):
+    # raw_data exposes the stored JSON of blocks that have not been accessed yet,
+    # so hashing does not trigger the block deserialization
+    raw_data = list(impact_model_question.questions.raw_data) if impact_model_question.questions else []
+    dump = json.dumps(raw_data, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.md5(dump.encode('utf-8')).hexdigest()
+
+
+def compile_question(question):
+    value = question.value
+    choices = ()
+    if 'choices' in value:
+        choices = tuple((choice['label'], choice['name']) for choice in value['choices'])
+    return CompiledQuestion(
+        name=value['name'],
+        verbose_name=value['question'],
+        help_text=value['help_text'],
+        field_type=question.block_type,
+        required=value['required'],
+        choices=choices,
+        allow_custom=value.get('allow_custom', False),
+        nullable=value.get('nullable', False),
+        data_type=value.get('data_type'),
+    )
+
+
+def compile_question_schema(impact_model_question, content_hash=None):
+    if content_hash is None:
+        content_hash = get_content_hash(impact_model_question)
+    fieldsets = []
+    questions = []
+    for fieldset in impact_model_question.questions or []:
+        compiled = tuple(compile_question(question) for question in fieldset.value['questions'])
+        fieldsets.append(CompiledFieldset(
+            heading=fieldset.value['heading'],
+            description=fieldset.value['description'],
+            questions=compiled,
+        ))
+        questions.extend(compiled)
+    return QuestionSchema(
+        pk=impact_model_question.pk,
+        content_hash=content_hash,
+        fieldsets=tuple(fieldsets),
+        questions=tuple(questions),
+    )
+
+
+def get_question_schema(impact_model_question):
+    content_hash = get_content_hash(impact_model_question)
+    if impact_model_question.pk is None:
+        return compile_question_schema(impact_model_question, content_hash)
+    schema = _schema_cache.get(impact_model_question.pk)
+    if schema is not None and schema.content_hash == content_hash:
+        return schema
+    schema = compile_question_schema(impact_model_question, content_hash)
+    with _schema_cache_lock:
+        _schema_cache[impact_model_question.pk] = schema
+    return schema
+
+
+def clear_question_schema(sender, instance, **kwargs):
+    with _schema_cache_lock:
+        _schema_cache.pop(instance.pk, None)
@@ -0,0 +1,191 @@
+import re
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db.models import Count, F, Prefetch, Q
+from django.utils import timezone
+
+from isi_mip.climatemodels.models import (INFORMATION_TYPE_CHOICES,
+                                          BaseImpactModel, FieldValueResolver,
+                                          ImpactModel,
+                                          ImpactModelSearchDocument)
+
+# Every base impact model has a search document, which holds the text of all its
+# rounds: the documentation, the output data and the people. The documents are
+# marked stale by the signals in models.py. The documents of the changed base
+# models are rebuilt after the commit, changes to data shared by all of them are
+# left to the update_search_documents --watch worker.
+#
+# The searchvalue filter of the model table and the export matches the words of a
+# shorter text per impact model by prefix. It is rebuilt with the documents.
+SEARCH_CHUNK_SIZE = 100
+FILTER_CONFIG = 'simple'
+
+
+def get_search_config():
+    return getattr(settings, 'IMPACT_MODEL_SEARCH_CONFIG', 'english')
+
+
+def get_search_vector():
+    config = get_search_config()
+    return SearchVector('title', weight='A', config=config) + SearchVector('keywords', weight='B', config=config) \
+        + SearchVector('text', weight='C', config=config)
+
+
+def to_text(value):
+    if isinstance(value, (list, tuple)):
+        return ' '.join(str(v) for v in value if v)
+    return str(value) if value else ''
+
+
+def get_documentation_values(impact_model, resolver):
+    if not hasattr(impact_model, 'impact_model_information'):
+        return
+    information = impact_model.impact_model_information
+    for information_type, name in INFORMATION_TYPE_CHOICES:
+        question_set = resolver.get_question(information_type, impact_model.base_model.sector_id)
+        if not question_set:
+            continue
+        data = getattr(information, information_type)
+        for question in question_set.schema.questions:
+            yield to_text(resolver.resolve(question.field_type, data.get(question.name, None)))
+
+
+def normalize_search_text(text):
+    # punctuation splits words the same way in the texts and the queries
+    return re.sub(r'[\W_]+', ' ', text).strip()
+
+
+def get_impact_model_search_text(impact_model, base_model):
+    values = [base_model.name, base_model.sector.name]
+    if impact_model.simulation_round:
+        values.append(impact_model.simulation_round.name)
+    values += [region.name for region in base_model.region.all()]
+    for contact_person in base_model.contactperson_set.all():
+        values += [contact_person.name or '', contact_person.email or '']
+    return normalize_search_text(' '.join(values))
+
+
+def build_search_document(base_model, resolver):
+    impact_models = list(base_model.impact_model.all())
+    keywords = [base_model.sector.name]
+    keywords += [region.name for region in base_model.region.all()]
+    keywords += [str(contact_person) for contact_person in base_model.contactperson_set.all()]
+    text = [base_model.short_description or '']
+    for impact_model in impact_models:
+        impact_model.search_text = get_impact_model_search_text(impact_model, base_model)
+        if impact_model.simulation_round:
+            keywords.append(impact_model.simulation_round.name)
+        for owner in impact_model.impact_model_responsible.all():
+            keywords.append('%s %s %s' % (owner.name, owner.email, owner.institute or ''))
+        text += get_documentation_values(impact_model, resolver)
+        for output_data in impact_model.outputdata_set.all():
+            text.append(output_data.experiments or '')
+            text += [driver.name for driver in output_data.drivers.all()]
+    return ImpactModelSearchDocument(
+        base_model=base_model,
+        title=base_model.name,
+        keywords='\n'.join(value for value in keywords if value),
+        text='\n'.join(value for value in text if value),
+        public=any(impact_model.public for impact_model in impact_models),
+        stale=False,
+    )
+
+
+def build_search_documents(base_model_ids):
+    resolver = FieldValueResolver(make_pretty=False)
+    base_models = BaseImpactModel.objects.filter(pk__in=base_model_ids).select_related('sector').prefetch_related(
+        'region', 'contactperson_set',
+        Prefetch('impact_model', queryset=ImpactModel.objects.select_related('simulation_round', 'impact_model_information').prefetch_related(
+            'impact_model_responsible__user', 'outputdata_set__drivers')),
+    )
+    base_models = list(base_models)
+    for base_model in base_models:
+        for impact_model in base_model.impact_model.all():
+            if hasattr(impact_model, 'impact_model_information'):
+                resolver.collect(impact_model.impact_model_information)
+    return [build_search_document(base_model, resolver) for base_model in base_models]
+
+
+def update_search_documents(base_model_ids=None):
+    """
+    Rebuilds the given search documents, by default the stale and the missing ones.
+    Returns the number of rebuilt documents.
+    """
+    if base_model_ids is None:
+        base_model_ids = BaseImpactModel.objects.filter(Q(search_document__isnull=True) | Q(search_document__stale=True)).values_list('pk', flat=True)
+    base_model_ids = list(base_model_ids)
+    for start in range(0, len(base_model_ids), SEARCH_CHUNK_SIZE):
+        chunk = base_model_ids[start:start + SEARCH_CHUNK_SIZE]
+        documents = build_search_documents(chunk)
+        ImpactModelSearchDocument.objects.bulk_create(documents, ignore_conflicts=True)
+        ImpactModelSearchDocument.objects.bulk_update(documents, ['title', 'keywords', 'text', 'public', 'stale'])
+        ImpactModelSearchDocument.objects.filter(pk__in=chunk).update(search_vector=get_search_vector(), updated=timezone.now())
+        impact_models = [impact_model for document in documents for impact_model in document.base_model.impact_model.all()]
+        ImpactModel.objects.bulk_update(impact_models, ['search_text'])
+        ImpactModel.objects.filter(base_model_id__in=chunk).update(search_vector=SearchVector('search_text', config=FILTER_CONFIG))
+    return len(base_model_ids)
+
+
+def search_impact_models(query, sector=None, simulation_round=None, public=True):
+    """
+    Returns the base impact models matching the query, ordered by rank, and the
+    facets, the number of matching base models per sector and simulation round.
+    Each facet is counted with the filter of the other one applied.
+    """
+    search_query = SearchQuery(query, config=get_search_config(), search_type='websearch')
+    documents = ImpactModelSearchDocument.objects.filter(search_vector=search_query)
+    impact_models = ImpactModel.objects.all()
+    if public:
+        documents = documents.filter(public=True)
+        impact_models = impact_models.filter(public=True)
+    base_models = BaseImpactModel.objects.filter(pk__in=documents.values('base_model_id'))
+    in_sector = base_models.filter(sector__name=sector) if sector else base_models
+    in_simulation_round = base_models.filter(pk__in=impact_models.filter(simulation_round__name=simulation_round).values('base_model_id')) \
+        if simulation_round else base_models
+    results = in_sector & in_simulation_round
+    results = results.select_related('sector').annotate(rank=SearchRank(F('search_document__search_vector'), search_query)).order_by('-rank', 'name')
+    facets = {
+        'sector': list(in_simulation_round.values_list('sector__name').annotate(count=Count('pk')).order_by('sector__name')),
+        'simulation_round': list(impact_models.filter(base_model__in=in_sector, simulation_round__isnull=False).values_list('simulation_round__name')
+                                 .annotate(count=Count('base_model', distinct=True)).order_by('-simulation_round__order')),
+    }
+    return results, facets
+
+
+def get_filter_query(searchvalue):
+    """
+    Returns the query for the searchvalue parameter, which matches
+    impact models with words starting with every term.
+    """
+    terms = normalize_search_text(searchvalue).split()
+    if not terms:
+        return None
+    return SearchQuery(' & '.join('%s:*' % term for term in terms), config=FILTER_CONFIG, search_type='raw')
+
+
+def get_fallback_query(searchvalue):
+    """
+    Returns the query for the searchvalue parameter for impact models
+    without a search vector, whose documents have not been built yet.
+    """
+    base_models = BaseImpactModel.objects.filter(
+        Q(name__icontains=searchvalue) | Q(sector__name__icontains=searchvalue)
+        | Q(contactperson__name__icontains=searchvalue) | Q(contactperson__email__icontains=searchvalue))
+    return Q(search_vector__isnull=True) & (Q(base_model__in=base_models) | Q(simulation_round__name__icontains=searchvalue))
+
+
+def filter_public_impact_models(params):
+    """
+    Returns the public impact models filtered by the sector, simulation_round and
+    searchvalue parameters. The model table and the export use the same filter.
+    """
+    impact_models = ImpactModel.objects.filter(public=True)
+    if params.get('sector'):
+        impact_models = impact_models.filter(base_model__sector__name=params['sector'])
+    if params.get('simulation_round'):
+        impact_models = impact_models.filter(simulation_round__name=params['simulation_round'])
+    filter_query = get_filter_query(params.get('searchvalue', ''))
+    if filter_query is not None:
+        impact_models = impact_models.filter(Q(search_vector=filter_query) | get_fallback_query(params['searchvalue']))
+    return impact_models
@@ -20,14 +20,11 @@ def progress_bar(context, **kwargs):
         else:
             information = ImpactModelQuestion.objects.filter(information_type=information_type).first()
         if information:
-            for fieldset in information.question_group_list:
-                values = []
-                for field in fieldset[1]['fields']:
-                    count_questions += 1
-                    verbose_name = field['verbose_name']
-                    value = getattr(impact_model.impact_model_information, information_type).get(field['name'], None)
-                    if value or value == False:
-                        count_answers += 1
+            for question in information.schema.questions:
+                count_questions += 1
+                value = getattr(impact_model.impact_model_information, information_type).get(question.name, None)
+                if value or value == False:
+                    count_answers += 1
     progress = count_questions and int(count_answers / count_questions * 100) or 0
     template = 'widgets/progress-bar.html'
     return render_to_string(template, context={'progress': progress, 'count_questions': count_questions, 'count_answers': count_answers})
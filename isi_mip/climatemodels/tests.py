@@ -0,0 +1,406 @@
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser, User, update_last_login
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core import mail
+from django.db import connection, transaction
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from wagtail.models import Page, Site
+
+from isi_mip.climatemodels import documentation, exports, outbox, search
+from isi_mip.climatemodels.models import (BaseImpactModel, ClimateVariable,
+                                          DataPublicationConfirmation,
+                                          DataVersion, ExportJob, ImpactModel,
+                                          ImpactModelQuestion,
+                                          ImpactModelSearchDocument, InputData,
+                                          OutgoingEmail, OutputData,
+                                          ReferencePaper, Sector,
+                                          SimulationRound, SpatialAggregation)
+from isi_mip.climatemodels.confirmations import request_data_confirmations
+from isi_mip.climatemodels.views import load_impact_model_details
+from isi_mip.contrib.models import Country
+from isi_mip.core.models import DataPublicationRequest
+from isi_mip.pages.models import (DashboardPage, GettingStartedPage,
+                                  ImpactModelsPage)
+
+QUESTIONS = [{'type': 'fieldset', 'value': {'heading': 'Resolution', 'description': '', 'questions': [
+    {'type': 'single_line', 'value': {'name': 'resolution', 'question': 'Resolution', 'required': False, 'help_text': ''}},
+    {'type': 'model_single_choice', 'value': {'name': 'spatial_aggregation', 'question': 'Spatial aggregation', 'required': False, 'help_text': ''}},
+    {'type': 'climate_variable_choice', 'value': {'name': 'climate_variables', 'question': 'Climate variables', 'required': False, 'help_text': ''}},
+    {'type': 'input_data_choice', 'value': {'name': 'climate_forcing', 'question': 'Climate forcing', 'required': False, 'help_text': '', 'data_type': None}},
+]}}]
+
+# the loader, the resolver and the prefetches, independent of the number of rounds
+MAX_DETAIL_QUERIES = 16
+# the page, the impact models, the rounds and the groups of the user
+MAX_DASHBOARD_QUERIES = 6
+
+
+def create_simple_base_model(name, rounds, sector):
+    # a public impact model in each of its own simulation rounds
+    base_model = BaseImpactModel.objects.create(name=name, sector=sector)
+    for i in range(rounds):
+        simulation_round = SimulationRound.objects.create(name='%s round %d' % (name, i), slug='%s-%d' % (name, i), order=i)
+        ImpactModel.objects.create(base_model=base_model, simulation_round=simulation_round, public=True)
+    return base_model
+
+
+class ImpactModelDetailsTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        root = Page.get_first_root_node()
+        self.page = root.add_child(instance=ImpactModelsPage(
+            title='Impact models', slug='impactmodels', content=[],
+            private_model_message='Private', common_attributes_text='Common'))
+        root.add_child(instance=GettingStartedPage(
+            title='Input data', slug='inputdata', content=[], is_input_data_parent_page=True))
+        # the site root paths are cached on first use
+        self.page.url
+        ImpactModelQuestion.objects.create(information_type='technical_information', heading='Resolution', questions=QUESTIONS)
+        self.sector = Sector.objects.create(name='Water (global)', slug='water-global', drkz_folder_name='water_global')
+        self.country = Country.objects.create(name='Germany')
+        self.spatial_aggregation = SpatialAggregation.objects.create(name='regular grid')
+        self.climate_variables = [ClimateVariable.objects.create(name='Temperature %d' % i, abbreviation='tas%d' % i) for i in range(3)]
+        self.user = User.objects.create_user('responsible', 'responsible@example.com', 'password')
+        self.user.userprofile.country = self.country
+        self.user.userprofile.save()
+
+    def create_base_model(self, name, rounds):
+        base_model = BaseImpactModel.objects.create(name=name, sector=self.sector)
+        for i in range(rounds):
+            simulation_round = SimulationRound.objects.create(name='%s round %d' % (name, i), slug='%s-%d' % (name, i), order=i)
+            impact_model = ImpactModel.objects.create(
+                base_model=base_model, simulation_round=simulation_round, public=True,
+                main_reference_paper=ReferencePaper.objects.create(title='Main %s %d' % (name, i)))
+            impact_model.other_references.add(*[ReferencePaper.objects.create(title='Other %s %d %d' % (name, i, j)) for j in range(2)])
+            self.user.userprofile.responsible.add(impact_model)
+            DataPublicationConfirmation.objects.create(impact_model=impact_model, email_text='')
+            input_data = InputData.objects.create(name='%s forcing %d' % (name, i))
+            input_data.simulation_round.add(simulation_round)
+            for j in range(2):
+                output_data = OutputData.objects.create(model=impact_model, experiments='historical')
+                output_data.drivers.add(input_data)
+            information = impact_model.impact_model_information
+            information.technical_information = {
+                'resolution': '0.5°x0.5°',
+                'spatial_aggregation': self.spatial_aggregation.pk,
+                'climate_variables': [str(climate_variable.pk) for climate_variable in self.climate_variables],
+                'climate_forcing': [str(input_data.pk)],
+            }
+            information.save()
+        return base_model
+
+    def count_queries(self, base_model, user):
+        with CaptureQueriesContext(connection) as context:
+            model_simulation_rounds = load_impact_model_details(self.page, user, base_model)
+        return len(context.captured_queries), model_simulation_rounds
+
+    def test_query_count_is_constant(self):
+        small = self.create_base_model('small', 1)
+        large = self.create_base_model('large', 6)
+        small_count, small_rounds = self.count_queries(small, self.user)
+        large_count, large_rounds = self.count_queries(large, self.user)
+        self.assertEqual(len(large_rounds), 6)
+        self.assertLessEqual(large_count, MAX_DETAIL_QUERIES)
+        self.assertEqual(small_count, large_count)
+
+    def test_details(self):
+        base_model = self.create_base_model('model', 2)
+        model_simulation_rounds = self.count_queries(base_model, self.user)[1]
+        details = model_simulation_rounds[0]
+        self.assertIn('Edit model information', details['edit_link'])
+        self.assertIn('Confirm data', details['confirm_data_link'])
+        self.assertIn('Spatial aggregation: <i>regular grid</i>', details['details'])
+        self.assertIn('Climate Drivers: <i>model forcing', details['details'])
+        anonymous_rounds = self.count_queries(base_model, AnonymousUser())[1]
+        self.assertEqual(anonymous_rounds[0]['edit_link'], '')
+
+    def test_details_are_cached(self):
+        base_model = self.create_base_model('model', 3)
+        uncached_count = self.count_queries(base_model, AnonymousUser())[0]
+        cached_count, model_simulation_rounds = self.count_queries(base_model, AnonymousUser())
+        self.assertLessEqual(cached_count, 2)
+        self.assertLess(cached_count, uncached_count)
+        self.assertIn('regular grid', model_simulation_rounds[0]['details'])
+
+        self.spatial_aggregation.name = 'irregular grid'
+        self.spatial_aggregation.save()
+        self.assertIn('irregular grid', self.count_queries(base_model, AnonymousUser())[1][0]['details'])
+
+        impact_model = base_model.impact_model.first()
+        information = impact_model.impact_model_information
+        information.technical_information['resolution'] = '1.0°x1.0°'
+        information.save()
+        details = {sr['simulation_round']: sr['details'] for sr in self.count_queries(base_model, AnonymousUser())[1]}
+        self.assertIn('1.0°x1.0°', details[impact_model.simulation_round.name])
+
+        # a paper only invalidates the impact models referencing it
+        other_updated = dict(ImpactModel.objects.exclude(pk=impact_model.pk).values_list('pk', 'updated'))
+        paper = impact_model.main_reference_paper
+        paper.title = 'Renamed paper'
+        paper.save()
+        details = {sr['simulation_round']: sr['details'] for sr in self.count_queries(base_model, AnonymousUser())[1]}
+        self.assertIn('Renamed paper', details[impact_model.simulation_round.name])
+        self.assertEqual(dict(ImpactModel.objects.exclude(pk=impact_model.pk).values_list('pk', 'updated')), other_updated)
+
+        # the sector of the base model selects the questions
+        sector = Sector.objects.create(name='Agriculture', slug='agriculture', drkz_folder_name='agriculture')
+        self.count_queries(base_model, AnonymousUser())
+        base_model.sector = sector
+        base_model.save()
+        self.assertGreater(self.count_queries(base_model, AnonymousUser())[0], cached_count)
+
+        updated = dict(ImpactModel.objects.values_list('pk', 'updated'))
+        update_last_login(None, self.user)
+        self.assertEqual(dict(ImpactModel.objects.values_list('pk', 'updated')), updated)
+
+        self.user.first_name = 'Responsible'
+        self.user.save()
+        model_simulation_rounds = self.count_queries(base_model, self.user)[1]
+        self.assertTrue(all('Responsible' in sr['details'] for sr in model_simulation_rounds))
+        self.assertTrue(all(sr['edit_link'] for sr in model_simulation_rounds))
+
+
+class SearchDocumentTestCase(TestCase):
+
+    def setUp(self):
+        self.sector = Sector.objects.create(name='Water (global)', slug='water-global', drkz_folder_name='water_global')
+        self.spatial_aggregation = SpatialAggregation.objects.create(name='regular grid')
+
+    def test_search_documents_are_rebuilt_once_per_transaction(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            small = create_simple_base_model('small', 1, self.sector)
+            large = create_simple_base_model('large', 2, self.sector)
+        with mock.patch.object(search, 'update_search_documents', wraps=search.update_search_documents) as update:
+            with self.captureOnCommitCallbacks(execute=True):
+                small.name = 'tiny'
+                small.save()
+                for impact_model in large.impact_model.all():
+                    impact_model.version = '2.0'
+                    impact_model.save()
+            update.assert_called_once_with({small.pk, large.pk})
+            self.assertEqual(ImpactModelSearchDocument.objects.get(base_model=small).title, 'tiny')
+
+            # shared data only marks the documents stale for the command
+            update.reset_mock()
+            with self.captureOnCommitCallbacks(execute=True):
+                self.spatial_aggregation.save()
+            update.assert_not_called()
+        self.assertEqual(ImpactModelSearchDocument.objects.filter(stale=True).count(), 2)
+
+    def test_searchvalue_matches_impact_models_without_search_vector(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            built = create_simple_base_model('LPJmL', 1, self.sector)
+        pending = create_simple_base_model('LPJ-GUESS', 1, self.sector)
+        self.assertFalse(ImpactModel.objects.filter(base_model=pending, search_vector__isnull=False).exists())
+        impact_models = search.filter_public_impact_models({'searchvalue': 'lpj'})
+        self.assertEqual({impact_model.base_model for impact_model in impact_models}, {built, pending})
+        impact_models = search.filter_public_impact_models({'searchvalue': 'guess'})
+        self.assertEqual({impact_model.base_model for impact_model in impact_models}, {pending})
+
+
+class DashboardTestCase(TestCase):
+
+    def setUp(self):
+        Page.get_first_root_node().add_child(instance=ImpactModelsPage(
+            title='Impact models', slug='impactmodels', content=[],
+            private_model_message='Private', common_attributes_text='Common'))
+        self.sector = Sector.objects.create(name='Water (global)', slug='water-global', drkz_folder_name='water_global')
+        User.objects.create_superuser('admin', 'admin@example.com', 'password')
+
+    def count_dashboard_queries(self):
+        request = RequestFactory().get('/dashboard/')
+        request.user = User.objects.get(username='admin')
+        with CaptureQueriesContext(connection) as context:
+            rows = DashboardPage(title='Dashboard', slug='dashboard').get_context(request)['body']['rows']
+        return len(context.captured_queries), rows
+
+    def test_dashboard_query_count_is_constant(self):
+        create_simple_base_model('small', 1, self.sector)
+        # the content type of the page is cached on first use
+        self.count_dashboard_queries()
+        small_count, small_rows = self.count_dashboard_queries()
+        create_simple_base_model('large', 6, self.sector)
+        large_count, large_rows = self.count_dashboard_queries()
+        self.assertLessEqual(large_count, MAX_DASHBOARD_QUERIES)
+        self.assertEqual(small_count, large_count)
+        # every impact model is followed by the rounds its base model is missing
+        self.assertEqual(len(large_rows), (1 + 6) + 6 * (1 + 1))
+        self.assertIn('details/%d/' % BaseImpactModel.objects.get(name='small').id, large_rows[-7]['cols'][0]['texts'][0])
+        self.assertIn('Use model information for', large_rows[-1]['cols'][4]['texts'][1])
+
+
+class TemporaryMediaMixin:
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings = override_settings(MEDIA_ROOT=media_root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+
+class DocumentationPdfTestCase(TemporaryMediaMixin, TestCase):
+
+    def test_pdfs_are_replaced_when_the_base_model_changes(self):
+        sector = Sector.objects.create(name='Water (global)', slug='water-global', drkz_folder_name='water_global')
+        impact_model = create_simple_base_model('model', 1, sector).impact_model.get()
+        version = documentation.get_pdf_version(impact_model)[0]
+        name = documentation.store_pdf(impact_model, documentation.get_pdf_name(impact_model, version), b'%PDF')
+        other = ImpactModel.objects.create(base_model=impact_model.base_model)
+        other_name = documentation.store_pdf(other, documentation.get_pdf_name(other, 'version'), b'%PDF')
+
+        # without the signals, which also set ImpactModel.updated
+        BaseImpactModel.objects.filter(pk=impact_model.base_model_id).update(name='renamed', updated=timezone.now())
+        impact_model = ImpactModel.objects.select_related('base_model').get(pk=impact_model.pk)
+        new_version = documentation.get_pdf_version(impact_model)[0]
+        self.assertNotEqual(new_version, version)
+        new_name = documentation.store_pdf(impact_model, documentation.get_pdf_name(impact_model, new_version), b'%PDF')
+        self.assertFalse(default_storage.exists(name))
+        self.assertTrue(default_storage.exists(new_name))
+        self.assertTrue(default_storage.exists(other_name))
+
+
+    def test_pdfs_are_rendered_again_when_the_documentation_changes(self):
+        class Stop(Exception):
+            pass
+
+        sleeps = [lambda: DataVersion.bump_version(DataVersion.DOCUMENTATION), lambda: None, mock.Mock(side_effect=Stop)]
+        with mock.patch('isi_mip.climatemodels.management.commands.render_documentation_pdfs.render_pdfs', return_value=[]) as render, \
+                mock.patch('time.sleep', side_effect=lambda seconds: sleeps.pop(0)()):
+            with self.assertRaises(Stop):
+                call_command('render_documentation_pdfs', watch=True, stdout=StringIO())
+        self.assertEqual(render.call_count, 2)
+
+
+class ExportJobTestCase(TemporaryMediaMixin, TestCase):
+
+    def test_data_version_is_replaced_after_the_commit(self):
+        version = DataVersion.get_version(DataVersion.EXPORTS)
+        with self.captureOnCommitCallbacks(execute=True):
+            Sector.objects.create(name='Water (global)', slug='water-global', drkz_folder_name='water_global')
+            SimulationRound.objects.create(name='ISIMIP3a', slug='isimip3a', order=1)
+            self.assertEqual(DataVersion.get_version(DataVersion.EXPORTS), version)
+        self.assertNotEqual(DataVersion.get_version(DataVersion.EXPORTS), version)
+
+    def test_unclaimed_jobs_are_run_by_the_request(self):
+        job = exports.get_export_job(ExportJob.PARTICIPANTS, {})
+        self.assertEqual(exports.run_unclaimed_export_job(job).status, ExportJob.PENDING)
+        ExportJob.objects.filter(pk=job.pk).update(created=timezone.now() - timedelta(seconds=exports.get_worker_timeout()))
+        job = exports.run_unclaimed_export_job(exports.get_export_job(ExportJob.PARTICIPANTS, {}))
+        self.assertEqual(job.status, ExportJob.DONE)
+        self.assertTrue(job.file.storage.exists(job.file.name))
+
+    def test_failed_jobs_are_retried_after_a_delay(self):
+        job = exports.get_export_job(ExportJob.PARTICIPANTS, {})
+        with mock.patch.object(exports, 'write_export', side_effect=ValueError('broken')):
+            for attempt in range(1, exports.get_max_attempts() + 1):
+                self.assertEqual(exports.run_next_export_job().pk, job.pk)
+                job.refresh_from_db()
+                self.assertEqual((job.status, job.attempts, job.error), (ExportJob.FAILED, attempt, 'broken'))
+                # the job is queued again only after the delay
+                self.assertEqual(exports.get_export_job(ExportJob.PARTICIPANTS, {}).status, ExportJob.FAILED)
+                ExportJob.objects.filter(pk=job.pk).update(finished=timezone.now() - exports.get_retry_delay(attempt))
+                job = exports.get_export_job(ExportJob.PARTICIPANTS, {})
+            # out of attempts
+            self.assertEqual(job.status, ExportJob.FAILED)
+            self.assertIsNone(exports.run_next_export_job())
+
+    def test_missing_files_are_generated_again(self):
+        job = exports.get_export_job(ExportJob.PARTICIPANTS, {})
+        job = exports.run_next_export_job()
+        self.assertEqual(job.status, ExportJob.DONE)
+        job.file.storage.delete(job.file.name)
+        job = exports.get_export_job(ExportJob.PARTICIPANTS, {})
+        self.assertEqual((job.status, job.attempts), (ExportJob.PENDING, 0))
+        job = exports.run_next_export_job()
+        self.assertTrue(job.file.storage.exists(job.file.name))
+
+    def test_stale_running_jobs_are_claimed_again(self):
+        job = exports.get_export_job(ExportJob.PARTICIPANTS, {})
+        self.assertEqual(exports.claim_export_job().pk, job.pk)
+        # the job is running in another worker
+        self.assertIsNone(exports.claim_export_job())
+        ExportJob.objects.filter(pk=job.pk).update(started=timezone.now() - timedelta(seconds=exports.get_export_job_timeout() + 1))
+        job = exports.claim_export_job()
+        self.assertEqual((job.status, job.attempts), (ExportJob.RUNNING, 2))
+
+
+class OutboxTestCase(TestCase):
+
+    def queue_email(self):
+        return outbox.queue_email('Confirmation', 'Body', to=['responsible@example.com'],
+                                  attachments=[('confirmation.pdf', b'%PDF', 'application/pdf')])
+
+    def test_attachments_are_sent_and_dropped(self):
+        email = self.queue_email()
+        self.assertEqual(outbox.send_queued_emails(), [email])
+        self.assertEqual(mail.outbox[0].attachments, [('confirmation.pdf', b'%PDF', 'application/pdf')])
+        email.refresh_from_db()
+        self.assertEqual(email.status, OutgoingEmail.SENT)
+        self.assertEqual(email.attachments, [{'filename': 'confirmation.pdf', 'mimetype': 'application/pdf'}])
+
+    def test_attachments_are_rolled_back_with_the_email(self):
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                self.queue_email()
+                raise ValueError
+        self.assertFalse(OutgoingEmail.objects.exists())
+
+    def test_stale_sending_emails_are_claimed_again(self):
+        email = self.queue_email()
+        self.assertEqual(outbox.claim_emails(), [email])
+        # the email is being sent by another worker
+        self.assertEqual(outbox.claim_emails(), [])
+        OutgoingEmail.objects.filter(pk=email.pk).update(started=timezone.now() - timedelta(seconds=outbox.get_sending_timeout() + 1))
+        self.assertEqual(outbox.claim_emails(), [email])
+
+    def test_failed_emails_are_retried_after_a_delay(self):
+        email = self.queue_email()
+        for attempt in range(1, outbox.get_max_attempts()):
+            outbox.email_failed(email, 'unreachable')
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts), (OutgoingEmail.PENDING, attempt))
+            self.assertGreater(email.next_attempt, timezone.now() + outbox.get_retry_delay(attempt) - timedelta(seconds=10))
+            self.assertEqual(outbox.claim_emails(), [])
+            OutgoingEmail.objects.filter(pk=email.pk).update(next_attempt=timezone.now())
+            self.assertEqual(outbox.claim_emails(), [email])
+        outbox.email_failed(email, 'unreachable')
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.error), (OutgoingEmail.FAILED, 'unreachable'))
+        self.assertNotIn('content', email.attachments[0])
+        self.assertEqual(outbox.claim_emails(), [])
+
+
+class ConfirmationRequestTestCase(TestCase):
+
+    def setUp(self):
+        Page.get_first_root_node().add_child(instance=ImpactModelsPage(
+            title='Impact models', slug='impactmodels', content=[],
+            private_model_message='Private', common_attributes_text='Common'))
+        sector = Sector.objects.create(name='Water (global)', slug='water-global', drkz_folder_name='water_global')
+        self.user = User.objects.create_user('responsible', 'responsible@example.com', 'password')
+        base_model = create_simple_base_model('model', 2, sector)
+        self.confirmed, self.unconfirmed = base_model.impact_model.order_by('simulation_round__order')
+        self.user.userprofile.responsible.add(self.confirmed, self.unconfirmed)
+        DataPublicationConfirmation.objects.create(impact_model=self.confirmed, email_text='')
+
+    def test_impact_models_with_confirmations_are_skipped(self):
+        site = Site.objects.get(is_default_site=True)
+        DataPublicationRequest.objects.create(site=site, body='{{ data_confirmation_link }}')
+        confirmations = request_data_confirmations(ImpactModel.objects.all(), 'Please confirm', site)
+        self.assertEqual([confirmation.impact_model for confirmation in confirmations], [self.unconfirmed])
+        email = OutgoingEmail.objects.get()
+        self.assertEqual(email.to, ['responsible@example.com'])
+        self.assertIn('/confirm-data/%d/' % self.unconfirmed.pk, email.body)
+        self.assertEqual(request_data_confirmations(ImpactModel.objects.all(), 'Please confirm', site), [])
+        self.assertEqual(OutgoingEmail.objects.count(), 1)
@@ -1,13 +1,15 @@
-from collections import OrderedDict
+import csv
+import json
+from collections import OrderedDict, defaultdict
 
 import xlsxwriter
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db.models import (ForeignKey, ManyToManyField, ManyToManyRel,
                               ManyToOneRel)
 
 from isi_mip.climatemodels.models import (INFORMATION_TYPE_CHOICES,
-                                          BaseImpactModel, ImpactModel,
-                                          ImpactModelInformation,
-                                          ImpactModelQuestion,
+                                          BaseImpactModel, FieldValueResolver,
+                                          ImpactModel, ImpactModelQuestion,
                                           InputDataInformation,
                                           OtherInformation, Sector,
                                           SectorInformationField,
@@ -26,6 +28,10 @@ SKIP_FIELDS = [
     'id',
     'base_model',
     'public',
+    'updated',
+    'search_text',
+    'search_vector',
+    'search_document',
     'index_entries',
     'impact_model',
     'impact_model_responsible',
@@ -62,12 +68,69 @@ SORT_ORDER = {
 }
 
 
-class ImpactModelToXLSX:
-    # https://xlsxwriter.readthedocs.org/en/latest/
-    def __init__(self, res, qs):
-        self.workbook = xlsxwriter.Workbook(res, {'in_memory': True})
+class Echo:
+    # a file-like object for csv.writer, which returns the lines instead of buffering them
+    def write(self, value):
+        return value
+
+
+def generate_csv(rows):
+    writer = csv.writer(Echo())
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def generate_json_lines(records):
+    for record in records:
+        yield json.dumps(record, cls=DjangoJSONEncoder) + '\n'
+
+
+class ImpactModelExport:
+    """
+    The sheets and records of the impact model export, shared by the XLSX, CSV and
+    JSON Lines formats. The impact models are fetched in chunks, together with
+    their relations and documentation, so the full dataset is never held in memory.
+    """
+    CHUNK_SIZE = 100
+
+    def __init__(self, qs):
         self.qs = qs
-        self.xlsxdings()
+        # the choice values are resolved per chunk of collected informations
+        self.resolver = FieldValueResolver(make_pretty=False)
+        self.model_fields = OrderedDict()
+        self.general_titles = []
+        for model in [BaseImpactModel, ImpactModel]:
+            fields = model._meta.get_fields()
+            filtered_fields = [field for field in fields if field.name not in (SKIP_FIELDS)]
+            filtered_fields.sort(key=lambda val: SORT_ORDER[val.name] if val.name in SORT_ORDER else 0)
+            self.model_fields[model.__name__] = [f.name for f in filtered_fields]
+            for field in filtered_fields:
+                if hasattr(field, 'verbose_name'):
+                    self.general_titles.append(field.verbose_name.capitalize())
+                else:
+                    if field.name == 'impact_model_responsible':
+                        self.general_titles.append('Person responsible')
+                    else:
+                        name = field.name.replace("_", " ").capitalize()
+                        self.general_titles.append(name)
+
+        general_questions = {}
+        self.sector_questions = {}
+        for question in ImpactModelQuestion.objects.all():
+            if question.sector_id is None:
+                general_questions.setdefault(question.information_type, question)
+            else:
+                self.sector_questions.setdefault(question.sector_id, question)
+        for information_type, name in INFORMATION_TYPE_CHOICES:
+            if information_type == 'sector_specific_information':
+                continue
+            if information_type not in general_questions:
+                raise ImpactModelQuestion.DoesNotExist('No questions for %s.' % information_type)
+            fields = general_questions[information_type].schema.questions
+            filtered_fields = [field for field in fields if field.name not in (SKIP_FIELDS)]
+            filtered_fields.sort(key=lambda val: SORT_ORDER[val.name] if val.name in SORT_ORDER else 0)
+            self.general_titles = self.general_titles + [field.verbose_name for field in filtered_fields]
+            self.model_fields[information_type] = filtered_fields
 
     def get_field_data(self, model, field_name):
         field = model._meta.get_field(field_name)
@@ -83,85 +146,103 @@ class ImpactModelToXLSX:
             data = getattr(model, field_name) or ''
         return data
 
-    def xlsxdings(self):
-        general = self.workbook.add_worksheet('General Information')
-        general.set_column('A:A', 20)
-        bold = self.workbook.add_format({'bold': True})
-        models = [BaseImpactModel, ImpactModel]
-        model_fields = OrderedDict()
-        all_field_titles = []
-        for model in models:
-            fields = model._meta.get_fields()
-            filtered_fields = [field for field in fields if field.name not in (SKIP_FIELDS)]
-            filtered_fields.sort(key=lambda val: SORT_ORDER[val.name] if val.name in SORT_ORDER else 0)
-            model_fields[model.__name__] = {
-                'class': model,
-                'fields': [f.name for f in filtered_fields],
-            }
-            for field in filtered_fields:
-                if hasattr(field, 'verbose_name'):
-                    all_field_titles.append(field.verbose_name.capitalize())
-                else:
-                    if field.name == 'impact_model_responsible':
-                        all_field_titles.append('Person responsible')
-                    else:
-                        name = field.name.replace("_", " ").capitalize()
-                        all_field_titles.append(name)
-        for information_type, name in INFORMATION_TYPE_CHOICES:
-            if information_type == 'sector_specific_information':
+    def iterate(self, pks):
+        for start in range(0, len(pks), self.CHUNK_SIZE):
+            chunk = pks[start:start + self.CHUNK_SIZE]
+            impact_models = ImpactModel.objects.filter(pk__in=chunk).select_related(
+                'base_model__sector', 'simulation_round', 'main_reference_paper', 'impact_model_information',
+            ).prefetch_related(
+                'base_model__region', 'base_model__impact_model_owner__user', 'other_references',
+            ).in_bulk()
+            for pk in chunk:
+                self.resolver.collect(impact_models[pk].impact_model_information)
+            for pk in chunk:
+                yield impact_models[pk]
+
+    def sectors(self):
+        """
+        Yields the sectors with questions, their questions and the ids of their impact models.
+        """
+        sector_pks = defaultdict(list)
+        for pk, sector_id in ImpactModel.objects.filter(base_model__isnull=False).values_list('pk', 'base_model__sector_id'):
+            sector_pks[sector_id].append(pk)
+        for sector in Sector.objects.all():
+            impact_model_questions = self.sector_questions.get(sector.id)
+            if not impact_model_questions or not impact_model_questions.questions:
                 continue
-            model = ImpactModelQuestion.objects.get(information_type=information_type, sector__isnull=True)
-            fields = model.fields
-            filtered_fields = [field for field in fields if field.get('name') not in (SKIP_FIELDS)]
-            filtered_fields.sort(key=lambda val: SORT_ORDER[val.get('name')] if val.get('name') in SORT_ORDER else 0)
-            all_field_titles = all_field_titles + [field.get('verbose_name') for field in filtered_fields]
-            model_fields[information_type] = {
-                'fields': filtered_fields,
-            }
-        general.write_row(0, 0, data=all_field_titles, cell_format=bold)
-
-        for i, impact_model in enumerate(self.qs):
-            for j, field in enumerate(model_fields['BaseImpactModel']['fields']):
-                data = self.get_field_data(impact_model.base_model, field)
-                general.write(i + 1, j, str(data))
-            for j, field in enumerate(model_fields['ImpactModel']['fields'], start=j + 1):
-                data = self.get_field_data(impact_model, field)
-                general.write(i + 1, j, str(data))
+            yield sector, impact_model_questions.schema.questions, sector_pks[sector.id]
+
+    def general_rows(self):
+        for impact_model in self.iterate(list(self.qs.values_list('pk', flat=True))):
+            row = [str(self.get_field_data(impact_model.base_model, field)) for field in self.model_fields['BaseImpactModel']]
+            row += [str(self.get_field_data(impact_model, field)) for field in self.model_fields['ImpactModel']]
             for information_type, name in INFORMATION_TYPE_CHOICES:
                 if information_type == 'sector_specific_information':
                     continue
                 information = getattr(impact_model.impact_model_information, information_type)
-                for j, field in enumerate(model_fields[information_type]['fields'], start=j + 1):
-                    value = model.get_field_value(field.get('field_type') , information.get(field.get('name'), None), make_pretty=False)
-                    general.write(i + 1, j, str(value))
+                row += [str(self.resolver.resolve(field.field_type, information.get(field.name, None)))
+                        for field in self.model_fields[information_type]]
+            yield row
 
-        for sector in Sector.objects.all():
-            fields = []
-            impact_model_questions = ImpactModelQuestion.objects.filter(sector=sector).first()
-            if not impact_model_questions or not impact_model_questions.questions:
-                continue
-            # if not impact_model_questions.questions:
-            #     continue
-            # elif not sector.model.objects.filter(impact_model__in=self.qs).exists():
-            #     continue
-            # else:
-            #     fields = [field.name for field in sector.model._meta.fields if field.name not in ('id', 'data')]
-            fields = impact_model_questions.fields
+    def sector_rows(self, fields, pks):
+        # the sector sheets list all impact models, not only the ones in self.qs
+        for impact_model in self.iterate(pks):
+            information = impact_model.impact_model_information.sector_specific_information
+            yield [str(impact_model)] + [str(self.resolver.resolve(field.field_type, information.get(field.name, None))) for field in fields]
+
+    def sector_header(self, fields):
+        return ['Impact Model'] + [x.verbose_name for x in fields]
+
+    def records(self):
+        """
+        Yields one record per impact model in self.qs, with the resolved documentation.
+        """
+        for impact_model in self.iterate(list(self.qs.values_list('pk', flat=True))):
+            record = OrderedDict([('id', impact_model.id), ('name', impact_model.base_model.name), ('sector', impact_model.base_model.sector.name)])
+            for field in self.model_fields['BaseImpactModel']:
+                record.setdefault(field, str(self.get_field_data(impact_model.base_model, field)))
+            for field in self.model_fields['ImpactModel']:
+                record[field] = str(self.get_field_data(impact_model, field))
+            information = impact_model.impact_model_information
+            for information_type, name in INFORMATION_TYPE_CHOICES:
+                data = getattr(information, information_type)
+                if information_type == 'sector_specific_information':
+                    question = self.sector_questions.get(impact_model.base_model.sector_id)
+                    fields = question.schema.questions if question else ()
+                else:
+                    fields = self.model_fields[information_type]
+                record[information_type] = OrderedDict(
+                    (field.name, self.resolver.resolve(field.field_type, data.get(field.name, None))) for field in fields)
+            yield record
+
+
+class ImpactModelToXLSX:
+    # https://xlsxwriter.readthedocs.org/en/latest/
+    # In constant_memory mode every row is flushed to a temporary file as soon as
+    # the next one is started, so the rows of each sheet have to be written in order.
+    def __init__(self, res, qs):
+        self.workbook = xlsxwriter.Workbook(res, {'constant_memory': True})
+        self.export = ImpactModelExport(qs)
+        self.xlsxdings()
+
+    def xlsxdings(self):
+        general = self.workbook.add_worksheet('General Information')
+        general.set_column('A:A', 20)
+        bold = self.workbook.add_format({'bold': True})
+        general.write_row(0, 0, data=self.export.general_titles, cell_format=bold)
+        for i, row in enumerate(self.export.general_rows()):
+            general.write_row(i + 1, 0, data=row)
+
+        for sector, fields, pks in self.export.sectors():
             sector_name = 'M. E. and Fisheries (regional)' if sector.name == 'Marine Ecosystems and Fisheries (regional)' else sector.name
             sector_name = 'M. E. and Fisheries (global)' if sector.name == 'Marine Ecosystems and Fisheries (global)' else sector.name
             for ch in ['[', ']', ':', '*', '?', '/', '\\']:
                 if ch in sector_name:
                     sector_name = sector_name.replace(ch, '-')
             sectorsheet = self.workbook.add_worksheet(sector_name[0:31])
-            header_row = ['Impact Model'] + [x.get('verbose_name') for x in fields]
-            sectorsheet.write_row(0, 0, data=header_row, cell_format=bold)
-            for i, impact_model in enumerate(ImpactModel.objects.filter(base_model__sector=sector)):
-                sectorsheet.write(i + 1, 0, str(impact_model))
-                information = impact_model.impact_model_information.sector_specific_information
-
-                for j, field in enumerate(fields):
-                    value = impact_model_questions.get_field_value(field.get('field_type') , information.get(field.get('name'), None), make_pretty=False)
-                    sectorsheet.write(i + 1, j + 1, str(value))
+            sectorsheet.write_row(0, 0, data=self.export.sector_header(fields), cell_format=bold)
+            for i, row in enumerate(self.export.sector_rows(fields, pks)):
+                sectorsheet.write_row(i + 1, 0, data=row)
 
         self.workbook.close()
 
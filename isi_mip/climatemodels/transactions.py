@@ -0,0 +1,29 @@
+from django.db import transaction
+
+
+class CommitQueue:
+    """
+    Collects values during a transaction and passes them to func once, after
+    the commit. The values are kept on the connection, every add registers an
+    on_commit callback, but only the first one to run calls func. Values of
+    rolled back transactions are passed on with the next commit.
+    """
+    def __init__(self, name, func):
+        self.attribute = 'commit_queue_%s' % name
+        self.func = func
+
+    def add(self, values):
+        connection = transaction.get_connection()
+        pending = getattr(connection, self.attribute, None)
+        if pending is None:
+            pending = set()
+            setattr(connection, self.attribute, pending)
+        pending.update(values)
+        transaction.on_commit(self.run)
+
+    def run(self):
+        connection = transaction.get_connection()
+        pending = getattr(connection, self.attribute, None)
+        if pending:
+            setattr(connection, self.attribute, None)
+            self.func(pending)
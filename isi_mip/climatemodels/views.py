@@ -1,31 +1,41 @@
 import json
-import math
-from collections import OrderedDict
+from collections import OrderedDict, defaultdict
 from datetime import datetime
+from itertools import chain
 
-import requests
 from dateutil.relativedelta import relativedelta
 from django.core.serializers.json import DjangoJSONEncoder
+from django.core.files.storage import default_storage
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
-from django.core.mail import EmailMessage
-from django.db.models import Q
-from django.http.response import (HttpResponse, HttpResponseRedirect,
-                                  JsonResponse)
+from django.db.models import Prefetch, Q
+from django.http import Http404
+from django.http.response import (FileResponse, HttpResponse,
+                                  HttpResponseRedirect, JsonResponse,
+                                  StreamingHttpResponse)
 from django.shortcuts import render
-from django.template import Context, RequestContext, Template, defaultfilters
+from django.template import Context, RequestContext, defaultfilters
 from django.template.loader import render_to_string
 from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from django.utils.html import linebreaks, urlize
 from django.utils.safestring import mark_safe
 from django.utils.text import slugify
-from easy_pdf.rendering import (make_response, render_to_pdf,
-                                render_to_pdf_response)
 from wagtail.models import Site
 
+from isi_mip.climatemodels.cache import (get_cached_details,
+                                         set_cached_details)
+from isi_mip.climatemodels.documentation import (
+    generate_pdf_zip, get_documentation_impact_models, get_impact_model_pdf,
+    read_impact_model_pdf)
+from isi_mip.climatemodels.exports import (IMPACT_MODEL_EXPORT_PARAMS,
+                                           get_export_filename,
+                                           get_export_job, get_impact_models,
+                                           run_unclaimed_export_job)
 from isi_mip.climatemodels.forms import (AttachmentModelForm,
                                          BaseImpactModelForm,
                                          ContactInformationForm,
@@ -36,13 +46,21 @@ from isi_mip.climatemodels.forms import (AttachmentModelForm,
                                          OtherInformationModelForm,
                                          TechnicalInformationModelForm,
                                          get_sector_form)
+from isi_mip.climatemodels.listings import (paginate_participants,
+                                            participant_row,
+                                            serialize_participant)
 from isi_mip.climatemodels.models import (Attachment, BaseImpactModel,
-                                          ImpactModel, ImpactModelQuestion,
-                                          InputData, SimulationRound)
-from isi_mip.climatemodels.tools import (ImpactModelToXLSX,
-                                         ParticpantModelToXLSX)
+                                          ExportJob, FieldValueResolver,
+                                          ImpactModel,
+                                          ImpactModelQuestion, InputData,
+                                          OutputData, SimulationRound)
+from isi_mip.climatemodels.outbox import queue_email
+from isi_mip.climatemodels.tools import (ImpactModelExport, generate_csv,
+                                         generate_json_lines)
 from isi_mip.core.models import DataPublicationConfirmation, Invitation
+from isi_mip.core.setting_templates import get_setting_template
 from isi_mip.invitation.views import InvitationView
+from isi_mip.sciencepaper.crossref import CrossRefUnavailable, query_works
 
 STEP_SHOW_DETAILS = 'details'
 STEP_BASE = 'edit_base'
@@ -64,22 +82,26 @@ FORM_STEPS = OrderedDict([
 ])
 
 
-def impact_model_details(page, request, id):
-    try:
-        base_model = BaseImpactModel.objects.get(id=id)
-    except:
-        messages.warning(request, 'Unknown model')
-        return HttpResponseRedirect('/impactmodels/')
-    title = 'Impact model: %s' % base_model.name
-    subpage = {'title': title, 'url': ''}
-    context = {'page': page, 'subpage': subpage, 'headline': ''}
+def build_impact_model_details(impact_model_ids):
+    """
+    Renders the simulation round tabs of the given impact models.
 
-    # context['editlink'] += ' | <a href="{}">admin edit</a>'.format(
-    #     reverse('admin:climatemodels_impactmodel_change', args=(impactmodel.id,)))
+    Everything the tabs render is fetched up front, so the number of queries does
+    not grow with the number of simulation rounds, persons or output data.
+    """
+    impact_models = ImpactModel.objects.filter(id__in=impact_model_ids).select_related(
+        'base_model', 'simulation_round', 'main_reference_paper',
+        'impact_model_information', 'attachment', 'confirmation',
+    ).prefetch_related(
+        'impact_model_responsible__user', 'impact_model_responsible__country', 'other_references',
+        Prefetch('outputdata_set', queryset=OutputData.objects.prefetch_related('drivers')),
+    )
+    impact_models = list(impact_models)
+    resolver = FieldValueResolver([im.impact_model_information for im in impact_models])
 
-    model_simulation_rounds = []
-    for im in base_model.impact_model.filter(public=True):
-        im_values = im.values_to_tuples() + im.impact_model_information.values_to_tuples()
+    details = {}
+    for im in impact_models:
+        im_values = im.values_to_tuples() + im.impact_model_information.values_to_tuples(resolver)
         if hasattr(im, 'attachment'):
             im_values += im.attachment.values_to_tuples()
         model_details = []
@@ -91,30 +113,150 @@ def impact_model_details(page, request, id):
                 model_details.append(res)
         if model_details:
             model_details[0]['opened'] = True
-        edit_link = ''
-        if request.user.is_authenticated and (im in request.user.userprofile.responsible.all() or request.user.is_superuser):
-            edit_link = '<i class="fa fa-cog" aria-hidden="true"></i> <a href="{}">Edit model information for simulation round {}</a>'.format(page.url + page.reverse_subpage(STEP_BASE, args=(im.id,)), im.simulation_round.name)
         output_data = []
-        confirm_data_link = ''
-        if im.can_confirm_data():
-            confirm_data_link = '<i class="fa fa-check-circle" aria-hidden="true"></i> <a href="{}">Confirm data for simulation round {}</a>'.format(page.url + page.reverse_subpage("confirm_data", args=(im.id,)), im.simulation_round.name)
         for od in im.outputdata_set.all():
             text = "Experiments: <i>%s</i><br/>" % od.experiments
-            text += "Climate Drivers: <i>%s</i><br/>" % od.drivers_list or ", ".join([d.name for d in od.drivers.all()])
+            text += "Climate Drivers: <i>%s</i><br/>" % (od.drivers_list or ", ".join([d.name for d in od.drivers.all()]))
             text += "Date: <i>%s</i>" % od.date
             output_data.append({'text': text})
         model_details.insert(1, {
             'term': 'Output Data',
             'definitions': output_data,
         })
+        details[im.id] = render_to_string('widgets/expandable-list.html', {'list': model_details})
+    return details
+
+
+def load_impact_model_details(page, user, base_model):
+    """
+    Returns the simulation round tabs of the impact model detail page.
+
+    The rendered tabs are cached, see isi_mip.climatemodels.cache, only the edit
+    and confirm links are computed for every request.
+    """
+    impact_models = list(base_model.impact_model.filter(public=True).select_related('simulation_round', 'confirmation'))
+    details = get_cached_details([im.id for im in impact_models])
+    missing = [im.id for im in impact_models if im.id not in details]
+    if missing:
+        rendered = build_impact_model_details(missing)
+        set_cached_details(rendered)
+        details.update(rendered)
+    responsible = set()
+    if user.is_authenticated:
+        responsible = set(user.userprofile.responsible.values_list('id', flat=True))
+    page_url = page.url
+
+    model_simulation_rounds = []
+    for im in impact_models:
+        edit_link = ''
+        if user.is_authenticated and (im.id in responsible or user.is_superuser):
+            edit_link = '<i class="fa fa-cog" aria-hidden="true"></i> <a href="{}">Edit model information for simulation round {}</a>'.format(page_url + page.reverse_subpage(STEP_BASE, args=(im.id,)), im.simulation_round.name)
+        confirm_data_link = ''
+        if im.can_confirm_data():
+            confirm_data_link = '<i class="fa fa-check-circle" aria-hidden="true"></i> <a href="{}">Confirm data for simulation round {}</a>'.format(page_url + page.reverse_subpage("confirm_data", args=(im.id,)), im.simulation_round.name)
         model_simulation_rounds.append({
             'simulation_round': im.simulation_round.name,
             'simulation_round_slug': im.simulation_round.slug,
             'model_name': base_model.name,
             'edit_link': edit_link,
-            'details': model_details,
+            'details': details[im.id],
             'confirm_data_link': confirm_data_link,
         })
+    return model_simulation_rounds
+
+
+def get_subpage_url_format(page_url, page, name, count):
+    # the routes only accept digits, the placeholders are replaced by format fields
+    placeholders = ['9' * 12 + str(i) for i in range(count)]
+    url = page_url + page.reverse_subpage(name, args=placeholders)
+    for i, placeholder in enumerate(placeholders):
+        url = url.replace(placeholder, '{%d}' % i)
+    return url
+
+
+def build_dashboard_rows(impage, impact_models, user):
+    """
+    Returns the rows of the dashboard table in a fixed number of queries.
+    Every impact model is followed by the simulation rounds its base model is missing.
+    """
+    impact_models = list(impact_models.select_related('base_model__sector', 'simulation_round'))
+    simulation_rounds = list(SimulationRound.objects.all())
+    simulation_round_names = {sr.id: sr.name for sr in simulation_rounds}
+    # one query for the rounds of all base models, ordered like can_duplicate_from
+    base_model_rounds = defaultdict(set)
+    duplicate_impact_models = {}
+    base_model_ids = {imodel.base_model_id for imodel in impact_models}
+    other_impact_models = ImpactModel.objects.filter(base_model__in=base_model_ids).order_by('simulation_round')
+    for imid, bmid, srid in other_impact_models.values_list('id', 'base_model_id', 'simulation_round_id'):
+        base_model_rounds[bmid].add(srid)
+        duplicate_impact_models.setdefault(bmid, (imid, srid))
+
+    impage_url = impage.url
+    details_url = get_subpage_url_format(impage_url, impage, 'details', 1)
+    edit_url = get_subpage_url_format(impage_url, impage, 'edit_base', 1)
+    create_url = get_subpage_url_format(impage_url, impage, 'create', 2)
+    duplicate_url = get_subpage_url_format(impage_url, impage, 'duplicate', 2)
+    impage_details = "<span class='action'><a href='{0}' class=''>{1}</a></span>"
+    impage_edit = "<span class='action'><i class='fa fa-edit'></i> <a href='{0}' class=''>Edit model information for {1}</a></span>"
+    impage_create = "<span class='action'><i class='fa fa-file-o'></i> <a href='{0}' class=''>Enter ALL new model information for {1}</a></span>"
+    impage_duplicate = "<span class='action'><i class='fa fa-files-o'></i> <a href='{0}' class=''>Use model information for {1} as starting point for {2}</a></span>"
+
+    bodyrows = []
+    for imodel in impact_models:
+        values = [
+            [impage_details.format(details_url.format(imodel.base_model.id), imodel.base_model.name)],
+            [imodel.base_model.sector.name],
+            [imodel.simulation_round.name],
+            ['<i class="fa fa-{}" aria-hidden="true"></i>'.format('check' if imodel.public else 'times')],
+            [impage_edit.format(edit_url.format(imodel.id), imodel.simulation_round.name)],
+        ]
+        row = {
+            'cols': [{'texts': x} for x in values],
+        }
+        bodyrows.append(row)
+        duplicate_impact_model = duplicate_impact_models.get(imodel.base_model_id)
+        for sr in simulation_rounds:
+            if sr.id in base_model_rounds[imodel.base_model_id]:
+                continue
+            duplicate_model_text = ''
+            create_model_text = ''
+            if user.is_authenticated and user.is_superuser:
+                create_model_text = impage_create.format(create_url.format(imodel.base_model.id, sr.id), sr.name)
+                if duplicate_impact_model:
+                    duplicate_id, duplicate_round_id = duplicate_impact_model
+                    duplicate_model_text = impage_duplicate.format(
+                        duplicate_url.format(duplicate_id, sr.id), simulation_round_names.get(duplicate_round_id), sr.name)
+            values = [
+                [imodel.base_model.name],
+                [imodel.base_model.sector.name],
+                [sr.name],
+                [],
+                [
+                    create_model_text,
+                    duplicate_model_text
+                ],
+            ]
+            row = {
+                'cols': [{'texts': x} for x in values],
+            }
+            bodyrows.append(row)
+    return bodyrows
+
+
+def impact_model_details(page, request, id):
+    try:
+        base_model = BaseImpactModel.objects.select_related('sector').prefetch_related('region').get(id=id)
+    except:
+        messages.warning(request, 'Unknown model')
+        return HttpResponseRedirect('/impactmodels/')
+    title = 'Impact model: %s' % base_model.name
+    subpage = {'title': title, 'url': ''}
+    context = {'page': page, 'subpage': subpage, 'headline': ''}
+
+    # context['editlink'] += ' | <a href="{}">admin edit</a>'.format(
+    #     reverse('admin:climatemodels_impactmodel_change', args=(impactmodel.id,)))
+
+    model_simulation_rounds = load_impact_model_details(page, request.user, base_model)
     context['description'] = urlize(base_model.short_description or '')
     context['model_simulation_rounds'] = model_simulation_rounds
     context['model_name'] = base_model.name
@@ -211,84 +353,109 @@ def confirm_data(page, request, id):
             'publication_by': confirmation.get_confirmed_publication_date_display(),
             'publication_date': defaultfilters.date(publication_date_date, 'Y-m-d'),
         }
-        confirm_body = Template(confirm_email.body)
-        confirm_body = confirm_body.render(Context(context))
+        confirm_body = get_setting_template(confirm_email).render(Context(context))
         # add newlines to the end of body to split attachment from text
         confirm_body += "\n\n"
         ccs = impact_model.impact_model_responsible.exclude(pk=request.user.pk)
-        pdf = render_impact_model_to_pdf(impact_model)
+        pdf = read_impact_model_pdf(impact_model)
         subject = "%s for %s" % (confirm_email.subject, confirmation.impact_model.base_model.name)
-        email = EmailMessage(
+        filename = "DataConfirmation_%s_%s_%s.pdf" % (
+            impact_model.simulation_round.slug,
+            impact_model.base_model.sector.slug,
+            slugify(impact_model.base_model.name)
+        )
+        queue_email(
             subject=subject,
             body=confirm_body,
             reply_to=[request.user.email],
             from_email='ISIMIP Data Confirmation <%s>' % settings.DATA_CONFIRMATION_EMAIL,
             to=[settings.DATA_CONFIRMATION_EMAIL],
             cc=[cc.email for cc in ccs],
+            attachments=[(filename, pdf, "application/pdf")],
         )
-        filename = "DataConfirmation_%s_%s_%s.pdf" % (
-            impact_model.simulation_round.slug,
-            impact_model.base_model.sector.slug,
-            slugify(impact_model.base_model.name)
-        )
-        email.attach(filename, pdf, "application/pdf")
-        email.send()
-        messages.success(request, 'The data confirmation email has been sent.')
+        messages.success(request, 'The data confirmation email will be sent shortly.')
         return HttpResponseRedirect('/dashboard/')
 
 
 def impact_model_pdf(page, request, id):
     try:
-        impact_model = ImpactModel.objects.get(id=id)
+        impact_model = ImpactModel.objects.select_related('base_model').get(id=id)
     except ImpactModel.DoesNotExist:
         messages.warning(request, 'Unknown model')
         return HttpResponseRedirect('/impactmodels/')
-    pdf = render_impact_model_to_pdf(impact_model)
-    return make_response(pdf)
+    name, version, last_modified = get_impact_model_pdf(impact_model)
+    etag = '"%s"' % version
+    response = get_conditional_response(request, etag=etag, last_modified=int(last_modified.timestamp()))
+    if response is None:
+        response = FileResponse(default_storage.open(name, 'rb'), content_type='application/pdf')
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
     # return render_to_response('climatemodels/pdf.html', context)
 
 
-def render_impact_model_to_pdf(impact_model):
-    im_values = impact_model.values_to_tuples() + impact_model.fk_sector.values_to_tuples()
-    model_details = []
-    for k, v in im_values:
-        if any((y for x, y in v)):
-            res = {'term': k,
-                   'definitions': ({'text': "%s: <i>%s</i>" % (x, y), 'key': x, 'value': y} for x, y in v if y)
-                   }
-            model_details.append(res)
-    context = {
-        "impact_model_name": impact_model.base_model.name,
-        "simulation_round": impact_model.simulation_round,
-        "model_details": model_details,
-    }
-    return render_to_pdf("climatemodels/pdf.html", context)
+def impact_model_pdf_bundle(page, request):
+    simulation_round = request.GET.get('simulation_round')
+    sector = request.GET.get('sector')
+    if not (simulation_round or sector):
+        messages.warning(request, 'Please choose a simulation round or a sector.')
+        return HttpResponseRedirect(page.url)
+    impact_models = get_documentation_impact_models(simulation_round, sector, public=not request.user.is_superuser)
+    # the missing pdfs are rendered by render_documentation_pdfs, not in the request
+    response = StreamingHttpResponse(generate_pdf_zip(impact_models, render=False), content_type='application/zip')
+    filename = slugify('Documentation %s %s' % (simulation_round or '', sector or ''))
+    response['Content-Disposition'] = 'attachment; filename="%s.zip"' % filename
+    return response
+
+
+def export_download(page, request, kind, params):
+    job = run_unclaimed_export_job(get_export_job(kind, params))
+    if job.status == ExportJob.FAILED:
+        messages.error(request, 'The download could not be prepared. Please try again later.')
+        return HttpResponseRedirect(page.url)
+    if job.status != ExportJob.DONE:
+        messages.info(request, 'The download is being prepared. Please try again in a few minutes.')
+        return HttpResponseRedirect(page.url)
+    return FileResponse(job.file.open('rb'), as_attachment=True, filename=get_export_filename(job),
+                        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
 
 
 def impact_model_download(page, request):
-    impact_models = ImpactModel.objects.filter(public=True)
-    if 'sector' in request.GET:
-        impact_models = impact_models.filter(base_model__sector__name=request.GET['sector'])
-    if 'simulation_round' in request.GET:
-        impact_models = impact_models.filter(simulation_round__name=request.GET['simulation_round'])
-    if 'searchvalue' in request.GET:
-        q = request.GET['searchvalue']
-        query = Q(base_model__name__icontains=q) | Q(base_model__sector__name__icontains=q) | Q(simulation_round__name__icontains=q) \
-            | Q(base_model__contactperson__name__icontains=q) | Q(base_model__contactperson__email__icontains=q)
-        impact_models = impact_models.filter(query)
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = 'attachment; filename="ImpactModels {:%Y-%m-%d}.xlsx"'.format(datetime.now())
-    ImpactModelToXLSX(response, impact_models)
+    params = {key: request.GET[key] for key in IMPACT_MODEL_EXPORT_PARAMS if key in request.GET}
+    export_format = request.GET.get('format', 'xlsx')
+    if export_format == 'csv':
+        return impact_model_csv_download(params, request.GET.get('sheet'))
+    elif export_format == 'jsonl':
+        export = ImpactModelExport(get_impact_models(params))
+        response = StreamingHttpResponse(generate_json_lines(export.records()), content_type='application/x-ndjson')
+        response['Content-Disposition'] = 'attachment; filename="ImpactModels {:%Y-%m-%d}.jsonl"'.format(datetime.now())
+        return response
+    elif export_format != 'xlsx':
+        raise Http404('Unknown format.')
+    return export_download(page, request, ExportJob.IMPACT_MODELS, params)
+
+
+def impact_model_csv_download(params, sheet=None):
+    # the sheets of the workbook are exported separately, the sectors by slug
+    export = ImpactModelExport(get_impact_models(params))
+    if not sheet or sheet == 'general':
+        rows = chain([export.general_titles], export.general_rows())
+        filename = 'ImpactModels {:%Y-%m-%d}.csv'.format(datetime.now())
+    else:
+        for sector, fields, pks in export.sectors():
+            if sector.slug == sheet:
+                rows = chain([export.sector_header(fields)], export.sector_rows(fields, pks))
+                filename = 'ImpactModels {} {:%Y-%m-%d}.csv'.format(sector.name, datetime.now())
+                break
+        else:
+            raise Http404('Unknown sheet.')
+    response = StreamingHttpResponse(generate_csv(rows), content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="%s"' % filename
     return response
 
 
 def participant_download(page, request):
-    participants = User.objects.filter(userprofile__show_in_participant_list=True).order_by('last_name')
-    participants = participants.select_related('userprofile').prefetch_related('userprofile__responsible__simulation_round', 'userprofile__responsible__base_model__sector', 'userprofile__sector', 'userprofile__country')
-    response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response['Content-Disposition'] = 'attachment; filename="Participants {:%Y-%m-%d}.xlsx"'.format(datetime.now())
-    ParticpantModelToXLSX(response, participants)
-    return response
+    return export_download(page, request, ExportJob.PARTICIPANTS, {})
 
 
 def input_data_details(page, request, id):
@@ -336,10 +503,8 @@ def input_data_details(page, request, id):
 
 def crossref_proxy(request):
     try:
-        url = 'http://api.crossref.org/works?rows={rows}&query={query}'
-        response = requests.get(url.format(rows=5, query=request.GET['query']))
-        res = response.json()
-    except requests.exceptions.ConnectionError as e:
+        res = query_works(request.GET['query'])
+    except CrossRefUnavailable:
         res = {
             'unavailable': True,
             'message': 'CrossRef.org is currently unavailable. Please try again later.'
@@ -599,14 +764,12 @@ def send_email(request, user, imodel):
     }
     site = Site.find_for_request(request)
     invitation = Invitation.for_site(site)
-    template = Template(invitation.subject)
-    subject = template.render(Context(context))
+    subject = get_setting_template(invitation, 'subject').render(Context(context))
     # Force subject to a single line to avoid header-injection
     # issues.
     subject = ''.join(subject.splitlines())
-    template = Template(invitation.body)
-    message = template.render(Context(context))
-    user.email_user(subject, message, settings.DEFAULT_FROM_EMAIL)
+    message = get_setting_template(invitation).render(Context(context))
+    queue_email(subject, message, settings.DEFAULT_FROM_EMAIL, [user.email])
 
 
 def update_contact_information_view(request, page, extra_context):
@@ -649,38 +812,22 @@ def show_participants(request, extra_context):
     context = {}
     if request.user.groups.filter(name='ISIMIP-Team').exists():
         # user has the right to view the participants list
-        participants = User.objects.filter(userprofile__show_in_participant_list=True).order_by('last_name')
-        participants = participants.select_related('userprofile').prefetch_related('userprofile__responsible__simulation_round', 'userprofile__responsible__base_model__sector', 'userprofile__sector', 'userprofile__country')
         result = {'head': {}, 'body': {}}
         result['head'] = {
             'cols': [{'text': 'Name'}, {'text': 'Email'}, {'text': 'Institute(Country)'}, {'text': 'Model'}, {'text': 'Sector'}]
         }
-        bodyrows = []
-        result['body'] = {'rows': bodyrows}
         # Filter und Suchfelder
         result['tableid'] = 'participantstable'
         result['searchfield'] = {'value': ''}
         result['selectors'] = []
-        # Tabelle
-        rows_per_page = 50
-        for i, participant in enumerate(participants):
-            country = participant.userprofile.country and " (%s)" % participant.userprofile.country or ''
-            institute = participant.userprofile.institute or ""
-            sectors = participant.userprofile.responsible.values_list('base_model__sector__name', flat=True).distinct()
-            if not sectors:
-                sectors = participant.userprofile.sector.all().values_list('name', flat=True).distinct()
-            values = [["{0.name}".format(participant.userprofile)]]
-            values += [["<a href='mailto:{0.email}'>{0.email}</a>".format(participant)]]
-            values += [["{0}{1}".format(institute, country)]]
-            values += [["<a href='/impactmodels/details/{0.base_model.id}/'>{0.base_model.name} ({0.simulation_round.name})</a><br>".format(model) for model in participant.userprofile.responsible.all()]]
-            values += [["{0}<br>".format(sector) for sector in sectors]]
-            bodyrows.append({
-                'invisible': i >= rows_per_page,
-                'cols': [{'texts': x} for x in values],
-            })
-        numpages = math.ceil(participants.count() / rows_per_page)
+        # Tabelle, only the first page is rendered, the others are fetched from the api
+        result['apiurl'] = reverse('api:participants_api')
+        page = paginate_participants({})
+        result['body'] = {'rows': [participant_row(serialize_participant(participant)) for participant in page.object_list]}
+        result['norowvisible'] = not page.object_list
+        numpages = page.paginator.num_pages
         result['pagination'] = {
-            'rowsperpage': (rows_per_page),
+            'rowsperpage': page.paginator.per_page,
             'numberofpages': numpages,  # number of pages with current filters
             'pagenumbers': [{'number': i + 1, 'invisible': False} for i in range(numpages)],
             'activepage': 1,  # set to something between 1 and numberofpages
@@ -5,6 +5,8 @@ from django.contrib.auth.admin import UserAdmin
 from django.forms import CheckboxSelectMultiple
 
 from isi_mip.climatemodels.models import BaseImpactModel, ImpactModel, SimulationRound
+from isi_mip.contrib.columns import (USER_PREFETCH_RELATED, USER_SELECT_RELATED,
+                                     admin_column)
 from isi_mip.contrib.models import UserProfile, Role, Country
 
 
@@ -59,44 +61,13 @@ class UserAdmin(UserAdmin):
     save_on_top = True
 
     def get_queryset(self, request):
-        return super(UserAdmin, self).get_queryset(request).select_related('userprofile').prefetch_related('userprofile__owner', 'userprofile__responsible', 'userprofile__sector', 'userprofile__country')
-
-    def get_responsible(self, obj):
-        if obj.userprofile.responsible.exists():
-            return ', '.join(['%s(%s)' % (responsible.base_model.name, responsible.simulation_round) for responsible in obj.userprofile.responsible.all()])
-        return '-'
-    get_responsible.admin_order_field = 'userprofile__responsible__base_model__name'
-    get_responsible.short_description = 'Responsible'
-    get_responsible.allow_tags = True
-
-    def get_show_in_participant_list(self, obj):
-        return obj.userprofile.show_in_participant_list
-    get_show_in_participant_list.admin_order_field = 'userprofile__show_in_participant_list'
-    get_show_in_participant_list.short_description = 'Show in participant list'
-    get_show_in_participant_list.boolean = True
-
-    def get_name(self, obj):
-        return '%s %s' % (obj.first_name, obj.last_name)
-    get_name.admin_order_field = 'last_name'
-    get_name.short_description = 'Name'
-
-    def get_sector(self, obj):
-        if obj.userprofile.sector.exists():
-            return ', '.join([sector.name for sector in obj.userprofile.sector.all()])
-        return '-'
-    get_sector.admin_order_field = 'userprofile__sector__name'
-    get_sector.short_description = 'Sector'
-    get_sector.allow_tags = True
-
-    def get_country(self, obj):
-        res = ""
-        if obj.userprofile.institute:
-            res = obj.userprofile.institute
-        if obj.userprofile.country:
-            res = res + "(%s)" % obj.userprofile.country.name
-        return res
-    get_country.admin_order_field = 'userprofile__country__name'
-    get_country.short_description = 'Country'
+        return super(UserAdmin, self).get_queryset(request).select_related(*USER_SELECT_RELATED).prefetch_related(*USER_PREFETCH_RELATED)
+
+    get_responsible = admin_column('get_responsible')
+    get_show_in_participant_list = admin_column('get_show_in_participant_list', 'Show in participant list')
+    get_name = admin_column('get_name')
+    get_sector = admin_column('get_sector')
+    get_country = admin_column('get_country')
 
 
 admin.site.unregister(User)
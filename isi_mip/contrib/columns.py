@@ -0,0 +1,98 @@
+from collections import OrderedDict, namedtuple
+
+from django.db.models import prefetch_related_objects
+
+# The user columns of the admin list and the csv export. The values only use the
+# relations in USER_SELECT_RELATED and USER_PREFETCH_RELATED.
+UserColumn = namedtuple('UserColumn', ['name', 'title', 'value', 'order_field', 'boolean'], defaults=(None, False))
+
+USER_SELECT_RELATED = ('userprofile__country',)
+USER_PREFETCH_RELATED = (
+    'userprofile__owner',
+    'userprofile__responsible__base_model',
+    'userprofile__responsible__simulation_round',
+    'userprofile__sector',
+)
+
+
+def get_responsible(obj):
+    responsible = obj.userprofile.responsible.all()
+    if responsible:
+        return ', '.join(['%s(%s)' % (impact_model.base_model.name, impact_model.simulation_round) for impact_model in responsible])
+    return '-'
+
+
+def get_show_in_participant_list(obj):
+    return obj.userprofile.show_in_participant_list
+
+
+def get_name(obj):
+    return '%s %s' % (obj.first_name, obj.last_name)
+
+
+def get_sector(obj):
+    sectors = obj.userprofile.sector.all()
+    if sectors:
+        return ', '.join([sector.name for sector in sectors])
+    return '-'
+
+
+def get_country(obj):
+    res = ""
+    if obj.userprofile.institute:
+        res = obj.userprofile.institute
+    if obj.userprofile.country:
+        res = res + "(%s)" % obj.userprofile.country.name
+    return res
+
+
+USER_COLUMNS = OrderedDict((column.name, column) for column in [
+    UserColumn('email', 'Email', lambda obj: obj.email),
+    UserColumn('get_name', 'Name', get_name, 'last_name'),
+    UserColumn('get_country', 'Country', get_country, 'userprofile__country__name'),
+    UserColumn('get_responsible', 'Responsible', get_responsible, 'userprofile__responsible__base_model__name'),
+    UserColumn('get_sector', 'Sector', get_sector, 'userprofile__sector__name'),
+    UserColumn('is_active', 'Is active?', lambda obj: obj.is_active),
+    UserColumn('get_show_in_participant_list', 'Show in participant list?', get_show_in_participant_list, 'userprofile__show_in_participant_list', True),
+])
+
+USER_EXPORT_COLUMNS = ('email', 'get_name', 'get_country', 'get_responsible', 'get_sector', 'is_active', 'get_show_in_participant_list')
+
+
+def admin_column(name, short_description=None):
+    """
+    Returns a UserAdmin method for the column.
+    """
+    column = USER_COLUMNS[name]
+
+    def value(self, obj):
+        return column.value(obj)
+    value.short_description = short_description or column.title
+    if column.order_field:
+        value.admin_order_field = column.order_field
+    if column.boolean:
+        value.boolean = True
+    return value
+
+
+def iterate_users(queryset, chunk_size=500):
+    """
+    Yields the users with their related objects, fetched chunk by chunk.
+    Before Django 4.1 iterator() ignores prefetch_related, so every chunk is prefetched separately.
+    """
+    chunk = []
+    for user in queryset.select_related(*USER_SELECT_RELATED).iterator(chunk_size=chunk_size):
+        chunk.append(user)
+        if len(chunk) == chunk_size:
+            prefetch_related_objects(chunk, *USER_PREFETCH_RELATED)
+            yield from chunk
+            chunk = []
+    prefetch_related_objects(chunk, *USER_PREFETCH_RELATED)
+    yield from chunk
+
+
+def user_rows(queryset, names=USER_EXPORT_COLUMNS, chunk_size=500):
+    columns = [USER_COLUMNS[name] for name in names]
+    yield [column.title for column in columns]
+    for user in iterate_users(queryset, chunk_size):
+        yield [column.value(user) for column in columns]
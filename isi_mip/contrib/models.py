@@ -1,9 +1,13 @@
 from django.db import models
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.utils.safestring import mark_safe
 
-from isi_mip.climatemodels.models import Sector, BaseImpactModel, ImpactModel
+from isi_mip.climatemodels.cache import (impact_model_m2m_changed,
+                                         shared_data_changed, user_changed,
+                                         user_profile_changed)
+from isi_mip.climatemodels.models import (Sector, BaseImpactModel, ImpactModel, export_data_changed,
+                                          search_document_m2m_changed, search_document_people_changed)
 
 
 class Role(models.Model):
@@ -69,3 +73,16 @@ def create_profile(sender, instance, **kwargs):
 
 
 post_save.connect(create_profile, sender=User)
+post_save.connect(user_changed, sender=User)
+post_save.connect(user_profile_changed, sender=UserProfile)
+post_delete.connect(shared_data_changed, sender=UserProfile)
+post_save.connect(shared_data_changed, sender=Country)
+m2m_changed.connect(impact_model_m2m_changed, sender=UserProfile.responsible.through)
+for signal in (post_save, post_delete):
+    for sender in (User, UserProfile, Country):
+        signal.connect(export_data_changed, sender=sender)
+for sender in (UserProfile.sector.through, UserProfile.owner.through, UserProfile.responsible.through):
+    m2m_changed.connect(export_data_changed, sender=sender)
+post_save.connect(search_document_people_changed, sender=User)
+post_save.connect(search_document_people_changed, sender=UserProfile)
+m2m_changed.connect(search_document_m2m_changed, sender=UserProfile.responsible.through)
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models.signals import post_save
 from modelcluster.fields import ParentalKey
 from modelcluster.models import ClusterableModel
 from wagtail.contrib.settings.models import BaseSiteSetting
@@ -8,6 +9,8 @@ from wagtail.models import Orderable
 from wagtail import blocks
 from wagtail.fields import StreamField
 
+from isi_mip.core.setting_templates import setting_changed
+
 
 @register_setting(icon='list-ul')
 class HeaderLinks(ClusterableModel, BaseSiteSetting):
@@ -100,3 +103,7 @@ class DataPublicationRequest(BaseSiteSetting):
 class DataPublicationConfirmation(BaseSiteSetting):
     subject = models.CharField(max_length=500, help_text='Data publication confirmation subject', default="[ISIMIP] Data confirmation")
     body = models.TextField(help_text='You can use the following tokens in the email template: {{model_contact_person}}, {{simulation_round}}, {{impact_model_name}}, {{custom_text}}, {{license}}, {{publication_by}}, {{publication_date}}')
+
+
+for sender in (Invitation, DataPublicationRequest, DataPublicationConfirmation):
+    post_save.connect(setting_changed, sender=sender)
@@ -0,0 +1,23 @@
+import hashlib
+
+from django.template import Template
+
+# The email bodies and subjects of the site settings are django templates. They are
+# compiled once per process and kept by setting model, site, field and content hash.
+# Saving a setting drops its entries, an entry of a setting saved in another
+# process is not found anymore, because the hash of its content has changed.
+_compiled_templates = {}
+
+
+def get_setting_template(setting, field='body'):
+    source = getattr(setting, field)
+    key = (setting._meta.label, setting.site_id, field, hashlib.md5(source.encode()).hexdigest())
+    template = _compiled_templates.get(key)
+    if template is None:
+        template = _compiled_templates[key] = Template(source)
+    return template
+
+
+def setting_changed(sender, instance, **kwargs):
+    for key in [key for key in _compiled_templates if key[:2] == (sender._meta.label, instance.site_id)]:
+        _compiled_templates.pop(key, None)
@@ -25,25 +25,26 @@ from wagtail.contrib.routable_page.models import RoutablePageMixin, route
 from wagtail.fields import RichTextField, StreamField
 from wagtail.models import Page
 from wagtail.search import index
-from wagtail.search.backends import get_search_backend
 from wagtail.search.models import Query
 from wagtail.snippets.models import register_snippet
 
 from isi_mip.climatemodels.blocks import (ImpactModelsBlock, InputDataBlock,
                                           OutputDataBlock)
-from isi_mip.climatemodels.models import (BaseImpactModel, ImpactModel, Sector,
-                                          SimulationRound)
+from isi_mip.climatemodels.models import ImpactModel, Sector, SimulationRound
+from isi_mip.climatemodels.search import search_impact_models
 from isi_mip.climatemodels.views import (STEP_ATTACHMENT, STEP_BASE,
                                          STEP_DETAIL, STEP_INPUT_DATA,
                                          STEP_OTHER, STEP_SECTOR,
                                          STEP_TECHNICAL_INFORMATION,
-                                         confirm_data, create_new_impact_model,
+                                         build_dashboard_rows, confirm_data, create_new_impact_model,
                                          duplicate_impact_model,
                                          impact_model_details,
                                          impact_model_download,
                                          impact_model_edit,
                                          impact_model_edit_updated,
-                                         impact_model_pdf, input_data_details,
+                                         impact_model_pdf,
+                                         impact_model_pdf_bundle,
+                                         input_data_details,
                                          participant_download,
                                          show_participants,
                                          update_contact_information_view)
@@ -328,16 +329,18 @@ class HomePage(RoutablePageWithDefault):
         context = {'page': self, 'subpage': subpage, 'headline': ''}
         # Search
         search_query = request.GET.get('query', None)
+        search_sector = request.GET.get('sector', None)
+        search_simulation_round = request.GET.get('simulation_round', None)
         impact_model_page = ImpactModelsPage.objects.first()
+        facets = {}
         if search_query:
             page_results = Page.objects.live().not_type((BlogIndexPage)).search(search_query).annotate_score("score")
 
             # Log the query so Wagtail can suggest promoted results
             Query.get(search_query).add_hit()
 
-            # Also query non-wagtail models
-            s = get_search_backend()
-            model_results = s.search(search_query, BaseImpactModel.objects.filter(impact_model__public=True).distinct())
+            # Also query the impact model search documents
+            model_results, facets = search_impact_models(search_query, search_sector, search_simulation_round)
 
         else:
             page_results = []
@@ -347,6 +350,9 @@ class HomePage(RoutablePageWithDefault):
             'search_query': search_query,
             'page_results': page_results,
             'model_results': model_results,
+            'facets': facets,
+            'search_sector': search_sector,
+            'search_simulation_round': search_simulation_round,
             'impact_model_page': impact_model_page,
         })
         # raise Exception(model_results)
@@ -443,6 +449,10 @@ class ImpactModelsPage(RoutablePageWithDefault):
     def pdf(self, request, id):
         return impact_model_pdf(self, request, id)
 
+    @route(r'^pdf/bundle/$')
+    def pdf_bundle(self, request):
+        return impact_model_pdf_bundle(self, request)
+
     @route(r'edit/(?P<id>[0-9]*)/$')
     def edit_base(self, request, id=None):
         return impact_model_edit(self, request, id, STEP_BASE)
@@ -557,54 +567,10 @@ class DashboardPage(RoutablePageWithDefault):
         if request.user.is_authenticated and request.user.is_superuser:
             impact_models = ImpactModel.objects.all()
         impage = ImpactModelsPage.objects.get()
-        impage_details = lambda imid: "<span class='action'><a href='{0}' class=''>{{0}}</a></span>".format(
-            impage.url + impage.reverse_subpage('details', args=(imid, )))
-        impage_edit = lambda imid: "<span class='action'><i class='fa fa-edit'></i> <a href='{0}' class=''>Edit model information for {{0}}</a></span>".format(
-            impage.url + impage.reverse_subpage('edit_base', args=(imid,)))
-        impage_create = lambda bmid, srid: "<span class='action'><i class='fa fa-file-o'></i> <a href='{0}' class=''>Enter ALL new model information for {{0}}</a></span>".format(
-            impage.url + impage.reverse_subpage('create', args=(bmid, srid)))
-        impage_duplicate = lambda imid, srid: "<span class='action'><i class='fa fa-files-o'></i> <a href='{0}' class=''>Use model information for {{0}} as starting point for {{1}}</a></span>".format(
-            impage.url + impage.reverse_subpage('duplicate', args=(imid, srid)))
         context['head'] = {
             'cols': [{'text': 'Model'}, {'text': 'Sector'}, {'text': 'Simulation round'}, {'text': 'Public'}, {'text': 'Action'}]
         }
-
-        bodyrows = []
-        for imodel in impact_models:
-            values = [
-                [impage_details(imodel.base_model.id).format(imodel.base_model.name)],
-                [imodel.base_model.sector.name],
-                [imodel.simulation_round.name],
-                ['<i class="fa fa-{}" aria-hidden="true"></i>'.format('check' if imodel.public else 'times')],
-                [impage_edit(imodel.id).format(imodel.simulation_round.name)],
-            ]
-            row = {
-                'cols': [{'texts': x} for x in values],
-            }
-            bodyrows.append(row)
-            duplicate_impact_model = imodel.base_model.can_duplicate_from()
-            for sr in imodel.base_model.get_missing_simulation_rounds():
-                duplicate_model_text = ''
-                create_model_text = ''
-                if request.user.is_authenticated and request.user.is_superuser:
-                    create_model_text = impage_create(imodel.base_model.id, sr.id).format(sr.name)
-                    if duplicate_impact_model:
-                        duplicate_model_text = impage_duplicate(duplicate_impact_model.id, sr.id).format(duplicate_impact_model.simulation_round, sr.name)
-                values = [
-                    [imodel.base_model.name],
-                    [imodel.base_model.sector.name],
-                    [sr.name],
-                    [],
-                    [
-                        create_model_text,
-                        duplicate_model_text
-                    ],
-                ]
-                row = {
-                    'cols': [{'texts': x} for x in values],
-                }
-                bodyrows.append(row)
-        context['body'] = {'rows': bodyrows}
+        context['body'] = {'rows': build_dashboard_rows(impage, impact_models, request.user)}
         if request.user.groups.filter(name='ISIMIP-Team').exists():
             context['show_participants_link'] = True
         return context
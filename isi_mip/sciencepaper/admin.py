@@ -1,5 +1,12 @@
 from django.contrib import admin
 
-from isi_mip.sciencepaper.models import Paper
+from isi_mip.sciencepaper.models import DOIMetadata, Paper
 
-admin.site.register(Paper)
\ No newline at end of file
+admin.site.register(Paper)
+
+
+@admin.register(DOIMetadata)
+class DOIMetadataAdmin(admin.ModelAdmin):
+    list_display = ('doi', 'fetched', 'attempted', 'error')
+    search_fields = ('doi',)
+    readonly_fields = ('fetched', 'attempted')
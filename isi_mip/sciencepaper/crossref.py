@@ -0,0 +1,172 @@
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from urllib.parse import quote
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+# The lookups of the paper editor run while the user types, so the client keeps
+# the connections to CrossRef open, gives up after a short timeout and caches
+# the results per normalized query. Identical lookups running at the same time
+# wait for the first one instead of calling CrossRef again.
+CROSSREF_URL = 'https://api.crossref.org/works'
+DOI_URL = 'https://doi.org/'
+
+
+class CrossRefError(Exception):
+    pass
+
+
+class CrossRefUnavailable(CrossRefError):
+    pass
+
+
+def normalize_query(query):
+    return ' '.join(query.lower().split())
+
+
+class CrossRefClient:
+    def __init__(self, url=CROSSREF_URL, timeout=(3.05, 5), cache_size=512, cache_ttl=60 * 60, pool_size=10, doi_url=DOI_URL):
+        self.url = url
+        self.doi_url = doi_url
+        # the connect and the read timeout in seconds
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._cache = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def _get_cached(self, key):
+        # must be called with the lock held
+        if key not in self._cache:
+            return None
+        expires, result = self._cache[key]
+        if expires < time.monotonic():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return result
+
+    def _set_cached(self, key, result):
+        # must be called with the lock held
+        self._cache[key] = (time.monotonic() + self.cache_ttl, result)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def get(self, url, **kwargs):
+        try:
+            response = self.session.get(url, timeout=self.timeout, **kwargs)
+            response.raise_for_status()
+            return response
+        except requests.RequestException as e:
+            raise CrossRefUnavailable(e)
+
+    def fetch(self, query, rows):
+        try:
+            return self.get(self.url, params={'rows': rows, 'query': query}).json()
+        except ValueError as e:
+            raise CrossRefUnavailable(e)
+
+    def get_work(self, doi):
+        """
+        Returns the CrossRef metadata of the DOI, uncached.
+        """
+        try:
+            return self.get('%s/%s' % (self.url, quote(doi))).json()['message']
+        except (ValueError, KeyError) as e:
+            raise CrossRefUnavailable(e)
+
+    def get_bibtex(self, doi):
+        # doi.org redirects to the registration agency of the DOI
+        return self.get(self.doi_url + quote(doi), headers={'Accept': 'application/x-bibtex'}).text
+
+    def query(self, query, rows=5):
+        """
+        Returns the CrossRef works matching the query, the parsed JSON of the API.
+        Raises CrossRefUnavailable if CrossRef fails or does not answer in time.
+        """
+        query = normalize_query(query)
+        key = (query, rows)
+        with self._lock:
+            result = self._get_cached(key)
+            if result is not None:
+                return result
+            future = self._pending.get(key)
+            owner = future is None
+            if owner:
+                future = self._pending[key] = Future()
+        if not owner:
+            return future.result()
+        try:
+            result = self.fetch(query, rows)
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            with self._lock:
+                self._set_cached(key, result)
+            return result
+        finally:
+            with self._lock:
+                del self._pending[key]
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    Returns the client shared by the threads of the process, configured with the
+    CROSSREF_* settings.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = CrossRefClient(
+                url=getattr(settings, 'CROSSREF_URL', CROSSREF_URL),
+                timeout=getattr(settings, 'CROSSREF_TIMEOUT', (3.05, 5)),
+                cache_size=getattr(settings, 'CROSSREF_CACHE_SIZE', 512),
+                cache_ttl=getattr(settings, 'CROSSREF_CACHE_TTL', 60 * 60),
+                pool_size=getattr(settings, 'CROSSREF_POOL_SIZE', 10),
+                doi_url=getattr(settings, 'DOI_URL', DOI_URL),
+            )
+        return _client
+
+
+def query_works(query, rows=5):
+    return get_client().query(query, rows)
+
+
+def fetch_doi_metadata(doi):
+    """
+    Returns the CrossRef metadata and the BibTeX of the DOI, None for the failed
+    lookup, and its error. DOIs of DataCite or other registration agencies have
+    no CrossRef work, but their BibTeX is resolved by doi.org. Raises
+    CrossRefUnavailable if both lookups fail.
+    """
+    client = get_client()
+    results, errors = [], []
+    for lookup in (client.get_work, client.get_bibtex):
+        try:
+            results.append(lookup(doi))
+        except CrossRefError as e:
+            results.append(None)
+            errors.append(str(e))
+    if len(errors) == len(results):
+        raise CrossRefUnavailable('; '.join(errors))
+    return results[0], results[1], '; '.join(errors)
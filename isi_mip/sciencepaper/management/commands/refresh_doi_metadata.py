@@ -0,0 +1,35 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from isi_mip.sciencepaper.crossref import CrossRefError, fetch_doi_metadata
+from isi_mip.sciencepaper.models import DOIMetadata, Paper
+
+
+class Command(BaseCommand):
+    help = 'Fetches the metadata of the new and stale DOIs of the papers from CrossRef and doi.org'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Refresh all DOIs')
+        parser.add_argument('--limit', type=int, help='Maximum number of DOIs to refresh')
+        parser.add_argument('--workers', type=int, default=4, help='Number of concurrent lookups')
+
+    def handle(self, *args, **options):
+        dois = {DOIMetadata.normalize(doi) for doi in Paper.objects.exclude(doi__isnull=True).values_list('doi', flat=True)}
+        DOIMetadata.objects.bulk_create([DOIMetadata(doi=doi) for doi in dois if doi], ignore_conflicts=True)
+        metadata = DOIMetadata.objects.all() if options['all'] else DOIMetadata.get_stale()
+        metadata = metadata.order_by(F('fetched').asc(nulls_first=True), 'id')[:options['limit']]
+        # only the lookups run in the workers, the database is written here
+        with ThreadPoolExecutor(max_workers=max(1, options['workers'])) as executor:
+            futures = {executor.submit(fetch_doi_metadata, instance.doi): instance for instance in metadata}
+            for future in as_completed(futures):
+                instance = futures[future]
+                try:
+                    instance.update(*future.result())
+                except CrossRefError as e:
+                    instance.fail(e)
+                if instance.error:
+                    self.stderr.write('%s: %s' % (instance.doi, instance.error))
+                instance.save()
+        self.stdout.write('%d DOIs refreshed' % len(futures))
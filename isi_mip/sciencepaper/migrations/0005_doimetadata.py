@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sciencepaper', '0004_auto_20160602_1309'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DOIMetadata',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('doi', models.CharField(help_text='Normalized, without the resolver and in lower case.', max_length=500, unique=True)),
+                ('crossref', models.JSONField(blank=True, help_text='The work of the CrossRef API.', null=True)),
+                ('bibtex', models.TextField(blank=True)),
+                ('fetched', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('error', models.TextField(blank=True, help_text='The error of the last refresh.')),
+            ],
+            options={
+                'verbose_name': 'DOI metadata',
+                'verbose_name_plural': 'DOI metadata',
+            },
+        ),
+    ]
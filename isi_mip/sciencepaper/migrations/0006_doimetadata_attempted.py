@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sciencepaper', '0005_doimetadata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='doimetadata',
+            name='attempted',
+            field=models.DateTimeField(blank=True, help_text='The last refresh, successful or not.', null=True),
+        ),
+    ]
@@ -1,10 +1,13 @@
-from datetime import date
+import re
+from datetime import date, timedelta
 
-import requests
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
 from django.utils.text import slugify
 
-CROSSREF_URL = 'http://api.crossref.org/works?rows={rows}&query={query}'
+from isi_mip.sciencepaper.crossref import (CrossRefError, fetch_doi_metadata,
+                                           query_works)
 
 
 class Author(models.Model):
@@ -37,19 +40,17 @@ class Paper(models.Model):
         return "%s (%s)" % (self.title, self.doi) if self.doi else self.title
 
     def to_bibtex(self):
-        url = "http://dx.doi.org/" + self.doi
-        headers = {"accept": "application/x-bibtex"}
-        r = requests.get(url, headers=headers)
-        return r.text
+        metadata = DOIMetadata.get_metadata(self.doi)
+        return metadata.bibtex if metadata else ''
 
     @staticmethod
     def create_from_query(query):
         if not query.strip():
             raise Exception("No search term")
-        response = requests.get(CROSSREF_URL.format(rows=5, query=query))
-        res = response.json()
+        res = query_works(query)
         if res['message']['items'][0]['score'] > 1:
             paper_dict = res['message']['items'][0]
+            DOIMetadata.store_work(paper_dict)
             paper, created = Paper.objects.get_or_create(doi=paper_dict['DOI'])
             paper.title = paper_dict['title'][0]
             paper.journal_name = paper_dict['container-title'][0]
@@ -68,4 +69,107 @@ class Paper(models.Model):
             paper.save()
             return
 
-        raise Exception('No matches')
\ No newline at end of file
+        raise Exception('No matches')
+
+
+class DOIMetadata(models.Model):
+    """
+    The metadata of a DOI from CrossRef and doi.org, which is looked up here
+    first and refreshed by the refresh_doi_metadata command.
+    """
+    doi = models.CharField(max_length=500, unique=True, help_text="Normalized, without the resolver and in lower case.")
+    crossref = models.JSONField(null=True, blank=True, help_text="The work of the CrossRef API.")
+    bibtex = models.TextField(blank=True)
+    fetched = models.DateTimeField(null=True, blank=True, db_index=True)
+    attempted = models.DateTimeField(null=True, blank=True, help_text="The last refresh, successful or not.")
+    error = models.TextField(blank=True, help_text="The error of the last refresh.")
+
+    class Meta:
+        verbose_name = verbose_name_plural = 'DOI metadata'
+
+    def __str__(self):
+        return self.doi
+
+    @staticmethod
+    def normalize(doi):
+        doi = re.sub(r'^(https?://(dx\.)?doi\.org/|doi:)', '', (doi or '').strip(), flags=re.IGNORECASE)
+        return doi.lower()
+
+    @staticmethod
+    def get_max_age():
+        return timedelta(days=getattr(settings, 'DOI_METADATA_MAX_AGE', 30))
+
+    @staticmethod
+    def get_retry_delay():
+        # failed lookups are not repeated on every request, the command retries them anyway
+        return timedelta(hours=getattr(settings, 'DOI_METADATA_RETRY_DELAY', 24))
+
+    @classmethod
+    def get_stale(cls):
+        return cls.objects.filter(models.Q(fetched__isnull=True) | models.Q(fetched__lt=timezone.now() - cls.get_max_age()))
+
+    @classmethod
+    def get_metadata(cls, doi, fetch=True):
+        """
+        Returns the stored metadata of the DOI. Unknown DOIs are fetched, unless
+        fetch is False or the last attempt failed within DOI_METADATA_RETRY_DELAY
+        hours, and None is returned for them if that fails.
+        """
+        doi = cls.normalize(doi)
+        if not doi:
+            return None
+        metadata = cls.objects.filter(doi=doi).first()
+        if (metadata is None or metadata.fetched is None) and fetch:
+            metadata = metadata or cls(doi=doi)
+            if metadata.attempted is None or metadata.attempted < timezone.now() - cls.get_retry_delay():
+                metadata.refresh()
+        return metadata if metadata and (metadata.fetched or metadata.crossref) else None
+
+    @classmethod
+    def store_work(cls, work):
+        # the works of the search results include the complete metadata
+        doi = cls.normalize(work.get('DOI'))
+        if doi:
+            cls.objects.update_or_create(doi=doi, defaults={'crossref': work})
+
+    def update(self, crossref, bibtex, error=''):
+        # a failed lookup keeps the previous result, the DOI counts as fetched with the BibTeX
+        if crossref is not None:
+            self.crossref = crossref
+        if bibtex is not None:
+            self.bibtex = bibtex
+        self.attempted = timezone.now()
+        if bibtex:
+            self.fetched = self.attempted
+        self.error = error
+
+    def fail(self, error):
+        self.attempted = timezone.now()
+        self.error = str(error)
+
+    def refresh(self):
+        try:
+            self.update(*fetch_doi_metadata(self.doi))
+        except CrossRefError as e:
+            self.fail(e)
+        self.save()
+
+    def get_paper_fields(self):
+        """
+        Returns the fields of a Paper from the CrossRef metadata.
+        """
+        work = self.crossref or {}
+        fields = {
+            'title': (work.get('title') or [''])[0],
+            'journal_name': (work.get('container-title') or [''])[0],
+            'journal_pages': work.get('page', ''),
+            'lead_author': (work.get('author') or [{}])[0].get('family', ''),
+        }
+        if str(work.get('volume', '')).isdigit():
+            fields['journal_volume'] = int(work['volume'])
+        for key in ('published-online', 'published-print', 'issued'):
+            date_parts = work.get(key, {}).get('date-parts', [[None]])[0]
+            if date_parts and date_parts[0]:
+                fields['first_published'] = date(*(list(date_parts) + [1, 1])[:3])
+                break
+        return fields
@@ -0,0 +1,165 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from unittest import mock
+from urllib.parse import parse_qs, unquote, urlparse
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from isi_mip.sciencepaper.crossref import CrossRefClient, CrossRefUnavailable
+from isi_mip.sciencepaper.models import DOIMetadata, Paper
+
+
+class StubCrossRefHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(self.path)
+        time.sleep(server.delay)
+        if server.status != 200:
+            self.send_error(server.status)
+            return
+        url = urlparse(self.path)
+        if server.missing_works and url.path.startswith('/works/'):
+            # DataCite DOIs are not registered at CrossRef
+            self.send_error(404)
+            return
+        if url.path.startswith('/doi/'):
+            content_type = 'application/x-bibtex'
+            content = ('@article{%s}' % unquote(url.path[5:])).encode()
+        elif url.path.startswith('/works/'):
+            content_type = 'application/json'
+            content = json.dumps({'message': {'DOI': unquote(url.path[7:]), 'title': ['Stub'], 'volume': '7'}}).encode()
+        else:
+            content_type = 'application/json'
+            query = parse_qs(url.query)['query'][0]
+            content = json.dumps({'message': {'items': [{'title': [query], 'score': 10}]}}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubCrossRefMixin:
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubCrossRefHandler)
+        self.server.lock = threading.Lock()
+        self.server.requests = []
+        self.server.delay = 0
+        self.server.status = 200
+        self.server.missing_works = False
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.url = 'http://127.0.0.1:%s/works' % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class CrossRefClientTestCase(StubCrossRefMixin, SimpleTestCase):
+    def test_results_are_cached_by_normalized_query(self):
+        client = CrossRefClient(url=self.url)
+        result = client.query('Global  Crop Yields')
+        self.assertEqual(result['message']['items'][0]['title'], ['global crop yields'])
+        self.assertEqual(client.query(' global crop yields '), result)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_expired_and_evicted_results_are_fetched_again(self):
+        client = CrossRefClient(url=self.url, cache_size=1, cache_ttl=0)
+        client.query('a')
+        client.query('a')
+        self.assertEqual(len(self.server.requests), 2)
+        client = CrossRefClient(url=self.url, cache_size=1)
+        client.query('a')
+        client.query('b')
+        client.query('a')
+        self.assertEqual(len(self.server.requests), 5)
+
+    def test_concurrent_lookups_are_coalesced(self):
+        self.server.delay = 0.3
+        client = CrossRefClient(url=self.url)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(client.query('river discharge'))) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(results), 5)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_slow_responses_time_out(self):
+        self.server.delay = 1
+        client = CrossRefClient(url=self.url, timeout=(1, 0.1))
+        with self.assertRaises(CrossRefUnavailable):
+            client.query('slow')
+        self.server.delay = 0
+        # failures are not cached
+        self.assertEqual(client.query('slow')['message']['items'][0]['title'], ['slow'])
+
+
+class DOIMetadataTestCase(StubCrossRefMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        client = CrossRefClient(url=self.url, doi_url=self.url.replace('/works', '/doi/'))
+        patcher = mock.patch('isi_mip.sciencepaper.crossref.get_client', return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_metadata_is_fetched_once(self):
+        paper = Paper.objects.create(title='Paper', doi='https://doi.org/10.1000/ABC')
+        self.assertEqual(paper.to_bibtex(), '@article{10.1000/abc}')
+        self.assertEqual(paper.to_bibtex(), '@article{10.1000/abc}')
+        self.assertEqual(len(self.server.requests), 2)
+        metadata = DOIMetadata.get_metadata('doi:10.1000/abc', fetch=False)
+        self.assertEqual(metadata.get_paper_fields()['journal_volume'], 7)
+
+    def test_refresh_command_fetches_new_dois(self):
+        Paper.objects.create(title='A', doi='10.1000/a')
+        Paper.objects.create(title='B', doi='10.1000/b')
+        Paper.objects.create(title='C')
+        call_command('refresh_doi_metadata', workers=2, stdout=StringIO())
+        self.assertEqual(set(DOIMetadata.objects.exclude(fetched=None).values_list('doi', flat=True)), {'10.1000/a', '10.1000/b'})
+        call_command('refresh_doi_metadata', stdout=StringIO())
+        self.assertEqual(len(self.server.requests), 4)
+
+    def test_failed_lookups_are_retried_after_a_delay(self):
+        self.server.status = 503
+        paper = Paper.objects.create(title='Paper', doi='10.1000/down')
+        self.assertEqual(paper.to_bibtex(), '')
+        self.assertEqual(paper.to_bibtex(), '')
+        self.assertEqual(len(self.server.requests), 2)
+        self.server.status = 200
+        DOIMetadata.objects.update(attempted=timezone.now() - DOIMetadata.get_retry_delay())
+        self.assertEqual(paper.to_bibtex(), '@article{10.1000/down}')
+        self.assertEqual(len(self.server.requests), 4)
+
+    def test_refresh_command_retries_failed_lookups(self):
+        self.server.status = 503
+        paper = Paper.objects.create(title='Paper', doi='10.1000/down')
+        self.assertEqual(paper.to_bibtex(), '')
+        self.server.status = 200
+        call_command('refresh_doi_metadata', stdout=StringIO())
+        self.assertEqual(paper.to_bibtex(), '@article{10.1000/down}')
+        self.assertEqual(DOIMetadata.objects.get().error, '')
+
+    def test_dois_without_crossref_work_are_fetched_from_doi_org(self):
+        self.server.missing_works = True
+        paper = Paper.objects.create(title='Dataset', doi='10.5281/zenodo.123')
+        self.assertEqual(paper.to_bibtex(), '@article{10.5281/zenodo.123}')
+        metadata = DOIMetadata.objects.get()
+        self.assertIsNotNone(metadata.fetched)
+        self.assertIsNone(metadata.crossref)
+        self.assertIn('404', metadata.error)
+        stderr = StringIO()
+        call_command('refresh_doi_metadata', all=True, stdout=StringIO(), stderr=stderr)
+        self.assertIn('10.5281/zenodo.123', stderr.getvalue())
+        self.assertEqual(paper.to_bibtex(), '@article{10.5281/zenodo.123}')
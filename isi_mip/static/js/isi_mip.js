@@ -33,8 +33,63 @@ $(function() {
 $(function() {
 	// Die Tabllen im widget-table haben spezielle Funktionen wie Paginierung, 
 
+	function updateRemoteTable(table, append) {
+		// Tables with a data-url get their rows from the api,
+		// filters, search and pagination are applied on the server.
+		// Tables with data-keyset load the following rows with the "show more" button,
+		// append is true when the rows are added to the ones already shown.
+		var filter = table.data('filter');
+		var filternames = table.data('filternames');
+		var searchvalue = table.data('searchvalue');
+		var keyset = table.data('keyset');
+
+		var params = {
+			'per_page': table.data('rowsperpage'),
+			'html': 1
+		};
+		if (!keyset) {
+			params['page'] = table.data('activepage');
+		} else if (append) {
+			params['cursor'] = table.data('next');
+		}
+		$.each(filter, function(colnumber, value) {
+			params[filternames[colnumber]] = value;
+		});
+		if (searchvalue) {
+			params['searchvalue'] = searchvalue;
+		}
+
+		// only the response of the latest request is shown
+		var request = (table.data('request') || 0) + 1;
+		table.data('request', request);
+
+		$.getJSON(table.data('url'), params, function(data) {
+			if (table.data('request') != request) return;
+			if (keyset) {
+				if (append) {
+					table.find('tbody').append(data.html);
+				} else {
+					table.find('tbody').html(data.html);
+				}
+				table.data('next', data.next || '');
+				table.find('.widget-table-showmore-button').toggle(!!data.next);
+				table.find('.widget-table-noentriesmessage td').toggle(!table.find('tbody tr').length);
+				$(window).trigger('colsreordered');
+			} else {
+				table.find('tbody').html(data.html);
+				table.data('activepage', data.page);
+				updatePagination(table, data.count, data.numberofpages);
+			}
+		});
+	}
+
 	function updateTable(table) {
 
+		if (table.data('url')) {
+			updateRemoteTable(table);
+			return;
+		}
+
 		var activepage = table.data('activepage');
 		var filter = table.data('filter');
 		var rowsperpage = table.data('rowsperpage');
@@ -82,6 +137,23 @@ $(function() {
 
 		// Pagination
 		var rowsintable = table.find('tbody tr:visible').length; // rows in the table, all pages
+		var numberofpages = Math.ceil(rowsintable / rowsperpage);
+
+		// hide rows in other pages
+		table.find('tbody tr:visible').each(function(rownumber) {
+			if ((rowsperpage * (activepage-1) > rownumber) || (rowsperpage * activepage <= rownumber)) {
+				$(this).hide();
+			}
+		});
+
+		updatePagination(table, rowsintable, numberofpages);
+	}
+
+	function updatePagination(table, rowsintable, numberofpages) {
+
+		var activepage = table.data('activepage');
+		var filter = table.data('filter');
+		var searchvalue = table.data('searchvalue');
 
 		// show or hide message that no rows to show
 		if (rowsintable) {
@@ -90,17 +162,9 @@ $(function() {
 			table.find('.widget-table-noentriesmessage td').show();
 		}
 
-		var numberofpages = Math.ceil(rowsintable / rowsperpage);
 		// save back
 		table.data('numberofpages', numberofpages);
 
-		// hide rows in other pages
-		table.find('tbody tr:visible').each(function(rownumber) {
-			if ((rowsperpage * (activepage-1) > rownumber) || (rowsperpage * activepage <= rownumber)) {
-				$(this).hide();
-			}
-		});
-
 		// show the pagination links needed
 		table.find('.widget-pagination-pagelink').each(function() {
 			if (($(this).data('pagenumber') > numberofpages) || (numberofpages < 2)) {
@@ -188,6 +252,12 @@ $(function() {
 			$(this).remove();
 		});
 
+		if (table.data('keyset')) {
+			table.find('.widget-table-showmore-button').click(function() {
+				updateRemoteTable(table, true);
+			});
+		}
+
 
 		// Click on page navigation
 		table.find('.widget-pagination-pagelink').click(function(event) {
@@ -220,6 +290,7 @@ $(function() {
 		var table = $('#' + $(this).data('tableid'));
 		var filter = table.data('filter');
 		var filternames = {}; // name attributes of filters
+		table.data('filternames', filternames);
 
 		$(this).find('select').each(function() {
 			var selector = $(this);
@@ -252,8 +323,6 @@ $(function() {
 			}
 		});
 
-		table.data('filternames', filternames);
-
 		$(this).find('.widget-table-selector-search').on('input', function() {
 			// Show first page after filter change
 			table.data('activepage', 1);